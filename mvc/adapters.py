@@ -16,14 +16,18 @@
 # You should have received a copy of the GNU General Public License
 # along with Qonda; If not, see <http://www.gnu.org/licenses/>.
 
+import array
+import bisect
+from collections import OrderedDict
 import cPickle
 from functools import partial
+import itertools
+from operator import attrgetter
+import os
+import time
+import weakref
 
 from .. import PYQT_VERSION
-try:
-    from UserDict import UserDict    # Python 2
-except ImportError:
-    from collections import UserDict  # Python 3, 2to3 doesn't fix it
 from warnings import warn
 
 if PYQT_VERSION == 5:
@@ -34,11 +38,45 @@ else:
     from PyQt4.QtCore import Qt  # lint:ok
     QtWidgets = QtGui
 
-from .observable import ObservableObject, ObservableListProxy
+# NumPy dtype kinds of booleans and numbers
+NUMERIC_KINDS = 'biufc'
+
+from .observable import (ObservableObject, ObservableListProxy,
+    ObservableRingList)
+from ..util.projection import (TableProjection, split_properties,
+    property_object, property_value, column_title, format_value,
+    column_object_meta, row_object_meta, constant_meta, iter_objects,
+    write_rows, NoneOrdering, sorted_order,
+    # Kept importable from here
+    MetaPropertyWrapper, MetaFormatterPropertyWrapper,
+    PropertyMetadataWrapper, clear_metadata_cache,
+    _combine_column_metas, _combine_row_metas, _numpy)
+from ..util.aggregator import ACCUMULATORS
 
 PythonObjectRole = 32
 QondaResizeRole = 64
 
+# Qt roles and their TableProjection names
+PROJECTION_ROLES = {
+    Qt.DisplayRole: 'display',
+    Qt.EditRole: 'edit',
+    Qt.DecorationRole: 'decoration',
+    Qt.ToolTipRole: 'tooltip',
+    Qt.StatusTipRole: 'statustip',
+    Qt.WhatsThisRole: 'whatsthis',
+    Qt.FontRole: 'font',
+    Qt.TextAlignmentRole: 'alignment',
+    Qt.BackgroundRole: 'background',
+    Qt.ForegroundRole: 'foreground',
+    PythonObjectRole: 'value',
+}
+
+
+def _projection_roles(roles):
+    """Returns the TableProjection names of the roles that have one"""
+    return [PROJECTION_ROLES[role] for role in roles
+        if role in PROJECTION_ROLES]
+
 
 class QondaMetadataError(Exception):
     pass
@@ -63,57 +101,27 @@ class AdapterReader(object):
 
     def __init__(self):
 
+        # Resolution itself is in util.projection, shared with
+        # TableProjection
         def formatter(key, self, index):
             "Partial function for functional, value derived metadata"
-            #try:
-            v = self._get_value(index)
-            #except:
-            #    return None
-            try:
-                f = self._column_meta[index.column()][key]
-            except (IndexError, KeyError):
-                # No column meta, no metadata key,
-                return unicode(v) if v is not None else u''
-            return f(v)
+            return format_value(self._column_meta, index.column(), key,
+                self._get_value(index))
 
         def callable_constant_meta(key, self, index):
             """Partial function for functional, object entity derived, or
             constant metadata"""
-            #try:
-            o = self._get_value_object(index)
-            #except Exception as e:
-            #    print "Error!!!", str(e)
-            #    return None
             try:
-                m = self._column_meta[index.column()][key]
-                if callable(m):
-                    return m(o) if o else None
-                else:
-                    return m
+                return column_object_meta(self._column_meta, index.column(),
+                    key, self._get_value_object(index))
             except KeyError:  # No key in the column meta
-                o = self.getPyObject(index)
-                try:
-                    m = self._row_meta[key]
-                    if callable(m):
-                        return m(o) if o else None
-                    else:
-                        return m
-                except KeyError:  # No key in row meta
-                    return None
-            except IndexError:  # No column meta
-                return None
+                return row_object_meta(self._row_meta, key,
+                    self.getPyObject(index))
 
-        def constant_meta(key, self, index):
+        def adapter_constant_meta(key, self, index):
             "Partial function for constant metadata"
-            try:
-                return self._column_meta[index.column()][key]
-            except KeyError:  # No key in the column meta
-                try:
-                    return self._row_meta[key]
-                except KeyError:  # No key in the row meta
-                    return None
-            except IndexError:  # No column meta
-                return None
+            return constant_meta(self._column_meta, self._row_meta,
+                index.column(), key)
 
         self._get_display_role = partial(formatter, 'displayFormatter',
             self)
@@ -124,10 +132,11 @@ class AdapterReader(object):
             self)
         self._get_status_tip_role = partial(callable_constant_meta,
             'statustip', self)
-        self._get_whats_this_role = partial(constant_meta, 'whatsthis', self)
+        self._get_whats_this_role = partial(adapter_constant_meta,
+            'whatsthis', self)
         self._get_font_role = partial(callable_constant_meta, 'font', self)
-        self._get_text_alignment_role = partial(constant_meta, 'alignment',
-            self)
+        self._get_text_alignment_role = partial(adapter_constant_meta,
+            'alignment', self)
         self._get_background_role = partial(callable_constant_meta,
             'background', self)
         self._get_foreground_role = partial(callable_constant_meta,
@@ -171,11 +180,7 @@ class AdapterReader(object):
     def headerData(self, section, orientation, role):
 
         def get_title(section):
-            try:
-                return self._column_meta[section]['title']
-            except (IndexError, KeyError):  # No column meta or no meta key
-                return (self._properties[section].split('.').pop().
-                    title().replace('_', ' '))
+            return column_title(self._column_meta, self._properties, section)
 
         def get_size_hint_role(section):
             # Note there is other get_size_hint_role in headerData
@@ -228,7 +233,8 @@ class AdapterReader(object):
 
     # For DnD
     def mimeTypes(self):
-        return ['application/qonda.pyobject', 'text/plain']
+        return [QondaMimeData.REF_FORMAT, 'application/qonda.pyobject',
+            'text/plain']
 
     # For DnD
     def mimeData(self, indexes):
@@ -243,29 +249,23 @@ class AdapterReader(object):
                     return None
             return None
 
-        mime = QtCore.QMimeData()
         if len(indexes) == 0:
             return 0
         elif len(indexes) == 1:
-            mime.setText(self.data(indexes[0], Qt.DisplayRole))
             data = mime_data(indexes[0])
             if data is None:
                 data = self.getPyObject(indexes[0])
-            mime.setData('application/qonda.pyobject', cPickle.dumps(data))
+            objects = [data]
         else:
-            text_list = []
-            object_list = []
+            objects = []
             for index in indexes:
-                text_list.append(self.data(index, Qt.DisplayRole))
                 data = mime_data(index)
                 if not data:
                     data = self.getPyObject(index)
-                object_list.append(cPickle.dumps(data))
-            mime.setText('\n'.join(text_list))
-            mime.setData('application/qonda.pyobject',
-                cPickle.dumps(object_list))
+                objects.append(data)
 
-        return mime
+        # Text and pickles are built by QondaMimeData only if asked for
+        return QondaMimeData(self, indexes, objects)
 
     def flags(self, index):
         """
@@ -311,6 +311,116 @@ class AdapterReader(object):
                 return (Qt.ItemIsSelectable | Qt.ItemIsEditable
                     | Qt.ItemIsEnabled)
 
+    def export(self, fileobj, format='csv', roles=(Qt.DisplayRole,),
+            workers=0):
+        """
+            Writes all the rows into fileobj, as CSV (format='csv') or
+            JSON Lines (format='jsonl'), with the column titles as header
+            or keys. Rows are formatted and written one at a time, so
+            memory use doesn't grow with the row count.
+            roles: the roles exported for every column.
+            workers: if not 0, number of processes formatting the rows
+                     (None for one per CPU). Only adapters over object
+                     lists support it, see TableProjection.parallel_rows().
+        """
+        titles = [self.headerData(column, Qt.Horizontal, Qt.DisplayRole)
+            for column in range(self.columnCount())]
+        if workers == 0:
+            rows = self._export_rows(roles)
+        else:
+            rows = self._export_parallel_rows(roles, workers)
+        write_rows(fileobj, rows, titles, format,
+            [PROJECTION_ROLES.get(role, unicode(role)) for role in roles])
+
+    def _export_parallel_rows(self, roles, workers):
+        # Qt objects can't be used by other processes
+        return self._export_rows(roles)
+
+    def _export_rows(self, roles):
+        columns = range(self.columnCount())
+        for row in range(self.rowCount()):
+            yield [self.data(self.index(row, column), role)
+                for column in columns for role in roles]
+
+
+# Drags in progress: reference -> QondaMimeData. Lets drop targets in
+# the same process get the dragged objects, see mime_objects()
+_drag_registry = weakref.WeakValueDictionary()
+_drag_counter = itertools.count()
+
+
+class QondaMimeData(QtCore.QMimeData):
+    """
+        Mime data of items dragged from Qonda adapters.
+
+        Holds the dragged objects, and carries only an opaque reference
+        to them in REF_FORMAT, so targets in the same process get them
+        without copying through mime_objects(). The text and the pickled
+        objects ('application/qonda.pyobject') are built when a target
+        asks for them, usually only when dropping in other applications.
+    """
+    REF_FORMAT = 'application/qonda.pyobject-ref'
+
+    def __init__(self, adapter, indexes, objects):
+        QtCore.QMimeData.__init__(self)
+        self._adapter = adapter
+        self._indexes = [QtCore.QPersistentModelIndex(index)
+            for index in indexes]
+        self._objects = objects
+        self._ref = '{0}:{1}'.format(os.getpid(), next(_drag_counter))
+        _drag_registry[self._ref] = self
+
+    def pyObjects(self):
+        return self._objects
+
+    def formats(self):
+        return [self.REF_FORMAT, 'application/qonda.pyobject', 'text/plain']
+
+    def hasFormat(self, mimetype):
+        return mimetype in self.formats()
+
+    def retrieveData(self, mimetype, preferred_type):
+        # Binary payloads go as QByteArray, as strings would be converted
+        # through QString
+        if mimetype == self.REF_FORMAT:
+            return QtCore.QByteArray(self._ref.encode('ascii'))
+        elif mimetype == 'application/qonda.pyobject':
+            if len(self._objects) == 1:
+                payload = cPickle.dumps(self._objects[0],
+                    cPickle.HIGHEST_PROTOCOL)
+            else:
+                payload = cPickle.dumps([cPickle.dumps(o,
+                    cPickle.HIGHEST_PROTOCOL) for o in self._objects],
+                    cPickle.HIGHEST_PROTOCOL)
+            return QtCore.QByteArray(payload)
+        elif mimetype == 'text/plain':
+            texts = [self._adapter.data(QtCore.QModelIndex(index),
+                Qt.DisplayRole) for index in self._indexes
+                if index.isValid()]
+            # Rows removed since the drag started have no text
+            return '\n'.join(text for text in texts if text is not None)
+        return QtCore.QMimeData.retrieveData(self, mimetype, preferred_type)
+
+
+def mime_objects(mime):
+    """
+        Returns the list of objects dragged from a Qonda adapter. If the
+        drag started in this process, they are the objects themselves,
+        else unpickled copies.
+    """
+    if isinstance(mime, QondaMimeData):
+        return mime.pyObjects()
+    if mime.hasFormat(QondaMimeData.REF_FORMAT):
+        ref = bytes(mime.data(QondaMimeData.REF_FORMAT)).decode('ascii')
+        try:
+            return _drag_registry[ref].pyObjects()
+        except KeyError:  # Other process
+            pass
+    data = cPickle.loads(bytes(mime.data('application/qonda.pyobject')))
+    if isinstance(data, list):
+        return [cPickle.loads(o) for o in data]
+    return [data]
+
 
 class AdapterWriter(object):
     """
@@ -322,6 +432,10 @@ class AdapterWriter(object):
             Method _set_value(self, index, value)
     """
 
+    def isPlaceholder(self, index):
+        """Returns whether the index is in an append placeholder row"""
+        return False
+
     def setData(self, index, value, role=Qt.EditRole):
 
         if not index.isValid():
@@ -344,133 +458,273 @@ class AdapterWriter(object):
 
         return False
 
+    def setDataBlock(self, top_left, values, role=Qt.EditRole):
+        """
+            Sets a block of values (a sequence of rows, each one a
+            sequence of values) into the cells starting at top_left, as
+            when pasting. Values beyond the last row or column, or for
+            cells not editable or in the append placeholder row, are
+            ignored. Parsers are looked up once per column, and adapters
+            emitting dataChanged through AdapterNotifier emit it once for
+            the whole block.
+            Returns True if every value was set.
+        """
+        if not top_left.isValid() or role not in (Qt.EditRole,
+                PythonObjectRole):
+            return False
+        top, left = top_left.row(), top_left.column()
+        parent = top_left.parent()
+        parsers = {}
 
-class MetaPropertyWrapper(object):
-    """
-    A metadata property wrapper that pass the proper object to callables
+        def parse(column, value):
+            try:
+                parser = parsers[column]
+            except KeyError:
+                try:
+                    parser = self._column_meta[column]['parser']
+                except (IndexError, KeyError):
+                    parser = None
+                parsers[column] = parser
+            if parser is not None:
+                return parser(value)
+            if value == u'':
+                return None
+            elif isinstance(value, basestring):
+                return value.strip()
+            return value
+
+        batch = isinstance(self, AdapterNotifier)
+        if batch:
+            self._batch_depth += 1
+        ok = True
+        try:
+            for row, row_values in enumerate(values, top):
+                for column, value in enumerate(row_values, left):
+                    index = self.index(row, column, parent)
+                    if not index.isValid() or self.isPlaceholder(index) or \
+                            not self.flags(index) & Qt.ItemIsEditable:
+                        ok = False
+                        continue
+                    if role == Qt.EditRole:
+                        value = parse(column, value)
+                    if self._get_value(index) != value:
+                        ok = self._set_value(index, value) and ok
+        finally:
+            if batch:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self.flushDataChanged()
+        return ok
+
+
+class AdapterNotifier(object):
     """
-    def __init__(self, property_name, meta_property):
-        self._property_name = property_name
-        self._meta_property = meta_property
+        Convenient base for emitting dataChanged signals in Adapter classes
 
-    def __call__(self, *a, **kw):
-        o = a[0]
-        return self._meta_property(getattr(o, self._property_name))
+        If 'coalesce' is in the adapter options, changed cells are collected
+        into a bounding rectangle per parent, and dataChanged is emitted once
+        per event loop iteration, using a zero timer.
 
+        Changes made by AdapterWriter.setDataBlock() are also collected,
+        and emitted when the whole block is set.
 
-class MetaFormatterPropertyWrapper(object):
-    """
-    A metadata property wrapper that pass the proper object to callables
-    """
-    def __init__(self, meta_property):
-        self._meta_property = meta_property
+        If the column metadata has the 'refreshHz' key, changes of a cell are
+        notified at most refreshHz times per second, the latest value being
+        shown when the period expires. If the row metadata has the key,
+        the limit applies to the whole row. Throttled changes are emitted
+        right away before structural changes, as their rows would move.
 
-    def __call__(self, *a, **kw):
-        o = a[0]
-        return self._meta_property(o)
+        Child classes should implement the following:
 
+        Method index()
+        Attribute options
 
-class PropertyMetadataWrapper(UserDict):
-    """
-    A wrapper for attribute metadata that wraps individual metadata properties
-    in MetaPropertyWrapper.
-    Used to pass the right object to the callables present when the metadata
-    is a reference to metadata in the attribute class (marked with '.')
+        They should call flushChanges() before structural changes, and
+        _discard_changes() when the model is replaced.
+
+        They should call AdapterNotifier.__init__ after the Qt base class
+        initialization.
     """
-    def __init__(self, property_name, meta):
-        super(PropertyMetadataWrapper, self).__init__()
-        self.data.update(meta)
-        self._property_name = property_name
-
-    def __getitem__(self, key):
-        meta_property = self.data[key]
-        if callable(meta_property):
-            if key in ('displayFormatter', 'editFormatter'):
-                return MetaFormatterPropertyWrapper(meta_property)
+    # Minimum size of the refresh time record triggering the purge of
+    # expired entries
+    MAX_REFRESH_RECORD = 10000
+
+    def __init__(self):
+        # key (None or id(parent item)) ->
+        # (parent or None, top, left, bottom, right)
+        self._pending_changes = {}
+        self._change_timer = None
+        # Nesting level of setDataBlock() calls
+        self._batch_depth = 0
+        # key (None or id(parent item), row, column or None for rows) ->
+        # time until which the cell isn't refreshed again
+        self._refresh_due = {}
+        self._refresh_limit = self.MAX_REFRESH_RECORD
+        # key -> (parent or None, row, column, due time, period)
+        self._throttled = {}
+        self._throttle_timer = None
+        self._throttle_due = None
+
+    def _refresh_rate(self, column):
+        """Returns refreshHz and True if it applies to the whole row"""
+        try:
+            hz = self._column_meta[column].get('refreshHz')
+        except IndexError:
+            hz = None
+        if hz:
+            return hz, False
+        return self._row_meta.get('refreshHz'), True
+
+    def _cell_changed(self, row, column, parent=None):
+        hz, whole_row = self._refresh_rate(column)
+        if hz:
+            if whole_row:
+                column = None
+            if parent is None or not parent.isValid():
+                parent_key = None
             else:
-                return MetaPropertyWrapper(self._property_name, meta_property)
+                parent_key = id(parent.internalPointer())
+            key = (parent_key, row, column)
+            now = time.time()
+            due = self._refresh_due.get(key, 0)
+            if now < due:
+                if key not in self._throttled:
+                    persistent = (None if parent_key is None
+                        else QtCore.QPersistentModelIndex(parent))
+                    self._throttled[key] = (persistent, row, column, due,
+                        1.0 / hz)
+                    self._schedule_throttled(due, now)
+                return
+            if len(self._refresh_due) >= self._refresh_limit:
+                # Expired entries don't limit anything
+                self._refresh_due = dict((k, d)
+                    for k, d in self._refresh_due.iteritems() if d > now)
+                self._refresh_limit = max(self.MAX_REFRESH_RECORD,
+                    2 * len(self._refresh_due))
+            self._refresh_due[key] = now + 1.0 / hz
+        self._emit_cell_changed(row, column, parent)
+
+    def _emit_cell_changed(self, row, column, parent=None):
+        # column None means the whole row
+        if parent is None:
+            parent = QtCore.QModelIndex()
+        if column is None:
+            left, right = 0, self.columnCount(parent) - 1
         else:
-            return meta_property
-
-    def copy(self):
-        return PropertyMetadataWrapper(self._property_name, self.data)
-
-
-def _build_class_meta(class_, properties):
+            left = right = column
+        if 'coalesce' in self.options or self._batch_depth:
+            self._coalesce_change(row, left, parent)
+            self._coalesce_change(row, right, parent)
+        else:
+            self.dataChanged.emit(self.index(row, left, parent),
+                self.index(row, right, parent))
+
+    def _schedule_throttled(self, due, now):
+        if self._throttle_timer is None:
+            self._throttle_timer = QtCore.QTimer(self)
+            self._throttle_timer.setSingleShot(True)
+            self._throttle_timer.timeout.connect(self._refresh_throttled)
+        if self._throttle_timer.isActive() and self._throttle_due <= due:
+            return
+        self._throttle_due = due
+        self._throttle_timer.start(max(0, int((due - now) * 1000)))
+
+    def _refresh_throttled(self):
+        now = time.time()
+        next_due = None
+        for key, (persistent, row, column, due, period) in \
+                list(self._throttled.items()):
+            if due > now:
+                next_due = due if next_due is None else min(next_due, due)
+                continue
+            del self._throttled[key]
+            self._refresh_due[key] = now + period
+            self._emit_throttled(persistent, row, column)
+        if next_due is not None:
+            self._schedule_throttled(next_due, now)
+
+    def _emit_throttled(self, persistent, row, column):
+        if persistent is None:
+            parent = QtCore.QModelIndex()
+        elif persistent.isValid():
+            parent = QtCore.QModelIndex(persistent)
+        else:  # Parent removed meanwhile
+            return
+        self._emit_cell_changed(row, column, parent)
 
-    def resolve_meta(class_, p):
+    def _coalesce_change(self, row, column, parent=None):
+        if parent is None or not parent.isValid():
+            key = None
+        else:
+            key = id(parent.internalPointer())
         try:
-            v = class_._qonda_column_meta_[p]
-            # Property can be a reference and meta a link to expected class
-            if isinstance(v, type):
-                v = PropertyMetadataWrapper(p, v._qonda_column_meta_['.'])
+            persistent, top, left, bottom, right = self._pending_changes[key]
+            self._pending_changes[key] = (persistent, min(top, row),
+                min(left, column), max(bottom, row), max(right, column))
         except KeyError:
-            head, tail = p.split('.', 1)
-            try:
-                v = class_._qonda_column_meta_[head]
-                if isinstance(v, type):
-                    v = resolve_meta(v, tail)
-                elif 'type' in v:
-                    v = resolve_meta(v['type'], tail)
-                else:
-                    print ("Warning: Composite attribute found metadata "
-                        "doesn't point to a class. "
-                        "The attribute won't use class metadata")
-                    v = {}
-            except KeyError:
-                v = {}
-        return v
-
-    meta = []
-    for p in properties:
-        try:
-            v = resolve_meta(class_, p)
-        except (ValueError, AttributeError):
-            v = {}
-        meta.append(v)
-    return meta
-
-
-def _combine_column_metas(class_, adapter_meta, properties):
-
-    if class_ is None:
-        print ("Warning: Adapter has no model class defined. Will use only "
-            "provided metadata")
-        return () if adapter_meta is None else adapter_meta
+            persistent = (None if key is None
+                else QtCore.QPersistentModelIndex(parent))
+            self._pending_changes[key] = (persistent, row, column, row, column)
 
-    class_meta = _build_class_meta(class_, properties)
-    if adapter_meta is None:
-        return class_meta
-    if len(adapter_meta) != len(properties):
-        print ("Warning: Adapter provided metadata count and property count"
-            "doesn't match.")
-        if len(adapter_meta) < len(properties):
-            adapter_meta = adapter_meta + [{}] * (len(properties)
-                - len(adapter_meta))
-    meta = []
-    for am, cm in zip(adapter_meta, class_meta):
-        m = cm.copy()
-        m.update(am)
-        meta.append(m)
-    return meta
-
-
-def _combine_row_metas(class_, adapter_meta):
-
-    if class_ is None:
-        return {} if adapter_meta is None else adapter_meta
-
-    try:
-        class_meta = class_._qonda_column_meta_['*']
-    except (AttributeError, KeyError):
-        class_meta = {}
-
-    if adapter_meta is None:
-        return class_meta
-
-    meta = class_meta.copy()
-    meta.update(adapter_meta)
-    return meta
+        if self._batch_depth:
+            # Flushed at the end of the batch
+            return
+        if self._change_timer is None:
+            self._change_timer = QtCore.QTimer(self)
+            self._change_timer.setSingleShot(True)
+            self._change_timer.setInterval(0)
+            self._change_timer.timeout.connect(self.flushDataChanged)
+        if not self._change_timer.isActive():
+            self._change_timer.start()
+
+    def flushChanges(self):
+        """
+            Emits the pending coalesced and throttled dataChanged signals.
+            Called before structural changes, as pending row numbers would
+            be wrong after them.
+        """
+        if self._throttled:
+            throttled = self._throttled
+            self._throttled = {}
+            self._throttle_timer.stop()
+            for persistent, row, column, due, period in throttled.values():
+                self._emit_throttled(persistent, row, column)
+        self.flushDataChanged()
+
+    def _discard_changes(self):
+        """
+            Drops the pending and throttled changes and the refresh times,
+            as their rows belong to the model being replaced
+        """
+        self._pending_changes = {}
+        if self._change_timer is not None:
+            self._change_timer.stop()
+        self._throttled = {}
+        self._refresh_due = {}
+        self._refresh_limit = self.MAX_REFRESH_RECORD
+        if self._throttle_timer is not None:
+            self._throttle_timer.stop()
+
+    def flushDataChanged(self):
+        """
+            Emits the pending coalesced dataChanged signals.
+            Called from the event loop, and by flushChanges().
+        """
+        if not self._pending_changes:
+            return
+        pending = self._pending_changes
+        self._pending_changes = {}
+        if self._change_timer is not None:
+            self._change_timer.stop()
+        for persistent, top, left, bottom, right in pending.values():
+            if persistent is None:
+                parent = QtCore.QModelIndex()
+            elif persistent.isValid():
+                parent = QtCore.QModelIndex(persistent)
+            else:  # Parent removed meanwhile
+                continue
+            self.dataChanged.emit(self.index(top, left, parent),
+                self.index(bottom, right, parent))
 
 
 class BaseAdapter(QtCore.QAbstractTableModel):
@@ -483,17 +737,8 @@ class BaseAdapter(QtCore.QAbstractTableModel):
         QtCore.QAbstractTableModel.__init__(self, parent)
         self._model = model
         self._class = class_
-        if column_meta is not None:
-            # Up to 0.4.x behavior: Meta declarations separate
-            # from property list
-            self._properties = tuple(properties)
-        else:
-            # 0.5 behavior:
-            self._properties = [x if isinstance(x, str) else x[0]
-                for x in properties]
-            column_meta = [{} if isinstance(x, str) else x[1]
-                for x in properties]
-
+        self._properties, column_meta = split_properties(properties,
+            column_meta)
         self._column_meta = _combine_column_metas(class_, column_meta,
             self._properties)
         self._row_meta = _combine_row_metas(class_, row_meta)
@@ -658,12 +903,167 @@ class ObjectAdapter(AdapterReader, AdapterWriter, BaseAdapter):
                         self.dataChanged.emit(index, index)
 
 
-class BaseListAdapter(AdapterReader, AdapterWriter):
+class BaseListAdapter(AdapterReader, AdapterWriter, AdapterNotifier):
+    """
+        Common list handling for ObjectListAdapter and ValueListAdapter.
+
+        If 'fetch' is in the adapter options, rows are exposed to the views
+        incrementally, FETCH_SIZE rows at a time, as views request them by
+        means of canFetchMore()/fetchMore(). Item observation is delayed
+        until the rows are fetched, so lazy models like
+        qonda.sqlalchemy.QueryResult only retrieve the rows actually shown.
+
+        Items of an ObservableRingList are numbered from the start of the
+        stream (see ObservableRingList.dropped), so dropping the oldest items
+        doesn't renumber the remaining ones.
+
+        If 'sortmodel' is in the adapter options, sort() and
+        sortByColumns() sort the model list itself, extracting the sort
+        keys once per row, and the views get a single layoutChanged
+        signal. None values are sorted according to NONE_ORDERING. An
+        order computed elsewhere is applied the same way with applyOrder().
+        Without the option the model list is never reordered, and views
+        sort through a SortFilterProxyModel.
+    """
+    FETCH_SIZE = 100
+    EXPORT_CHUNK_SIZE = 1000
+    NONE_ORDERING = NoneOrdering.FIRST
+
+    def isPlaceholder(self, index):
+        return index.isValid() and index.row() >= len(self._model)
+
+    def _export_rows(self, roles):
+        # Items of the Python model, as fetching and the append placeholder
+        # row only concern the views
+        columns = range(self.columnCount())
+        items = iter_objects(self.getPyModel(), self.EXPORT_CHUNK_SIZE)
+        for row, item in enumerate(items):
+            yield [self.data(self.createIndex(row, column, item), role)
+                for column in columns for role in roles]
+
+    def _row_base(self):
+        """Returns the number of the first row in observer data"""
+        if isinstance(self._model, ObservableRingList):
+            return self._model.dropped
+        return 0
+
+    def _fetch_size(self):
+        # Fetch whole chunks of lazy models (e.g. QueryResult)
+        chunk = getattr(self._model, 'CHUNKSIZE', 1)
+        return ((self.FETCH_SIZE + chunk - 1) // chunk) * chunk
+
+    def _observe_rows(self, start, stop):
+        base = self._row_base()
+        for i in range(start, stop):
+            try:
+                self._model[i].add_callback(self.observe_item, base + i)
+            except AttributeError:
+                # If not observable (ok if the model doesn't change)
+                pass
+
+    def _fetch_rows(self, stop):
+        """Exposes model rows up to stop"""
+        start = self._fetched
+        stop = min(stop, len(self._model))
+        if stop <= start:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), start, stop - 1)
+        self._observe_rows(start, stop)
+        self._fetched = stop
+        self.endInsertRows()
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        if parent != QtCore.QModelIndex() or 'fetch' not in self.options:
+            return False
+        return self._fetched < len(self._model)
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent != QtCore.QModelIndex() or 'fetch' not in self.options:
+            return
+        self._fetch_rows(self._fetched + self._fetch_size())
+
+    def _row_count(self):
+        count = len(self._model)
+        if 'fetch' in self.options:
+            count = min(count, self._fetched)
+        return count
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if 'sortmodel' in self.options:
+            self.sortByColumns([(column, order)])
+
+    def sortByColumns(self, columns, none_ordering=None):
+        """
+            Sorts the model by several columns.
+            columns: sequence of (column, Qt.SortOrder), the most
+                     significant first.
+            none_ordering: NoneOrdering value, NONE_ORDERING by default.
+            Returns False, leaving the model alone, if 'sortmodel' isn't
+            in the adapter options.
+        """
+        if 'sortmodel' not in self.options:
+            return False
+        if self._model is None:
+            return True
+        if none_ordering is None:
+            none_ordering = self.NONE_ORDERING
+        keys = [(self._sort_key(column), order == Qt.DescendingOrder)
+            for column, order in columns]
+        return self.applyOrder(sorted_order(self._model[:], keys,
+            none_ordering))
+
+    def applyOrder(self, order):
+        """
+            Rearranges the model list, so item order[i] becomes item i,
+            notifying the views with a single layoutChanged signal.
+            Returns False, leaving the model alone, if 'sortmodel' isn't
+            in the adapter options.
+        """
+        if 'sortmodel' not in self.options:
+            return False
+        if isinstance(self._model, ObservableListProxy):
+            # Views are updated in observe()
+            self._model.reorder(order)
+        else:
+            self._before_reorder()
+            items = self._model[:]
+            self._model[:] = [items[i] for i in order]
+            self._reorder(order)
+        return True
+
+    def _before_reorder(self):
+        if 'fetch' in self.options:
+            # Every row is moving, so the views must know them all
+            self._fetch_rows(len(self._model))
+        self.flushChanges()
+        self.layoutAboutToBeChanged.emit()
+
+    def _reorder(self, order):
+        base = self._row_base()
+        for i, row in enumerate(self._model):
+            try:
+                row.set_callback_data(self.observe_item, base + i)
+            except AttributeError:  # list item is not Observable
+                pass
+        new_rows = [0] * len(order)
+        for new_row, old_row in enumerate(order):
+            new_rows[old_row] = new_row
+        # Placeholder append row indexes are kept
+        old_indexes = [index for index in self.persistentIndexList()
+            if index.row() < len(order)]
+        self.changePersistentIndexList(old_indexes,
+            [self.index(new_rows[index.row()], index.column())
+            for index in old_indexes])
+        self.layoutChanged.emit()
 
     def observe(self, sender, event_type, list_row, attrs):
         if sender != self._model:
             return
 
+        self.flushChanges()
+        fetching = 'fetch' in self.options
+        base = self._row_base()
+
         def before_setitem(attrs):
             i, inserting = attrs
             start, stop = (i, i + 1) if type(i) == int else (i.start, i.stop)
@@ -671,6 +1071,9 @@ class BaseListAdapter(AdapterReader, AdapterWriter):
                 start = 0
             if stop is None:
                 stop = len(sender)
+            if fetching:
+                # Changes must happen on rows the views already know
+                self._fetch_rows(stop)
             removing = stop - start
             for i in range(start, stop):
                 try:
@@ -692,15 +1095,16 @@ class BaseListAdapter(AdapterReader, AdapterWriter):
             stop = start + inserting
             for i in range(start, stop):
                 try:
-                    sender[i].add_callback(self.observe_item, i)
+                    sender[i].add_callback(self.observe_item, base + i)
                 except AttributeError:  # list item is not Observable
                     pass
             # Update observer_data after the slice
             for i, row in enumerate(sender[stop:]):
                 try:
-                    row.set_callback_data(self.observe_item, stop + i)
+                    row.set_callback_data(self.observe_item, base + stop + i)
                 except AttributeError:  # list item is not Observable
                     pass
+            self._fetched += inserting - removing
             if removing > inserting:
                 self.endRemoveRows()
             else:
@@ -718,6 +1122,9 @@ class BaseListAdapter(AdapterReader, AdapterWriter):
                 start = 0
             if stop is None:
                 stop = len(sender)
+            if fetching:
+                self._fetch_rows(stop)
+            self._removing = stop - start
             for i in range(start, stop):
                 try:
                     sender[i].remove_callback(self.observe_item)
@@ -730,29 +1137,33 @@ class BaseListAdapter(AdapterReader, AdapterWriter):
             # Update observer_data starting in the slice (as elements shifted)
             for i, row in enumerate(sender[start:]):
                 try:
-                    row.set_callback_data(self.observe_item, start + i)
+                    row.set_callback_data(self.observe_item, base + start + i)
                 except AttributeError:  # Item is not observable
                     pass
+            self._fetched -= self._removing
             self.endRemoveRows()
             if 'append' in self.options and len(sender) == 0:
                 self._insert_placeholder()
 
         def before_insert(i):
+            if fetching:
+                self._fetch_rows(i)
             if 'append' in self.options and len(sender) == 0:
                 self._remove_placeholder()
             self.beginInsertRows(QtCore.QModelIndex(), i, i)
 
         def insert(i):
             try:
-                sender[i].add_callback(self.observe_item, i)
+                sender[i].add_callback(self.observe_item, base + i)
             except AttributeError:  # list item is not Observable
                 pass
             # Update observer_data after the inserted element
-            for j, row in enumerate(sender[i + 1:]):
+            for j, row in enumerate(sender[i + 1:], i + 1):
                 try:
-                    row.set_callback_data(self.observe_item, j + i)
+                    row.set_callback_data(self.observe_item, base + j)
                 except AttributeError:  # list item is not Observable
                     pass
+            self._fetched += 1
             self.endInsertRows()
 
         def before_append(dummy):
@@ -762,9 +1173,11 @@ class BaseListAdapter(AdapterReader, AdapterWriter):
 
         def append(dummy):
             try:
-                sender[-1].add_callback(self.observe_item, len(sender) - 1)
+                sender[-1].add_callback(self.observe_item,
+                    base + len(sender) - 1)
             except AttributeError:  # list item is not Observable
                 pass
+            self._fetched += 1
             if ('append' in self.options and len(sender) == 1):
                 self.dataChanged.emit(self.index(0, 0),
                     self.createIndex(0, self.columnCount() - 1))
@@ -778,12 +1191,43 @@ class BaseListAdapter(AdapterReader, AdapterWriter):
                 len(sender) + attrs - 1)
 
         def extend(n):
-            for i in range(-n):
+            self._observe_rows(len(sender) - n, len(sender))
+            self._fetched += n
+            self.endInsertRows()
+
+        def before_reorder(order):
+            self._before_reorder()
+
+        def reorder(order):
+            self._reorder(order)
+
+        def before_drop(n):
+            # Only fetched rows are observed and known by the views
+            self._removing = min(n, self._fetched)
+            for i in range(0, self._removing):
                 try:
-                    sender[i].add_callback(self.observe_item, i)
+                    sender[i].remove_callback(self.observe_item)
                 except AttributeError:  # list item is not Observable
                     pass
-            self.endInsertRows()
+            if self._removing:
+                self.beginRemoveRows(QtCore.QModelIndex(), 0,
+                    self._removing - 1)
+
+        def drop(n):
+            # Remaining rows keep their observer data, as it's relative to
+            # the dropped item count
+            self._fetched -= self._removing
+            if self._removing:
+                self.endRemoveRows()
+
+        if fetching and event_type in ('before_append', 'append',
+                'before_extend', 'extend'):
+            # Rows added after unfetched rows will be fetched later
+            added = 1 if event_type.endswith('append') else attrs
+            known = (len(sender) if event_type.startswith('before')
+                else len(sender) - added)
+            if self._fetched < known:
+                return
 
         # Call the function matching event_type
         locals()[event_type](attrs)
@@ -800,8 +1244,7 @@ class BaseListAdapter(AdapterReader, AdapterWriter):
                 if lu > lp:
                     continue
                 if updated_prop == prop[0:lu] and (lp == lu or prop[lu] == '.'):
-                    index = self.createIndex(list_index, i)
-                    self.dataChanged.emit(index, index)
+                    self._cell_changed(list_index - self._row_base(), i)
 
 
 class ValueListAdapter(BaseListAdapter, QtCore.QAbstractListModel):
@@ -814,22 +1257,29 @@ class ValueListAdapter(BaseListAdapter, QtCore.QAbstractListModel):
         # super is *really* harmful
         BaseListAdapter.__init__(self)
         QtCore.QAbstractListModel.__init__(self, parent)
+        AdapterNotifier.__init__(self)
         self._model = model
+        # The value itself, untitled unless the column metadata says so
+        self._properties = ('',)
         self._column_meta = _combine_column_metas(class_, column_meta, '.')
         self._row_meta = _combine_row_metas(class_, row_meta)
         self.options = set(['edit', 'append']) if options is None else options
         self.item_factory = item_factory if item_factory is not None else class_
+        self._fetched = 0 if 'fetch' in self.options else len(model)
         try:
             model.add_callback(self.observe)
         except AttributeError:
             # If not observable (ok if the model doesn't change)
             "Notice: " + str(type(model)) + " is not observable"
 
+    def properties(self):
+        return self._properties
+
     def rowCount(self, parent=QtCore.QModelIndex()):
         if parent != QtCore.QModelIndex():
             return 0
-        count = len(self._model)
-        if count == 0 and 'append' in self.options:
+        count = self._row_count()
+        if len(self._model) == 0 and 'append' in self.options:
             count = 1
         return count
 
@@ -853,7 +1303,7 @@ class ValueListAdapter(BaseListAdapter, QtCore.QAbstractListModel):
             # The row object will be appended in _set_value() if needed
             return self.createIndex(row, 0, None)
 
-        if not (0 <= row < len(self._model)):  # item model has a single row
+        if not (0 <= row < self._row_count()):  # item model has a single row
             print "Warning: ValueListAdapter: invalid row", row
             return QtCore.QModelIndex()
 
@@ -878,8 +1328,14 @@ class ValueListAdapter(BaseListAdapter, QtCore.QAbstractListModel):
             except AttributeError:
                 # If not observable (ok if the model doesn't change)
                 "Notice: " + str(type(model)) + " is not observable"
+        self._fetched = (0 if 'fetch' in self.options or model is None
+            else len(model))
+        self._discard_changes()
         self.endResetModel()
 
+    def _sort_key(self, column):
+        return lambda item: item
+
     def getPyObject(self, index):
         try:
             return self._model[index.row()]
@@ -983,26 +1439,30 @@ class ObjectListAdapter(BaseListAdapter, AdapterWriter, BaseAdapter):
             model: the model itself.
             class_: class of list elements. Used when inserting new elements in
                     the model.
+            options: set of adapter options: 'edit', 'append', 'fetch'
+                    for incremental row fetching, and 'coalesce' for
+                    emitting dataChanged once per event loop iteration.
         """
         AdapterReader.__init__(self)
         BaseAdapter.__init__(self, properties, model, class_, column_meta,
             row_meta, parent)
+        AdapterNotifier.__init__(self)
         # TODO: Check if edit_allowed is necessary (Can disable item editing
         # in the view)
         self.options = set(['edit', 'append']) if options is None else options
         self.item_factory = item_factory if item_factory is not None else class_
-        for i, row in enumerate(self._model):
-            try:
-                row.add_callback(self.observe_item, i)
-            except AttributeError:
-                # If not observable (ok if the model doesn't change)
-                pass
+        if 'fetch' in self.options:
+            # Rows are observed as they are fetched
+            self._fetched = 0
+        else:
+            self._fetched = len(self._model)
+            self._observe_rows(0, self._fetched)
 
     def rowCount(self, parent=QtCore.QModelIndex()):
         if parent != QtCore.QModelIndex():
             return 0
-        count = len(self._model)
-        if count == 0 and 'append' in self.options:
+        count = self._row_count()
+        if len(self._model) == 0 and 'append' in self.options:
             count = 1
         return count
 
@@ -1023,21 +1483,61 @@ class ObjectListAdapter(BaseListAdapter, AdapterWriter, BaseAdapter):
                     return self.createIndex(row, column, None)
                 else:
                     return QtCore.QModelIndex()
+            if row >= self._row_count():  # Not fetched yet
+                return QtCore.QModelIndex()
             return self.createIndex(row, column, None)
         except IndexError:
             return QtCore.QModelIndex()
 
+    def setPyModel(self, model):
+        """Changes the underlying python model"""
+        self._fetched = (0 if 'fetch' in self.options or model is None
+            else len(model))
+        self._discard_changes()
+        BaseAdapter.setPyModel(self, model)
+
+    def _sort_key(self, column):
+        propertyname = self._properties[column]
+        if propertyname == '':
+            return lambda item: item
+        getter = attrgetter(propertyname)
+
+        def key(item):
+            try:
+                return getter(item)
+            except AttributeError:  # Broken property path
+                return None
+        return key
+
     def getPyObject(self, index):
         try:
             return self._model[index.row()]
         except IndexError:
             return None
 
+    def export(self, fileobj, format='csv', roles=(Qt.DisplayRole,),
+            workers=0):
+        # Roles unknown to TableProjection are skipped
+        AdapterReader.export(self, fileobj, format,
+            [role for role in roles if role in PROJECTION_ROLES], workers)
+
+    def _export_rows(self, roles):
+        # Through the projection, so fetching and the append row don't
+        # matter, and QueryResult models are read chunk by chunk
+        projection = TableProjection.fromAdapter(self)
+        return projection.rows(
+            iter_objects(self._model, self.EXPORT_CHUNK_SIZE),
+            _projection_roles(roles))
+
+    def _export_parallel_rows(self, roles, workers):
+        projection = TableProjection.fromAdapter(self)
+        return projection.parallel_rows(self._model,
+            _projection_roles(roles), workers, self.EXPORT_CHUNK_SIZE)
+
     def _get_value(self, index):
         value = None
         try:
             propertyname = self._properties[index.column()]
-            propertyparts = propertyname.split('.')
         except IndexError:
             warn("No adapter property for the column " + str(index.column()))
             return None
@@ -1050,21 +1550,11 @@ class ObjectListAdapter(BaseListAdapter, AdapterWriter, BaseAdapter):
                 warn("There is no row " + str(index.column()) + " in the model")
             return None
         try:
-            prop = propertyparts.pop(0)
-            #while True:
-                #value = getattr(obj, prop)
-                #if not propertyparts:
-                    #break
-                #obj = value
-                #prop = propertyparts.pop(0)
-            while propertyparts:
-                obj = getattr(obj, prop)
-                prop = propertyparts.pop(0)
-            value = getattr(obj, prop) if prop != '' else obj
+            value = property_value(obj, propertyname)
         except AttributeError:
             if obj is not None:
-                warn("Adapter property {} ({}) not found in the model {}"
-                    .format(propertyname, prop, obj))
+                warn("Adapter property {} not found in the model {}"
+                    .format(propertyname, obj))
 
         return value
 
@@ -1076,7 +1566,6 @@ class ObjectListAdapter(BaseListAdapter, AdapterWriter, BaseAdapter):
 
         try:
             propertyname = self._properties[index.column()]
-            propertyparts = propertyname.split('.')
         except IndexError:
             warn("No adapter property for the column " + str(index.column()))
         try:
@@ -1087,10 +1576,7 @@ class ObjectListAdapter(BaseListAdapter, AdapterWriter, BaseAdapter):
                 warn("There is no row " + str(index.column()) + " in the model")
             return None
         try:
-            prop = propertyparts.pop(0)
-            while propertyparts:
-                obj = getattr(obj, prop)
-                prop = propertyparts.pop(0)
+            obj, prop = property_object(obj, propertyname)
             setattr(obj, prop, value)
         except AttributeError:
             warn("Adapter property " + propertyname
@@ -1101,7 +1587,6 @@ class ObjectListAdapter(BaseListAdapter, AdapterWriter, BaseAdapter):
     def _get_value_object(self, index):
         try:
             propertyname = self._properties[index.column()]
-            propertyparts = propertyname.split('.')
         except IndexError:
             warn("No adapter property for the column " + str(index.column()))
         try:
@@ -1113,15 +1598,7 @@ class ObjectListAdapter(BaseListAdapter, AdapterWriter, BaseAdapter):
                 warn("There is no row " + str(index.column()) + " in the model")
             return None
         try:
-            prop = propertyparts.pop(0)
-            #while True:
-                #value = getattr(obj, prop)
-                #prop = propertyparts.pop(0)
-                #obj = value
-            while propertyparts:
-                obj = getattr(obj, prop)
-                prop = propertyparts.pop(0)
-
+            obj = property_object(obj, propertyname)[0]
         except AttributeError:
             warn("Adapter property " + propertyname
                 + "not found in the model " + str(obj))
@@ -1164,91 +1641,540 @@ class ObjectListAdapter(BaseListAdapter, AdapterWriter, BaseAdapter):
         return True
 
 
-class ObjectTreeAdapter(AdapterReader, AdapterWriter,
-        QtCore.QAbstractItemModel):
+class ColumnarRow(object):
     """
-        Adapts a tree of Python objects into a PyQt
-        QAbstractTableModel.
-        The items should have all the same type.
+        Row of a ColumnarAdapter, giving attribute access to the row values,
+        so metadata callables get an object as in the other adapters.
     """
+    __slots__ = ('_adapter', '_row')
 
-    class RootNode(ObservableObject):
-        def __init__(self, children=[], parent_attr='parent',
-                children_attr='children'):
-            ObservableObject.__init__(self)
-            setattr(self, children_attr, children)
-            setattr(self, parent_attr, None)
-
-    def __init__(self, properties, model=None, class_=None,
-            column_meta=None, row_meta=None, qparent=None,
-            rootless=False, options=None, parent_attr='parent',
-            children_attr='children'):
-
-        AdapterReader.__init__(self)
-        QtCore.QAbstractItemModel.__init__(self, qparent)
-
-        self._class = class_
-
-        if column_meta is not None:
-            # Up to 0.4.x behavior: Meta declarations separate
-            # from property list
-            self._properties = properties
-        else:
-            # 0.5 behavior:
-            self._properties = [x if isinstance(x, str) else x[0]
-                for x in properties]
-            column_meta = [{} if isinstance(x, str) else x[1]
-                for x in properties]
-
-        self.rootless = rootless
-        if rootless:
-            model = ObjectTreeAdapter.RootNode(model, parent_attr,
-                children_attr)
+    def __init__(self, adapter, row):
+        self._adapter = adapter
+        self._row = row
 
-        self._model = model
-        self._column_meta = _combine_column_metas(class_, column_meta,
-            properties)
-        self._row_meta = _combine_row_metas(class_, row_meta)
-        self.options = set(['edit', 'append']) if options is None else options
-        self.parent_attr = parent_attr
-        self.children_attr = children_attr
+    def __getattr__(self, name):
+        try:
+            return self._adapter._column_value(name, self._row)
+        except KeyError:
+            raise AttributeError(name)
 
-        root_index = QtCore.QModelIndex()
 
-        self._model.add_callback(self.observe_item, root_index)
-        self._observe(getattr(self._model, self.children_attr, None),
-            root_index)
+class ColumnarAdapter(AdapterReader, AdapterWriter, BaseAdapter):
+    """
+        Adapts columnar data into a PyQt QAbstractTableModel.
+
+        The model is a mapping of property names to sequences of values,
+        all of the same length. Each column is stored as a NumPy array, or as
+        an array.array of numbers if NumPy is not available, so there is
+        no Python object per row. Use typecodes (a dict of property names to
+        array typecodes) to set the array.array types, otherwise they are
+        guessed from the values. Non numeric columns are kept as NumPy
+        object arrays, or as lists without NumPy. Numeric NumPy columns
+        only take numbers, and are upcast when an edit needs it (e.g. a
+        float in an integer column).
+
+        class_ is only used as source of metadata.
+
+        Display strings are formatted in blocks of BLOCK_SIZE rows, as views
+        paint contiguous row ranges. If the column metadata has a
+        'blockFormatter' key, it's called with the values of a whole block
+        and must return a sequence of strings, allowing vectorized
+        formatting.
+    """
+    BLOCK_SIZE = 256
+    MAX_CACHED_BLOCKS = 64
 
-    def _observe(self, submodel, model_index):
-        if submodel is None:
-            return
+    def __init__(self, properties, model=None, class_=None, column_meta=None,
+            row_meta=None, parent=None, typecodes=None):
+        AdapterReader.__init__(self)
+        self._typecodes = typecodes if typecodes is not None else {}
+        BaseAdapter.__init__(self, properties, model, class_, column_meta,
+            row_meta, parent)
+        self._build_columns(model)
+
+    def _store(self, prop, values):
+        numpy = _numpy()
+        if numpy is not None:
+            column = numpy.asarray(values)
+            # Fixed width dtypes (e.g. strings) would truncate edits
+            if column.dtype.kind not in NUMERIC_KINDS:
+                column = numpy.asarray(values, dtype=object)
+            return column
         try:
-            submodel.add_callback(self.observe,
-                QtCore.QModelIndex(model_index))
-        except AttributeError:
-            print "Notice: " + str(type(submodel)) + " is not observable"
-
-        for i, row in enumerate(submodel):
-            row_index = self.index(i, 0, model_index)
-            try:
-                row.add_callback(self.observe_item,
-                    QtCore.QModelIndex(row_index))
-            except AttributeError:
-                print "Warning: " + str(type(submodel)) + " is not observable"
+            typecode = self._typecodes[prop]
+        except KeyError:
+            if all(type(v) == float for v in values):
+                typecode = 'd'
+            elif all(type(v) in (int, long) for v in values):
+                typecode = 'l'
+            else:
+                return list(values)
+        try:
+            return array.array(typecode, values)
+        except (TypeError, OverflowError):
+            return list(values)
+
+    def _build_columns(self, model):
+        self._columns = {}
+        self._blocks = {}
+        self._length = 0
+        if not model:
+            return
+        for prop in self._properties:
+            self._columns[prop] = self._store(prop, model[prop])
+        self._length = len(self._columns[self._properties[0]])
+        if any(len(column) != self._length
+                for column in self._columns.values()):
+            raise ValueError('ColumnarAdapter columns must have the same '
+                'length')
 
-            self._observe(getattr(row, self.children_attr, None), row_index)
+    def setPyModel(self, model):
+        """Changes the underlying python model"""
+        self.beginResetModel()
+        self._model = model
+        self._build_columns(model)
+        self.endResetModel()
 
-    def columnCount(self, parent=QtCore.QModelIndex()):
-        return len(self._properties)
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent != QtCore.QModelIndex():
+            return 0
+        return self._length
 
     def index(self, row, column, parent=None):
 
         if parent is not None and parent.isValid():
-            parentItem = parent.internalPointer()
-        else:
-            parentItem = self._model
+            # Non hierarchical item model has no valid parent
+            return QtCore.QModelIndex()
 
-        if row < 0 or column < 0 or column >= len(self._properties):
+        if not (0 <= row < self._length and
+                0 <= column < len(self._properties)):
+            return QtCore.QModelIndex()
+
+        return self.createIndex(row, column, None)
+
+    def _column_value(self, prop, row):
+        value = self._columns[prop][row]
+        # NumPy scalars are returned as Python values
+        return value.item() if hasattr(value, 'item') else value
+
+    def getPyObject(self, index):
+        if not (0 <= index.row() < self._length):
+            return None
+        return ColumnarRow(self, index.row())
+
+    def _get_value(self, index):
+        try:
+            propertyname = self._properties[index.column()]
+        except IndexError:
+            warn("No adapter property for the column " + str(index.column()))
+            return None
+        if not (0 <= index.row() < self._length):
+            return None
+        return self._column_value(propertyname, index.row())
+
+    def _get_value_object(self, index):
+        return self.getPyObject(index)
+
+    def _set_value(self, index, value):
+        try:
+            propertyname = self._properties[index.column()]
+        except IndexError:
+            warn("No adapter property for the column " + str(index.column()))
+            return False
+        if not (0 <= index.row() < self._length):
+            return False
+        column = self._columns[propertyname]
+        dtype = getattr(column, 'dtype', None)
+        if dtype is not None and dtype.kind in NUMERIC_KINDS:
+            # NumPy would cast the value to the column type, so numeric
+            # columns only take numbers, and are upcast to hold them
+            numpy = _numpy()
+            value_dtype = numpy.asarray(value).dtype
+            if value_dtype.kind not in NUMERIC_KINDS:
+                return False
+            value_dtype = numpy.promote_types(dtype, value_dtype)
+            if value_dtype != dtype:
+                column = column.astype(value_dtype)
+                column[index.row()] = value
+                self._columns[propertyname] = column
+                # Every row may display differently
+                self._blocks = dict((key, texts) for key, texts
+                    in self._blocks.iteritems() if key[1] != index.column())
+                self.dataChanged.emit(self.index(0, index.column()),
+                    self.index(self._length - 1, index.column()))
+                return True
+        try:
+            column[index.row()] = value
+        except (TypeError, ValueError, OverflowError):
+            return False
+        self._blocks.pop((index.row() // self.BLOCK_SIZE, index.column()),
+            None)
+        self.dataChanged.emit(index, index)
+        return True
+
+    def formatBlock(self, start, stop, column):
+        """
+            Returns the display strings for the rows in range(start, stop)
+            of the column
+        """
+        values = self._columns[self._properties[column]][start:stop]
+        try:
+            meta = self._column_meta[column]
+        except IndexError:
+            meta = {}
+        if 'blockFormatter' in meta:
+            return list(meta['blockFormatter'](values))
+        if hasattr(values, 'tolist'):
+            values = values.tolist()
+        try:
+            formatter = meta['displayFormatter']
+        except KeyError:
+            return [unicode(v) if v is not None else u'' for v in values]
+        return [formatter(v) for v in values]
+
+    def data(self, index, role=Qt.DisplayRole):
+
+        if role != Qt.DisplayRole or not index.isValid():
+            return AdapterReader.data(self, index, role)
+
+        row, column = index.row(), index.column()
+        block = row // self.BLOCK_SIZE
+        try:
+            texts = self._blocks[(block, column)]
+        except KeyError:
+            if len(self._blocks) >= self.MAX_CACHED_BLOCKS:
+                self._blocks.clear()
+            start = block * self.BLOCK_SIZE
+            texts = self.formatBlock(start,
+                min(start + self.BLOCK_SIZE, self._length), column)
+            self._blocks[(block, column)] = texts
+        return texts[row - block * self.BLOCK_SIZE]
+
+
+class SnapshotAdapter(AdapterReader, BaseAdapter):
+    """
+        Read only adapter for lists of objects that don't change after
+        being loaded, as report results or lookup tables.
+
+        Takes the same configuration as ObjectListAdapter, but evaluates
+        every role of every cell once, when the model is set, and
+        data() is only a lookup. No callbacks are registered in the
+        model or its items, and later changes to them aren't shown.
+
+        Values shared by the whole column (like constant alignment
+        metadata) are stored once. The evaluated roles are the ones in
+        the roles argument, SNAPSHOT_ROLES by default. Roles without a
+        TableProjection name (see PROJECTION_ROLES), like SizeHintRole,
+        aren't stored, and data() resolves them on every call.
+
+        computeSnapshot() evaluates the roles through a TableProjection,
+        so it can be called from a worker thread as long as the metadata
+        callables are thread safe. Pass its result to setSnapshot() in the
+        GUI thread.
+    """
+    SNAPSHOT_ROLES = (Qt.DisplayRole, Qt.DecorationRole, Qt.ToolTipRole,
+        Qt.StatusTipRole, Qt.WhatsThisRole, Qt.FontRole,
+        Qt.TextAlignmentRole, Qt.BackgroundRole, Qt.ForegroundRole,
+        PythonObjectRole)
+
+    def __init__(self, properties, model=None, class_=None, column_meta=None,
+            row_meta=None, parent=None, roles=None):
+        AdapterReader.__init__(self)
+        # No model for BaseAdapter, as it would add the callback
+        BaseAdapter.__init__(self, properties, None, class_, column_meta,
+            row_meta, parent)
+        self._roles = tuple(roles) if roles is not None else \
+            self.SNAPSHOT_ROLES
+        self._set_snapshot(model, self.computeSnapshot(model))
+
+    @classmethod
+    def fromAdapter(cls, adapter, model=None, parent=None, roles=None):
+        """
+            Creates a SnapshotAdapter with the properties and metadata
+            of other list adapter (ObjectListAdapter or ValueListAdapter),
+            over the given model or the adapter's one.
+        """
+        if model is None:
+            model = adapter.getPyModel()
+        snapshot = cls(adapter.properties(), None,
+            getattr(adapter, '_class', None), parent=parent, roles=roles)
+        # Already combined metadata is used as is
+        snapshot._column_meta = adapter._column_meta
+        snapshot._row_meta = adapter._row_meta
+        snapshot._set_snapshot(model, snapshot.computeSnapshot(model))
+        return snapshot
+
+    def computeSnapshot(self, model):
+        """
+            Evaluates the roles and flags of all the cells of the model.
+            Returns an opaque value for setSnapshot().
+        """
+        objects = list(model) if model is not None else []
+        projection = TableProjection.fromAdapter(self)
+        roles = tuple(role for role in self._roles
+            if role in PROJECTION_ROLES)
+        cells = {}
+        for column in range(len(self._properties)):
+            for role in roles + ('flags',):
+                if role == 'flags':
+                    values = [self._item_flags(o, column) for o in objects]
+                else:
+                    role_name = PROJECTION_ROLES[role]
+                    values = [projection.cell(o, column, role_name)
+                        for o in objects]
+                if values and all(v == values[0] for v in values):
+                    # Same value for every row
+                    values = values[:1]
+                cells[(role, column)] = values
+        return (objects, cells)
+
+    def _item_flags(self, o, column):
+        flags = Qt.ItemFlags()
+        try:
+            flags_meta = self._column_meta[column]['flags']
+        except (IndexError, KeyError):  # No column meta, no meta key
+            try:
+                flags_meta = self._row_meta['flags']
+            except KeyError:  # no meta key
+                return Qt.ItemIsSelectable | Qt.ItemIsEnabled
+        for flagbit, flagvalue in flags_meta.iteritems():
+            if callable(flagvalue):
+                if flagvalue(o):
+                    flags |= flagbit
+            else:
+                if flagvalue:
+                    flags |= flagbit
+        return flags & ~Qt.ItemIsEditable
+
+    def setSnapshot(self, model, snapshot):
+        """
+            Sets the model and its snapshot, as returned by
+            computeSnapshot()
+        """
+        self.beginResetModel()
+        self._set_snapshot(model, snapshot)
+        self.endResetModel()
+
+    def _set_snapshot(self, model, snapshot):
+        self._model = model
+        self._objects, self._cells = snapshot
+
+    def setPyModel(self, model):
+        """Changes the underlying python model"""
+        self.setSnapshot(model, self.computeSnapshot(model))
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent != QtCore.QModelIndex():
+            return 0
+        return len(self._objects)
+
+    def index(self, row, column, parent=None):
+
+        if parent is not None and parent.isValid():
+            # Non hierarchical item model has no valid parent
+            return QtCore.QModelIndex()
+
+        if not (0 <= row < len(self._objects) and
+                0 <= column < len(self._properties)):
+            return QtCore.QModelIndex()
+
+        return self.createIndex(row, column, None)
+
+    def getPyObject(self, index):
+        try:
+            return self._objects[index.row()]
+        except IndexError:
+            return None
+
+    def _get_value(self, index):
+        return TableProjection.fromAdapter(self).value(
+            self.getPyObject(index), index.column())
+
+    def _cell(self, key, row):
+        values = self._cells[key]
+        return values[row] if len(values) > 1 else values[0]
+
+    def data(self, index, role=Qt.DisplayRole):
+
+        if not index.isValid():
+            return None
+        if role not in PROJECTION_ROLES:
+            # Not evaluated by the snapshot
+            return AdapterReader.data(self, index, role)
+        try:
+            return self._cell((role, index.column()), index.row())
+        except (KeyError, IndexError):  # Role not in the snapshot
+            return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        try:
+            return self._cell(('flags', index.column()), index.row())
+        except (KeyError, IndexError):
+            return Qt.NoItemFlags
+
+
+class ObjectTreeAdapter(AdapterReader, AdapterWriter, AdapterNotifier,
+        QtCore.QAbstractItemModel):
+    """
+        Adapts a tree of Python objects into a PyQt
+        QAbstractTableModel.
+        The items should have all the same type.
+
+        If 'fetch' is in the adapter options, children of a node are
+        observed and shown only when the view asks for them (usually when
+        the node is expanded), instead of walking the whole tree on
+        construction.
+
+        With 'fetch', the 'hasChildren' row metadata, a boolean or a
+        function of the item, tells whether a node has children without
+        loading them.
+    """
+
+    # Minimum size of the position cache triggering a purge
+    MIN_POSITIONS_LIMIT = 64
+
+    class RootNode(ObservableObject):
+        def __init__(self, children=[], parent_attr='parent',
+                children_attr='children'):
+            ObservableObject.__init__(self)
+            setattr(self, children_attr, children)
+            setattr(self, parent_attr, None)
+
+    def __init__(self, properties, model=None, class_=None,
+            column_meta=None, row_meta=None, qparent=None,
+            rootless=False, options=None, parent_attr='parent',
+            children_attr='children'):
+
+        AdapterReader.__init__(self)
+        QtCore.QAbstractItemModel.__init__(self, qparent)
+        AdapterNotifier.__init__(self)
+
+        self._class = class_
+        self._properties, column_meta = split_properties(properties,
+            column_meta)
+
+        self.rootless = rootless
+        if rootless:
+            model = ObjectTreeAdapter.RootNode(model, parent_attr,
+                children_attr)
+
+        self._model = model
+        self._column_meta = _combine_column_metas(class_, column_meta,
+            self._properties)
+        self._row_meta = _combine_row_metas(class_, row_meta)
+        self.options = set(['edit', 'append']) if options is None else options
+        self.parent_attr = parent_attr
+        self.children_attr = children_attr
+        # Position cache: id(children list) -> (weak reference to the
+        # list, or None for lists without them, dict id(item) -> row).
+        # Rows are checked on use, so entries of reused ids are harmless.
+        self._positions = {}
+        # Cache size triggering the purge of the entries of dead lists
+        self._positions_limit = self.MIN_POSITIONS_LIMIT
+        # Nodes whose children are observed when using 'fetch':
+        # id(node) -> node
+        self._fetched_nodes = {id(self._model): self._model}
+
+        root_index = QtCore.QModelIndex()
+
+        self._model.add_callback(self.observe_item, root_index)
+        self._observe(getattr(self._model, self.children_attr, None),
+            root_index)
+
+    def _observe(self, submodel, model_index):
+        if submodel is None:
+            return
+        recursive = 'fetch' not in self.options
+        try:
+            submodel.add_callback(self.observe,
+                QtCore.QModelIndex(model_index))
+        except AttributeError:
+            print "Notice: " + str(type(submodel)) + " is not observable"
+
+        for i, row in enumerate(submodel):
+            row_index = self.index(i, 0, model_index)
+            try:
+                row.add_callback(self.observe_item,
+                    QtCore.QModelIndex(row_index))
+            except AttributeError:
+                print "Warning: " + str(type(submodel)) + " is not observable"
+
+            if recursive:
+                self._observe(getattr(row, self.children_attr, None),
+                    row_index)
+
+    def _is_fetched(self, item):
+        return ('fetch' not in self.options
+            or self._fetched_nodes.get(id(item)) is item)
+
+    def _parent_item(self, parent):
+        if not parent.isValid():
+            return self._model
+        parentItem = parent.internalPointer()
+        if parentItem is None and self.rootless:
+            parentItem = self._model
+        return parentItem
+
+    def isPlaceholder(self, index):
+        return index.isValid() and index.internalPointer() is None
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return False
+        if self.isPlaceholder(parent):
+            return False
+        if 'fetch' not in self.options:
+            # Everything is loaded, and the placeholder row is reachable
+            return QtCore.QAbstractItemModel.hasChildren(self, parent)
+        parentItem = self._parent_item(parent)
+        hint = self._row_meta.get('hasChildren')
+        if hint is not None and parent.isValid():
+            return hint(parentItem) if callable(hint) else bool(hint)
+        # The placeholder row doesn't count as a child, and children not
+        # loaded yet (e.g. lazy relationships) are left alone
+        if (self._is_fetched(parentItem) or
+                self.children_attr in getattr(parentItem, '__dict__', {})):
+            try:
+                return len(getattr(parentItem, self.children_attr)) > 0
+            except (TypeError, AttributeError):
+                return False
+        return True
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return False
+        parentItem = self._parent_item(parent)
+        return (parentItem is not None and not self._is_fetched(parentItem)
+            and getattr(parentItem, self.children_attr, None) is not None)
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        parentItem = self._parent_item(parent)
+        submodel = getattr(parentItem, self.children_attr)
+        count = len(submodel)
+        if count == 0 and 'append' in self.options:
+            count = 1
+        if count:
+            self.beginInsertRows(parent, 0, count - 1)
+        self._fetched_nodes[id(parentItem)] = parentItem
+        self._observe(submodel, parent)
+        if count:
+            self.endInsertRows()
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self._properties)
+
+    def index(self, row, column, parent=None):
+
+        if parent is not None and parent.isValid():
+            parentItem = parent.internalPointer()
+        else:
+            parentItem = self._model
+
+        if row < 0 or column < 0 or column >= len(self._properties):
             return QtCore.QModelIndex()
 
         try:
@@ -1274,11 +2200,92 @@ class ObjectTreeAdapter(AdapterReader, AdapterWriter,
         """Changes the underlying python model"""
         self.beginResetModel()
         self._model = model
+        self._positions = {}
+        self._fetched_nodes = {}
+        self._discard_changes()
         self.endResetModel()
+        self.fetchMore(QtCore.QModelIndex())
 
     def getPyObject(self, index):
         return index.internalPointer()
 
+    def _cached_positions(self, children):
+        """
+            Returns the cached dict id(item) -> row of the children list,
+            or None
+        """
+        try:
+            ref, positions = self._positions[id(children)]
+        except KeyError:
+            return None
+        if ref is not None and ref() is not children:
+            return None
+        return positions
+
+    def _build_positions(self, children):
+        if len(self._positions) >= self._positions_limit:
+            # Drop the entries of garbage collected lists
+            self._positions = dict((key, entry)
+                for key, entry in self._positions.items()
+                if entry[0] is None or entry[0]() is not None)
+            self._positions_limit = max(self.MIN_POSITIONS_LIMIT,
+                2 * len(self._positions))
+        try:
+            ref = weakref.ref(children)
+        except TypeError:  # Plain lists
+            ref = None
+        positions = dict((id(child), i) for i, child in enumerate(children))
+        self._positions[id(children)] = (ref, positions)
+        return positions
+
+    def _item_row(self, children, item):
+        """
+            Returns the position of item into the children list.
+            Positions are cached per children list, and kept up to date
+            from the list events, so lookups are O(1).
+        """
+        positions = self._cached_positions(children)
+        if positions is not None:
+            row = positions.get(id(item))
+            if row is not None and row < len(children) and \
+                    children[row] is item:
+                return row
+        positions = self._build_positions(children)
+        try:
+            return positions[id(item)]
+        except KeyError:
+            raise ValueError("Item not found in its parent's children")
+
+    def _update_positions(self, children, event_type, attrs):
+        """
+            Updates the cached positions of the children list for a list
+            event
+        """
+        positions = self._cached_positions(children)
+        if positions is None:
+            return
+        if event_type in ('before_setitem', 'before_delitem'):
+            i = attrs[0] if event_type == 'before_setitem' else attrs
+            for item in (children[i] if type(i) == slice else [children[i]]):
+                positions.pop(id(item), None)
+            return
+        if event_type in ('setitem', 'delitem', 'insert'):
+            i = attrs[0] if event_type == 'setitem' else attrs
+            start = i if type(i) == int else i.start
+            if start is None or start < 0:
+                start = 0
+        elif event_type == 'append':
+            start = len(children) - 1
+        elif event_type == 'extend':
+            start = len(children) - attrs
+        elif event_type == 'reorder':
+            start = 0
+        else:
+            return
+        # Rows from start on are new or shifted
+        for row in range(start, len(children)):
+            positions[id(children[row])] = row
+
     def item_index(self, item):
 
         if item == self._model:
@@ -1290,7 +2297,7 @@ class ObjectTreeAdapter(AdapterReader, AdapterWriter,
             parentItem = self._model
 
         parentChildren = getattr(parentItem, self.children_attr)
-        row = parentChildren.index(item)
+        row = self._item_row(parentChildren, item)
         return self.createIndex(row, 0, item)
 
     def parent(self, index):
@@ -1305,14 +2312,11 @@ class ObjectTreeAdapter(AdapterReader, AdapterWriter,
 
     def rowCount(self, parent=QtCore.QModelIndex()):
 
-        if not parent.isValid():
-            parentItem = self._model
-        else:
-            if parent.column() > 0:
-                return 0
-            parentItem = parent.internalPointer()
-            if parentItem is None and self.rootless:
-                parentItem = self._model
+        if parent.isValid() and parent.column() > 0:
+            return 0
+        parentItem = self._parent_item(parent)
+        if not self._is_fetched(parentItem):
+            return 0
 
         try:
             count = len(getattr(parentItem, self.children_attr))
@@ -1324,6 +2328,22 @@ class ObjectTreeAdapter(AdapterReader, AdapterWriter,
 
         return count
 
+    def _export_rows(self, roles, parent_item=None):
+        # Depth first, children after their parent. The Python model is
+        # walked, so nodes not fetched yet are exported, and the append
+        # placeholder rows aren't
+        if parent_item is None:
+            parent_item = self._model
+        columns = range(len(self._properties))
+        children = getattr(parent_item, self.children_attr, None) or ()
+        for row, item in enumerate(children):
+            if item is None:
+                continue
+            yield [self.data(self.createIndex(row, column, item), role)
+                for column in columns for role in roles]
+            for child_row in self._export_rows(roles, item):
+                yield child_row
+
     def _get_value(self, index):
         value = None
         try:
@@ -1472,6 +2492,8 @@ class ObjectTreeAdapter(AdapterReader, AdapterWriter,
     def observe(self, sender, event_type, list_index, attrs):
         # TODO: If tree works ok, unify
 
+        self.flushChanges()
+
         # Please note that event attributes are passed as
         # arguments for legibility (semantics for attributes
         # varies depending each event) but sender
@@ -1597,9 +2619,44 @@ class ObjectTreeAdapter(AdapterReader, AdapterWriter,
                     pass
             self.endInsertRows()
 
+        def before_reorder(order):
+            self.layoutAboutToBeChanged.emit()
+
+        def reorder(order):
+            new_rows = {}
+            for i, row in enumerate(sender):
+                new_rows[id(row)] = i
+                row_index = QtCore.QModelIndex(self.index(i, 0, list_index))
+                try:
+                    row.set_callback_data(self.observe_item, row_index)
+                except AttributeError:  # Item not observable
+                    pass
+                if 'fetch' in self.options and not self._is_fetched(row):
+                    continue
+                try:
+                    getattr(row, self.children_attr).set_callback_data(
+                        self.observe, row_index)
+                except AttributeError:  # No children or not observable
+                    pass
+            old_indexes = [index for index in self.persistentIndexList()
+                if id(index.internalPointer()) in new_rows]
+            self.changePersistentIndexList(old_indexes,
+                [self.createIndex(new_rows[id(index.internalPointer())],
+                index.column(), index.internalPointer())
+                for index in old_indexes])
+            self.layoutChanged.emit()
+
+        # Removed rows are forgotten once the views were notified, and new
+        # or shifted rows are recorded before
+        if not event_type.startswith('before'):
+            self._update_positions(sender, event_type, attrs)
+
         # Call the function matching event_type
         locals()[event_type](attrs)
 
+        if event_type.startswith('before'):
+            self._update_positions(sender, event_type, attrs)
+
     def observe_item(self, sender, event_type, item_index, attrs):
 
         if event_type != "update":
@@ -1613,5 +2670,947 @@ class ObjectTreeAdapter(AdapterReader, AdapterWriter,
                     continue
                 if updated_prop == prop[0:lu] and (lp == lu or prop[lu] == '.'):
                     #print "dataChanged", attrs[0], item_indexlist_index, i
-                    index = self.index(item_index.row(), i, item_index.parent())
-                    self.dataChanged.emit(index, index)
+                    self._cell_changed(item_index.row(), i,
+                        item_index.parent())
+
+
+class GroupingAdapter(AdapterReader, AdapterWriter, AdapterNotifier,
+        QtCore.QAbstractItemModel):
+    """
+        Presents a list of Python objects as a tree grouped by the values
+        of one or more properties (group_by), one tree level per property.
+        Group rows show the group key in the first column, and the
+        aggregates of their items in the aggregated columns. Item rows are
+        shown (and edited) as in ObjectListAdapter.
+
+        Groups are hash buckets kept up to date from the list events and
+        the item updates. When a grouping property of an item changes,
+        only its row is moved to the new group (with beginMoveRows),
+        groups being created and removed as needed, and only the
+        aggregates of the groups involved are updated. Groups are shown in
+        order of creation, and items in order of arrival to their group.
+        An item can be in the list several times, with a row and a share
+        of the aggregates per occurrence.
+
+        aggregates: dict property -> 'sum' or 'count' (item count), the
+            property being one of the shown ones, except the first.
+        options: set of adapter options: 'coalesce' (see AdapterNotifier).
+    """
+
+    class Group(object):
+        """
+            A group of the items with the same key values
+        """
+        def __init__(self, key, parent, level):
+            self.key = key
+            self.parent = parent
+            # 0 for the root group
+            self.level = level
+            # Subgroups, or items in the last level
+            self.children = []
+            # key -> subgroup
+            self.groups = {}
+            self.count = 0
+            # property -> sum of its values
+            self.sums = {}
+            # id(child) -> row, rebuilt when stale
+            self._positions = None
+
+        def items(self):
+            """
+                Yields the items of the group and its subgroups
+            """
+            for child in self.children:
+                if isinstance(child, GroupingAdapter.Group):
+                    for item in child.items():
+                        yield item
+                else:
+                    yield child
+
+    def __init__(self, properties, model=None, group_by=(), class_=None,
+            column_meta=None, row_meta=None, parent=None, aggregates=None,
+            options=None):
+        AdapterReader.__init__(self)
+        QtCore.QAbstractItemModel.__init__(self, parent)
+        AdapterNotifier.__init__(self)
+        self._class = class_
+        self._properties, column_meta = split_properties(properties,
+            column_meta)
+        self._column_meta = _combine_column_metas(class_, column_meta,
+            self._properties)
+        self._row_meta = _combine_row_metas(class_, row_meta)
+        self.options = set() if options is None else options
+        self._group_by = tuple(group_by)
+        self._aggregates = dict(aggregates or {})
+        # (column, property, kind)
+        self._aggregate_columns = [(self._properties.index(prop), prop, kind)
+            for prop, kind in self._aggregates.items()]
+        self._sum_properties = [prop for prop, kind in
+            self._aggregates.items() if kind == 'sum']
+        self._model = None
+        self._build(model)
+
+    def _build(self, model):
+        self._root = GroupingAdapter.Group(None, None, 0)
+        # id(item) -> [leaf group, occurrences in the list]
+        self._item_group = {}
+        self._removing = []
+        self._model = model
+        if model is None:
+            return
+        try:
+            model.add_callback(self.observe)
+        except AttributeError:
+            # If not observable (ok if the model doesn't change)
+            pass
+        self._add_items(model, False)
+
+    def getPyModel(self):
+        return self._model
+
+    def setPyModel(self, model):
+        """Changes the underlying python model"""
+        self.beginResetModel()
+        if self._model is not None:
+            try:
+                self._model.remove_callback(self.observe)
+            except AttributeError:
+                pass
+            observed = set()
+            for item in self._root.items():
+                if id(item) in observed:
+                    continue
+                observed.add(id(item))
+                try:
+                    item.remove_callback(self.observe_item)
+                except AttributeError:
+                    pass
+        self._discard_changes()
+        self._build(model)
+        self.endResetModel()
+
+    def properties(self):
+        return self._properties
+
+    def getPropertyColumn(self, prop):
+        return self._properties.index(prop)
+
+    def getColumnProperty(self, col):
+        return self._properties[col]
+
+    def groupBy(self):
+        return self._group_by
+
+    def rootGroup(self):
+        return self._root
+
+    def isGroup(self, index):
+        return isinstance(index.internalPointer(), GroupingAdapter.Group)
+
+    # Tree structure
+
+    def _item_path(self, item):
+        path = []
+        for prop in self._group_by:
+            try:
+                path.append(property_value(item, prop))
+            except AttributeError:
+                path.append(None)
+        return tuple(path)
+
+    def _child_row(self, group, child):
+        children = group.children
+        positions = group._positions
+        if positions is not None:
+            row = positions.get(id(child))
+            if row is not None and row < len(children) and \
+                    children[row] is child:
+                return row
+        positions = group._positions = dict((id(c), i)
+            for i, c in enumerate(children))
+        return positions[id(child)]
+
+    def _append_child(self, group, child):
+        if group._positions is not None:
+            group._positions[id(child)] = len(group.children)
+        group.children.append(child)
+
+    def _group_index(self, group):
+        if group is self._root:
+            return QtCore.QModelIndex()
+        return self.createIndex(self._child_row(group.parent, group), 0,
+            group)
+
+    def _leaf_group(self, path, notify=True):
+        """
+            Returns the last level group for the key path, creating the
+            missing groups
+        """
+        group = self._root
+        for level, key in enumerate(path):
+            child = group.groups.get(key)
+            if child is None:
+                child = GroupingAdapter.Group(key, group, level + 1)
+                row = len(group.children)
+                if notify:
+                    self.beginInsertRows(self._group_index(group), row, row)
+                self._append_child(group, child)
+                group.groups[key] = child
+                if notify:
+                    self.endInsertRows()
+            group = child
+        return group
+
+    def _prune(self, group):
+        """
+            Removes the group if empty, and its parents if they become
+            empty. Returns the first remaining group.
+        """
+        while group is not self._root and not group.children:
+            parent = group.parent
+            row = self._child_row(parent, group)
+            self.beginRemoveRows(self._group_index(parent), row, row)
+            del parent.children[row]
+            del parent.groups[group.key]
+            parent._positions = None
+            self.endRemoveRows()
+            group = parent
+        return group
+
+    # Aggregates
+
+    def _update_aggregates(self, leaf, items, sign, props=None):
+        """
+            Adds (sign 1) or subtracts (sign -1) the items to the
+            aggregates of the leaf group and its parents. If props is
+            given, only the sums of those properties are updated.
+        """
+        sums = {}
+        for prop in (self._sum_properties if props is None else props):
+            total = 0
+            for item in items:
+                try:
+                    value = property_value(item, prop)
+                except AttributeError:
+                    value = None
+                if value is not None:
+                    total += value
+            sums[prop] = total
+        group = leaf
+        while group is not None:
+            if props is None:
+                group.count += sign * len(items)
+            for prop, total in sums.items():
+                group.sums[prop] = group.sums.get(prop, 0) + sign * total
+            group = group.parent
+
+    def _aggregates_changed(self, group):
+        if not self._aggregate_columns:
+            return
+        while group is not self._root:
+            parent = group.parent
+            row = self._child_row(parent, group)
+            parent_index = self._group_index(parent)
+            for column, prop, kind in self._aggregate_columns:
+                self._emit_cell_changed(row, column, parent_index)
+            group = parent
+
+    def groupAggregate(self, group, prop):
+        kind = self._aggregates[prop]
+        if kind == 'count':
+            return group.count
+        return group.sums.get(prop, 0)
+
+    # Item bookkeeping
+
+    def _add_items(self, items, notify=True):
+        buckets = OrderedDict()
+        for item in items:
+            buckets.setdefault(self._item_path(item), []).append(item)
+        for path, bucket in buckets.items():
+            leaf = self._leaf_group(path, notify)
+            first = len(leaf.children)
+            if notify:
+                self.beginInsertRows(self._group_index(leaf), first,
+                    first + len(bucket) - 1)
+            for item in bucket:
+                self._append_child(leaf, item)
+                entry = self._item_group.get(id(item))
+                if entry is not None:
+                    # Already in the list
+                    entry[1] += 1
+                    continue
+                self._item_group[id(item)] = [leaf, 1]
+                try:
+                    item.add_callback(self.observe_item)
+                except AttributeError:
+                    # If not observable (ok if the items don't change)
+                    pass
+            self._update_aggregates(leaf, bucket, 1)
+            if notify:
+                self.endInsertRows()
+                self._aggregates_changed(leaf)
+
+    def _item_rows(self, leaf, item):
+        """Returns the rows of the item occurrences in its leaf group"""
+        if self._item_group[id(item)][1] == 1:
+            return [self._child_row(leaf, item)]
+        return [row for row, child in enumerate(leaf.children)
+            if child is item]
+
+    def _remove_items(self, items):
+        buckets = OrderedDict()
+        # id(item) -> occurrences removed
+        removed = OrderedDict()
+        for item in items:
+            entry = self._item_group.get(id(item))
+            if entry is None:
+                continue
+            removed[id(item)] = removed.get(id(item), 0) + 1
+            buckets.setdefault(id(entry[0]), (entry[0], []))[1].append(item)
+        for leaf, bucket in buckets.values():
+            rows = []
+            for item in bucket:
+                count = removed.pop(id(item), None)
+                if count is not None:
+                    rows.extend(self._item_rows(leaf, item)[-count:])
+            rows.sort(reverse=True)
+            # Contiguous row ranges, from the bottom
+            ranges = []
+            for row in rows:
+                if ranges and ranges[-1][0] == row + 1:
+                    ranges[-1][0] = row
+                else:
+                    ranges.append([row, row])
+            parent = self._group_index(leaf)
+            for first, last in ranges:
+                self.beginRemoveRows(parent, first, last)
+                del leaf.children[first:last + 1]
+                leaf._positions = None
+                self.endRemoveRows()
+            # Views may ask for the parent of the rows until they are gone
+            for item in bucket:
+                entry = self._item_group[id(item)]
+                entry[1] -= 1
+                if entry[1]:
+                    continue
+                del self._item_group[id(item)]
+                try:
+                    item.remove_callback(self.observe_item)
+                except AttributeError:
+                    pass
+            self._update_aggregates(leaf, bucket, -1)
+            self._aggregates_changed(self._prune(leaf))
+
+    def _move_item(self, item):
+        self.flushChanges()
+        entry = self._item_group[id(item)]
+        old_leaf = entry[0]
+        new_leaf = self._leaf_group(self._item_path(item))
+        if new_leaf is old_leaf:
+            return
+        # One move per occurrence
+        for i in range(entry[1]):
+            row = self._child_row(old_leaf, item)
+            self.beginMoveRows(self._group_index(old_leaf), row, row,
+                self._group_index(new_leaf), len(new_leaf.children))
+            del old_leaf.children[row]
+            old_leaf._positions = None
+            self._append_child(new_leaf, item)
+            entry[0] = new_leaf
+            self._update_aggregates(old_leaf, [item], -1)
+            self._update_aggregates(new_leaf, [item], 1)
+            self.endMoveRows()
+        self._aggregates_changed(new_leaf)
+        self._aggregates_changed(self._prune(old_leaf))
+
+    def observe(self, sender, event_type, observer_data, attrs):
+        if sender is not self._model:
+            return
+
+        self.flushChanges()
+
+        def before_setitem(attrs):
+            i, inserting = attrs
+            self._removing = sender[i] if type(i) == slice else [sender[i]]
+
+        def setitem(attrs):
+            i, length = attrs
+            if type(i) == int:
+                start = i if i >= 0 else i + len(sender)
+            else:
+                start = i.start or 0
+            self._remove_items(self._removing)
+            self._removing = []
+            self._add_items(sender[start:start + length])
+
+        def before_delitem(i):
+            self._removing = sender[i] if type(i) == slice else [sender[i]]
+
+        def delitem(i):
+            self._remove_items(self._removing)
+            self._removing = []
+
+        def insert(i):
+            self._add_items([sender[i]])
+
+        def append(dummy):
+            self._add_items([sender[len(sender) - 1]])
+
+        def extend(length):
+            self._add_items(sender[len(sender) - length:])
+
+        def before_drop(n):
+            self._removing = sender[:n]
+
+        def drop(n):
+            delitem(n)
+
+        # Reorders don't change the groups
+        try:
+            locals()[event_type](attrs)
+        except KeyError:
+            pass
+
+    def observe_item(self, sender, event_type, observer_data, attrs):
+        if event_type not in ('before_update', 'update'):
+            return
+        entry = self._item_group.get(id(sender))
+        if entry is None:
+            return
+        leaf = entry[0]
+        # Every occurrence counts in the aggregates
+        occurrences = [sender] * entry[1]
+
+        def affects(updated_prop, prop):
+            lu = len(updated_prop)
+            return prop[0:lu] == updated_prop and (len(prop) == lu
+                or prop[lu] == '.')
+
+        for updated_prop in attrs:
+            sums = [prop for prop in self._sum_properties
+                if affects(updated_prop, prop)]
+            if event_type == 'before_update':
+                if sums:
+                    self._update_aggregates(leaf, occurrences, -1, sums)
+                continue
+            if sums:
+                self._update_aggregates(leaf, occurrences, 1, sums)
+            if any(affects(updated_prop, prop) for prop in self._group_by):
+                self._move_item(sender)
+            for column, prop in enumerate(self._properties):
+                if affects(updated_prop, prop):
+                    parent = self._group_index(entry[0])
+                    for row in self._item_rows(entry[0], sender):
+                        self._cell_changed(row, column, parent)
+            if sums:
+                self._aggregates_changed(entry[0])
+
+    # Qt model API
+
+    def index(self, row, column, parent=None):
+        if parent is not None and parent.isValid():
+            group = parent.internalPointer()
+            if not isinstance(group, GroupingAdapter.Group):
+                return QtCore.QModelIndex()
+        else:
+            group = self._root
+        if row < 0 or column < 0 or column >= len(self._properties) or \
+                row >= len(group.children):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column, group.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        child = index.internalPointer()
+        if isinstance(child, GroupingAdapter.Group):
+            return self._group_index(child.parent)
+        return self._group_index(self._item_group[id(child)][0])
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if not parent.isValid():
+            return len(self._root.children)
+        group = parent.internalPointer()
+        if parent.column() > 0 or \
+                not isinstance(group, GroupingAdapter.Group):
+            return 0
+        return len(group.children)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return len(self._properties)
+
+    def getPyObject(self, index):
+        """
+            Returns the item, or the Group object for group rows
+        """
+        return index.internalPointer() if index.isValid() else None
+
+    def _group_value(self, group, column):
+        if column == 0:
+            return group.key
+        for aggregate_column, prop, kind in self._aggregate_columns:
+            if aggregate_column == column:
+                return self.groupAggregate(group, prop)
+        return None
+
+    def _group_data(self, index, role):
+        group = index.internalPointer()
+        column = index.column()
+        if role == PythonObjectRole:
+            return self._group_value(group, column)
+        if role != Qt.DisplayRole:
+            return None
+        value = self._group_value(group, column)
+        if value is None:
+            return u'' if column == 0 else None
+        if column == 0:
+            # Formatted as the grouping property column, if shown
+            try:
+                column = self._properties.index(
+                    self._group_by[group.level - 1])
+            except ValueError:
+                return unicode(value)
+        elif self._aggregates.get(self._properties[column]) == 'count':
+            return unicode(value)
+        return format_value(self._column_meta, column, 'displayFormatter',
+            value)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if self.isGroup(index):
+            return self._group_data(index, role)
+        return AdapterReader.data(self, index, role)
+
+    def flags(self, index):
+        if self.isGroup(index):
+            return Qt.ItemIsSelectable | Qt.ItemIsEnabled
+        return AdapterReader.flags(self, index)
+
+    def _get_value(self, index):
+        try:
+            return property_value(index.internalPointer(),
+                self._properties[index.column()])
+        except (IndexError, AttributeError):
+            return None
+
+    def _set_value(self, index, value):
+        try:
+            obj, prop = property_object(index.internalPointer(),
+                self._properties[index.column()])
+            setattr(obj, prop, value)
+        except (IndexError, AttributeError):
+            warn("Adapter property " + self._properties[index.column()]
+                + " not found in the model " + str(index.internalPointer()))
+            return False
+        return True
+
+    def _get_value_object(self, index):
+        try:
+            return property_object(index.internalPointer(),
+                self._properties[index.column()])[0]
+        except AttributeError:
+            return None
+
+
+class PivotAdapter(QtCore.QAbstractTableModel):
+    """
+        Presents a pivot table of a list of Python objects: one row for
+        each value of the row_by property, one column for each value of
+        the column_by property, and in each cell the aggregate of the
+        value property over the items with those keys. The keys are shown
+        in the headers.
+
+        Cells are accumulators updated from the list events and the item
+        updates, so an item change only updates the cells it leaves and
+        enters, and min and max don't rescan the items when the current
+        extreme is removed. Rows and columns are inserted and removed as
+        their keys appear and disappear. An item can be in the list
+        several times, contributing once per occurrence.
+
+        aggregate: 'sum', 'count', 'avg', 'min' or 'max'
+        formatter: callable returning the display text of cell values
+        options: set of adapter options:
+            'sorted': Keeps the keys sorted, None first, instead of in
+                order of arrival.
+    """
+
+    class Axis(object):
+        """
+            The keys of the rows or the columns
+        """
+        def __init__(self, sorted_):
+            self.keys = []
+            # key -> item count
+            self.counts = {}
+            self._sorted = sorted_
+            self._sort_keys = []
+            # key -> position, rebuilt when stale
+            self._positions = {}
+
+        def position(self, key):
+            if self._positions is None:
+                self._positions = dict((k, i)
+                    for i, k in enumerate(self.keys))
+            return self._positions[key]
+
+        def insert_position(self, key):
+            if not self._sorted:
+                return len(self.keys)
+            return bisect.bisect(self._sort_keys, (key is not None, key))
+
+        def insert(self, key, position):
+            self.keys.insert(position, key)
+            self.counts[key] = 0
+            if self._sorted:
+                self._sort_keys.insert(position, (key is not None, key))
+            if self._positions is not None and position == len(self.keys) - 1:
+                self._positions[key] = position
+            else:
+                self._positions = None
+
+        def remove(self, key):
+            position = self.position(key)
+            del self.keys[position]
+            del self.counts[key]
+            if self._sorted:
+                del self._sort_keys[position]
+            self._positions = None
+
+    def __init__(self, model=None, row_by=None, column_by=None, value=None,
+            aggregate='sum', formatter=None, parent=None, options=None):
+        QtCore.QAbstractTableModel.__init__(self, parent)
+        self._row_by = row_by
+        self._column_by = column_by
+        self._value = value
+        self._accumulator = ACCUMULATORS[aggregate]
+        self._aggregate = aggregate
+        self._formatter = formatter
+        self.options = set() if options is None else options
+        self._model = None
+        self._build(model)
+
+    def _build(self, model):
+        sorted_ = 'sorted' in self.options
+        self._rows = PivotAdapter.Axis(sorted_)
+        self._columns = PivotAdapter.Axis(sorted_)
+        # (row key, column key) -> accumulator
+        self._cells = {}
+        # id(item) -> [(row key, column key, value) added to the cells,
+        # occurrences in the list]
+        self._contributions = {}
+        self._removing = []
+        self._model = model
+        if model is None:
+            return
+        try:
+            model.add_callback(self.observe)
+        except AttributeError:
+            # If not observable (ok if the model doesn't change)
+            pass
+        self._add_items(model, False)
+
+    def getPyModel(self):
+        return self._model
+
+    def setPyModel(self, model):
+        """Changes the underlying python model"""
+        self.beginResetModel()
+        if self._model is not None:
+            try:
+                self._model.remove_callback(self.observe)
+            except AttributeError:
+                pass
+            for item in self._model:
+                if id(item) not in self._contributions:
+                    continue
+                # Once per item, even if repeated
+                del self._contributions[id(item)]
+                try:
+                    item.remove_callback(self.observe_item)
+                except AttributeError:
+                    pass
+        self._build(model)
+        self.endResetModel()
+
+    def aggregate(self):
+        return self._aggregate
+
+    def rowKeys(self):
+        return self._rows.keys
+
+    def columnKeys(self):
+        return self._columns.keys
+
+    def cellKeys(self, index):
+        """
+            Returns the (row key, column key) tuple of the cell
+        """
+        return (self._rows.keys[index.row()],
+            self._columns.keys[index.column()])
+
+    def cellValue(self, row_key, column_key):
+        """
+            Returns the aggregate of the items with the keys, or None if
+            there are none
+        """
+        cell = self._cells.get((row_key, column_key))
+        return cell.value() if cell is not None else None
+
+    # Cell bookkeeping
+
+    def _contribution(self, item):
+        values = []
+        for prop in (self._row_by, self._column_by, self._value):
+            try:
+                values.append(property_value(item, prop)
+                    if prop is not None else None)
+            except AttributeError:
+                values.append(None)
+        return tuple(values)
+
+    def _insert_keys(self, axis, keys, notify):
+        if axis is self._rows:
+            begin, end = self.beginInsertRows, self.endInsertRows
+        else:
+            begin, end = self.beginInsertColumns, self.endInsertColumns
+        if not axis._sorted and keys:
+            # All appended, in a single range
+            first = len(axis.keys)
+            if notify:
+                begin(QtCore.QModelIndex(), first, first + len(keys) - 1)
+            for key in keys:
+                axis.insert(key, len(axis.keys))
+            if notify:
+                end()
+            return
+        for key in keys:
+            position = axis.insert_position(key)
+            if notify:
+                begin(QtCore.QModelIndex(), position, position)
+            axis.insert(key, position)
+            if notify:
+                end()
+
+    def _remove_keys(self, axis, keys):
+        if axis is self._rows:
+            begin, end = self.beginRemoveRows, self.endRemoveRows
+        else:
+            begin, end = self.beginRemoveColumns, self.endRemoveColumns
+        for key in keys:
+            position = axis.position(key)
+            begin(QtCore.QModelIndex(), position, position)
+            axis.remove(key)
+            end()
+
+    def _cells_changed(self, cells):
+        rows, columns = self._rows, self._columns
+        positions = [(rows.position(row_key), columns.position(column_key))
+            for row_key, column_key in cells
+            if row_key in rows.counts and column_key in columns.counts]
+        if not positions:
+            return
+        top = min(p[0] for p in positions)
+        bottom = max(p[0] for p in positions)
+        left = min(p[1] for p in positions)
+        right = max(p[1] for p in positions)
+        self.dataChanged.emit(self.index(top, left),
+            self.index(bottom, right))
+
+    def _add_contributions(self, contributions, notify=True):
+        for axis, k in ((self._rows, 0), (self._columns, 1)):
+            new_keys = []
+            for contribution in contributions:
+                key = contribution[k]
+                if key not in axis.counts and key not in new_keys:
+                    new_keys.append(key)
+            self._insert_keys(axis, new_keys, notify)
+        cells = set()
+        for row_key, column_key, value in contributions:
+            cell = self._cells.get((row_key, column_key))
+            if cell is None:
+                cell = self._cells[(row_key, column_key)] = \
+                    self._accumulator()
+            cell.add(value)
+            self._rows.counts[row_key] += 1
+            self._columns.counts[column_key] += 1
+            cells.add((row_key, column_key))
+        if notify:
+            self._cells_changed(cells)
+
+    def _remove_contributions(self, contributions):
+        rows, columns = self._rows, self._columns
+        cells = set()
+        for row_key, column_key, value in contributions:
+            cell = self._cells[(row_key, column_key)]
+            cell.remove(value)
+            if not cell.count:
+                del self._cells[(row_key, column_key)]
+            rows.counts[row_key] -= 1
+            columns.counts[column_key] -= 1
+            cells.add((row_key, column_key))
+        for axis, k in ((rows, 0), (columns, 1)):
+            empty_keys = []
+            for cell in cells:
+                key = cell[k]
+                if not axis.counts.get(key, 1) and key not in empty_keys:
+                    empty_keys.append(key)
+            self._remove_keys(axis, empty_keys)
+        self._cells_changed(cells)
+
+    def _add_items(self, items, notify=True):
+        contributions = []
+        for item in items:
+            entry = self._contributions.get(id(item))
+            if entry is None:
+                entry = self._contributions[id(item)] = [
+                    self._contribution(item), 0]
+                try:
+                    item.add_callback(self.observe_item)
+                except AttributeError:
+                    # If not observable (ok if the items don't change)
+                    pass
+            entry[1] += 1
+            contributions.append(entry[0])
+        self._add_contributions(contributions, notify)
+
+    def _remove_items(self, items):
+        contributions = []
+        for item in items:
+            entry = self._contributions.get(id(item))
+            if entry is None:
+                continue
+            contributions.append(entry[0])
+            entry[1] -= 1
+            if entry[1]:
+                continue
+            del self._contributions[id(item)]
+            try:
+                item.remove_callback(self.observe_item)
+            except AttributeError:
+                pass
+        self._remove_contributions(contributions)
+
+    def observe(self, sender, event_type, observer_data, attrs):
+        if sender is not self._model:
+            return
+
+        def before_setitem(attrs):
+            i, inserting = attrs
+            self._removing = sender[i] if type(i) == slice else [sender[i]]
+
+        def setitem(attrs):
+            i, length = attrs
+            if type(i) == int:
+                start = i if i >= 0 else i + len(sender)
+            else:
+                start = i.start or 0
+            self._remove_items(self._removing)
+            self._removing = []
+            self._add_items(sender[start:start + length])
+
+        def before_delitem(i):
+            self._removing = sender[i] if type(i) == slice else [sender[i]]
+
+        def delitem(i):
+            self._remove_items(self._removing)
+            self._removing = []
+
+        def insert(i):
+            self._add_items([sender[i]])
+
+        def append(dummy):
+            self._add_items([sender[len(sender) - 1]])
+
+        def extend(length):
+            self._add_items(sender[len(sender) - length:])
+
+        def before_drop(n):
+            self._removing = sender[:n]
+
+        def drop(n):
+            delitem(n)
+
+        # Reorders don't change the cells
+        try:
+            locals()[event_type](attrs)
+        except KeyError:
+            pass
+
+    def observe_item(self, sender, event_type, observer_data, attrs):
+        # The previous contribution is known, so only the update matters
+        if event_type != 'update':
+            return
+        entry = self._contributions.get(id(sender))
+        if entry is None:
+            return
+        old, count = entry
+        new = self._contribution(sender)
+        if new == old:
+            return
+        entry[0] = new
+        if new[:2] == old[:2]:
+            # Same cell, only its value changed
+            cell = self._cells[old[:2]]
+            for i in range(count):
+                cell.remove(old[2])
+                cell.add(new[2])
+            self._cells_changed([new[:2]])
+            return
+        # Added first, so keys kept by the item aren't removed meanwhile
+        self._add_contributions([new] * count)
+        self._remove_contributions([old] * count)
+
+    # Qt model API
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows.keys)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self._columns.keys)
+
+    def index(self, row, column, parent=None):
+        if parent is not None and parent.isValid():
+            return QtCore.QModelIndex()
+        if row < 0 or column < 0 or row >= len(self._rows.keys) or \
+                column >= len(self._columns.keys):
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column)
+
+    def getPyObject(self, index):
+        """
+            Returns the aggregate value of the cell
+        """
+        return self.cellValue(*self.cellKeys(index))
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == PythonObjectRole:
+            return self.getPyObject(index)
+        if role == Qt.DisplayRole:
+            value = self.getPyObject(index)
+            if value is None:
+                return u''
+            if self._formatter is not None:
+                return self._formatter(value)
+            return unicode(value)
+        if role == Qt.TextAlignmentRole:
+            return Qt.AlignRight | Qt.AlignVCenter
+        return None
+
+    def headerData(self, section, orientation, role):
+        if role not in (Qt.DisplayRole, PythonObjectRole):
+            return None
+        axis = self._columns if orientation == Qt.Horizontal else self._rows
+        try:
+            key = axis.keys[section]
+        except IndexError:
+            return None
+        if role == PythonObjectRole:
+            return key
+        return unicode(key) if key is not None else u''
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsSelectable | Qt.ItemIsEnabled
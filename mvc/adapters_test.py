@@ -19,11 +19,22 @@
 
 import unittest
 from PyQt4 import QtCore
+import json
 import random
+import weakref
+from StringIO import StringIO
+try:
+    import numpy
+except ImportError:
+    numpy = None
 from PyQt4.QtCore import Qt
-from qonda.mvc.observable import ObservableObject, ObservableListProxy
+from qonda.mvc.observable import (ObservableObject, ObservableListProxy,
+    ObservableRingList)
 from qonda.mvc.adapters import (ObjectAdapter, ObjectListAdapter, ObjectTreeAdapter,
-    PythonObjectRole)
+    ValueListAdapter, GroupingAdapter, PivotAdapter,
+    ColumnarAdapter, SnapshotAdapter, QondaMimeData, PythonObjectRole,
+    mime_objects)
+from qonda.util.projection import NoneOrdering
 
 
 class TestObject(ObservableObject):
@@ -178,6 +189,11 @@ class ObjectAdapterTestCase(unittest.TestCase):
             self.assertEqual(flags, expected,
                     'ObjectAdapter.flags() on index({0},{1})'.format(row, col))
 
+    def test_shared_metadata(self):
+        self.assertTrue(self.adapter1._column_meta[1]
+            is self.adapter2._column_meta[1],
+            'Adapters of the same class must share the class metadata')
+
     # def test_headerData(self):
     # def test_mimeTypes(self):
 
@@ -473,6 +489,585 @@ class ObjectListAdapterTestCase(unittest.TestCase):
                     'test_model_insertion failed')
 
 
+class ObjectListAdapterCoalesceTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.model = ObservableListProxy()
+        for i in range(0, 10):
+            o = TestObject()
+            o.x = u'x{0}'.format(i)
+            self.model.append(o)
+
+        self.adapter = ObjectListAdapter(
+            ('x', 'y', 'z'),
+            self.model,
+            TestObject, options=set(['edit', 'coalesce']))
+        self.adapter.dataChanged.connect(self.dataChangedSlot)
+        self.changes = []
+
+    def dataChangedSlot(self, topLeft, bottomRight):
+        self.changes.append((topLeft.row(), topLeft.column(),
+            bottomRight.row(), bottomRight.column()))
+
+    def test_coalesce(self):
+        self.model[5].x = u'a'
+        self.model[2].z = u'b'
+        self.model[3].y = u'c'
+        self.assertEqual(self.changes, [])
+        self.adapter.flushDataChanged()
+        self.assertEqual(self.changes, [(2, 0, 5, 2)])
+        self.adapter.flushDataChanged()
+        self.assertEqual(len(self.changes), 1)
+
+    def test_flush_on_list_change(self):
+        self.model[5].x = u'a'
+        del self.model[0]
+        self.assertEqual(self.changes, [(5, 0, 5, 0)])
+
+
+class ObjectListAdapterBlockTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.model = ObservableListProxy()
+        for i in range(0, 5):
+            o = TestObject()
+            o.x = u'x{0}'.format(i)
+            self.model.append(o)
+
+        self.adapter = ObjectListAdapter(
+            (('x', {'flags': {Qt.ItemIsEnabled: True,
+                Qt.ItemIsEditable: True}}),
+            ('y', {'parser': int}), 'z'),
+            self.model,
+            TestObject)
+        self.adapter.dataChanged.connect(self.dataChangedSlot)
+        self.changes = []
+
+    def dataChangedSlot(self, topLeft, bottomRight):
+        self.changes.append((topLeft.row(), topLeft.column(),
+            bottomRight.row(), bottomRight.column()))
+
+    def test_block(self):
+        self.assertTrue(self.adapter.setDataBlock(self.adapter.index(1, 0),
+            [[u'a', u'1'], [u'b ', u'2'], [u'', u'3']]))
+        self.assertEqual(self.changes, [(1, 0, 3, 1)])
+        self.assertEqual([(o.x, o.y) for o in self.model[1:4]],
+            [(u'a', 1), (u'b', 2), (None, 3)])
+
+    def test_outside(self):
+        self.assertFalse(self.adapter.setDataBlock(self.adapter.index(4, 2),
+            [[u'a', u'b'], [u'c', u'd']]))
+        self.assertEqual(self.model[4].z, u'a')
+        self.assertEqual(self.changes, [(4, 2, 4, 2)])
+
+    def test_not_editable(self):
+        # x isn't editable by the class metadata
+        adapter = ObjectListAdapter(('x', 'y'), self.model, TestObject)
+        self.assertFalse(adapter.setDataBlock(adapter.index(0, 0),
+            [[u'a', u'b']]))
+        self.assertEqual((self.model[0].x, self.model[0].y), (u'x0', u'b'))
+
+    def test_placeholder(self):
+        model = ObservableListProxy()
+        adapter = ObjectListAdapter(('x', 'y'), model, TestObject,
+            options=set(['edit', 'append']))
+        self.assertTrue(adapter.isPlaceholder(adapter.index(0, 0)))
+        self.assertFalse(adapter.setDataBlock(adapter.index(0, 0),
+            [[u'a', u'b']]))
+        self.assertEqual(len(model), 0)
+
+
+class ObjectListAdapterSortTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.model = ObservableListProxy()
+        for x, y in ((u'b', 2), (u'a', None), (u'b', 1), (None, 3)):
+            o = TestObject()
+            o.x = x
+            o.y = y
+            self.model.append(o)
+
+        self.adapter = ObjectListAdapter(
+            ('x', 'y'),
+            self.model,
+            TestObject, options=set(['edit', 'append', 'sortmodel']))
+        self.adapter.layoutChanged.connect(self.layoutChangedSlot)
+        self.adapter.dataChanged.connect(self.dataChangedSlot)
+        self.layouts = 0
+        self.changes = []
+
+    def layoutChangedSlot(self):
+        self.layouts += 1
+
+    def dataChangedSlot(self, topLeft, bottomRight):
+        self.changes.append((topLeft.row(), topLeft.column()))
+
+    def test_sort(self):
+        self.adapter.sort(1)
+        self.assertEqual([o.y for o in self.model], [None, 1, 2, 3])
+        self.assertEqual(self.layouts, 1)
+        self.adapter.sort(1, Qt.DescendingOrder)
+        self.assertEqual([o.y for o in self.model], [3, 2, 1, None])
+        # Items notify their new rows
+        self.model[0].x = u'z'
+        self.assertEqual(self.changes, [(0, 0)])
+
+    def test_multiple_columns(self):
+        self.adapter.sortByColumns([(0, Qt.DescendingOrder),
+            (1, Qt.AscendingOrder)], NoneOrdering.LAST)
+        self.assertEqual([(o.x, o.y) for o in self.model],
+            [(None, 3), (u'b', 1), (u'b', 2), (u'a', None)])
+        self.assertEqual(self.layouts, 1)
+
+    def test_value_list(self):
+        model = [3, None, 1, 2]
+        adapter = ValueListAdapter(model, options=set(['sortmodel']))
+        adapter.sort(0)
+        self.assertEqual(model, [None, 1, 2, 3])
+
+    def test_model_untouched(self):
+        # The model list is only sorted if the adapter options say so
+        adapter = ObjectListAdapter(('x', 'y'), self.model, TestObject)
+        adapter.sort(1)
+        self.assertFalse(adapter.sortByColumns([(1, Qt.AscendingOrder)]))
+        self.assertFalse(adapter.applyOrder([3, 2, 1, 0]))
+        self.assertEqual([o.y for o in self.model], [2, None, 1, 3])
+        self.assertEqual(self.layouts, 0)
+
+
+class ObjectListAdapterThrottleTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.model = ObservableListProxy()
+        for i in range(0, 10):
+            o = TestObject()
+            o.x = u'x{0}'.format(i)
+            self.model.append(o)
+
+        # One refresh each 1000 seconds
+        self.adapter = ObjectListAdapter(
+            (('x', {'refreshHz': 0.001}), 'y', 'z'),
+            self.model,
+            TestObject, options=set(['edit']))
+        self.adapter.dataChanged.connect(self.dataChangedSlot)
+        self.changes = []
+
+    def dataChangedSlot(self, topLeft, bottomRight):
+        self.changes.append((topLeft.row(), topLeft.column(),
+            bottomRight.row(), bottomRight.column()))
+
+    def test_throttle(self):
+        self.model[5].x = u'a'
+        self.model[5].x = u'b'
+        self.model[5].x = u'c'
+        self.model[6].x = u'd'
+        self.model[5].y = u'e'
+        self.assertEqual(self.changes,
+            [(5, 0, 5, 0), (6, 0, 6, 0), (5, 1, 5, 1)])
+
+    def test_row_throttle(self):
+        self.adapter.dataChanged.disconnect(self.dataChangedSlot)
+        adapter = ObjectListAdapter(('x', 'y', 'z'), self.model, TestObject,
+            row_meta={'refreshHz': 0.001}, options=set(['edit']))
+        adapter.dataChanged.connect(self.dataChangedSlot)
+        self.model[2].y = u'a'
+        self.model[2].z = u'b'
+        self.assertEqual(self.changes, [(2, 0, 2, 2)])
+
+    def test_insert(self):
+        self.model[5].x = u'a'
+        self.model[5].x = u'b'
+        self.assertEqual(self.changes, [(5, 0, 5, 0)])
+        # The throttled change is emitted before the rows move
+        self.model.insert(0, TestObject())
+        self.assertEqual(self.changes, [(5, 0, 5, 0), (5, 0, 5, 0)])
+        # Rows after the inserted one are renumbered
+        self.model[7].y = u'c'
+        self.assertEqual(self.changes[-1], (7, 1, 7, 1))
+
+    def test_purge(self):
+        self.adapter._refresh_limit = 2
+        for row in range(0, 3):
+            self.model[row].x = u'a'
+        self.assertEqual(len(self.changes), 3)
+        # Only expired refresh times are purged
+        self.model[0].x = u'b'
+        self.assertEqual(len(self.changes), 3)
+
+    def test_set_model(self):
+        self.model[5].x = u'a'
+        self.model[5].x = u'b'
+        model = ObservableListProxy(self.model[0:2])
+        self.adapter.setPyModel(model)
+        self.assertFalse(self.adapter._throttle_timer.isActive())
+        # Nothing left for rows of the old model
+        self.adapter.flushChanges()
+        self.assertEqual(self.changes, [(5, 0, 5, 0)])
+        model[1].x = u'c'
+        self.assertEqual(self.changes[-1], (1, 0, 1, 0))
+
+
+class ObjectListAdapterRingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.model = ObservableRingList(5)
+        self.adapter = ObjectListAdapter(
+            ('x', 'y', 'z'),
+            self.model,
+            TestObject, options=set(['edit']))
+        self.adapter.dataChanged.connect(self.dataChangedSlot)
+        self.changes = []
+
+    def dataChangedSlot(self, topLeft, bottomRight):
+        self.changes.append((topLeft.row(), topLeft.column()))
+
+    def test_ring(self):
+        for i in range(0, 8):
+            o = TestObject()
+            o.x = i
+            self.model.append(o)
+        self.assertEqual(self.adapter.rowCount(), 5)
+        for row in range(0, 5):
+            self.assertEqual(self.adapter.data(self.adapter.index(row, 0),
+                PythonObjectRole), row + 3)
+        self.model[2].y = u'a'
+        self.assertEqual(self.changes, [(2, 1)])
+        self.model.extend([TestObject(), TestObject()])
+        self.model[0].y = u'b'
+        self.assertEqual(self.changes, [(2, 1), (0, 1)])
+        self.assertEqual(self.adapter.rowCount(), 5)
+
+
+class ObjectListAdapterFetchTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.model = ObservableListProxy()
+        for i in range(0, 250):
+            o = TestObject()
+            o.x = u'x{0}'.format(i)
+            self.model.append(o)
+
+        self.adapter = ObjectListAdapter(
+            ('x', 'y', 'z'),
+            self.model,
+            TestObject, options=set(['edit', 'fetch']))
+
+    def test_fetch(self):
+        self.assertEqual(self.adapter.rowCount(), 0)
+        self.assertTrue(self.adapter.canFetchMore())
+        self.adapter.fetchMore()
+        self.assertEqual(self.adapter.rowCount(), ObjectListAdapter.FETCH_SIZE)
+        self.assertFalse(self.adapter.index(ObjectListAdapter.FETCH_SIZE,
+            0).isValid())
+        while self.adapter.canFetchMore():
+            self.adapter.fetchMore()
+        self.assertEqual(self.adapter.rowCount(), 250)
+        self.assertEqual(self.adapter.data(self.adapter.index(249, 0)),
+            u'x249')
+
+    def test_observe_fetched_only(self):
+        self.adapter.fetchMore()
+        self.assertRaises(KeyError, self.model[-1].get_callback_data,
+            self.adapter.observe_item)
+        self.assertEqual(
+            self.model[0].get_callback_data(self.adapter.observe_item), 0)
+
+    def test_append_unfetched(self):
+        self.adapter.fetchMore()
+        self.model.append(TestObject())
+        self.assertEqual(self.adapter.rowCount(), ObjectListAdapter.FETCH_SIZE)
+        del self.model[0]
+        self.assertEqual(self.adapter.rowCount(),
+            ObjectListAdapter.FETCH_SIZE - 1)
+        self.model.insert(150, TestObject())
+        self.assertEqual(self.adapter.rowCount(), 151)
+
+
+class ObjectListAdapterExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.model = ObservableListProxy()
+        for i in range(0, 3):
+            o = TestObject()
+            o.x = u'x{0}'.format(i)
+            o.y = i
+            self.model.append(o)
+
+    def test_csv(self):
+        # Unfetched rows are exported too
+        adapter = ObjectListAdapter(('x', 'y'), self.model, TestObject,
+            options=set(['fetch']))
+        f = StringIO()
+        adapter.export(f)
+        self.assertEqual(f.getvalue().splitlines(),
+            ['X,Y', 'x0,0', 'x1,1', 'x2,2'])
+
+    def test_jsonl(self):
+        adapter = ObjectListAdapter(('x', 'y'), self.model, TestObject)
+        f = StringIO()
+        adapter.export(f, 'jsonl', (Qt.DisplayRole, PythonObjectRole))
+        lines = [json.loads(line) for line in f.getvalue().splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual(lines[2],
+            {u'X': {u'display': u'x2', u'value': u'x2'},
+            u'Y': {u'display': u'2', u'value': 2}})
+
+    def test_parallel(self):
+        adapter = ObjectListAdapter(('x', 'y'), self.model, TestObject)
+        f = StringIO()
+        adapter.export(f, workers=2)
+        self.assertEqual(f.getvalue().splitlines(),
+            ['X,Y', 'x0,0', 'x1,1', 'x2,2'])
+
+    def test_roles(self):
+        # Roles without a projection name are skipped
+        adapter = ObjectListAdapter(('x', 'y'), self.model, TestObject)
+        f = StringIO()
+        adapter.export(f, roles=(Qt.DisplayRole, Qt.SizeHintRole))
+        self.assertEqual(f.getvalue().splitlines(),
+            ['X,Y', 'x0,0', 'x1,1', 'x2,2'])
+
+    def test_value_list(self):
+        adapter = ValueListAdapter(ObservableListProxy([u'a', u'b', u'c']),
+            column_meta=[{'title': u'Letter'}],
+            options=set(['edit', 'append', 'fetch']))
+        adapter.FETCH_SIZE = 1
+        adapter.fetchMore(QtCore.QModelIndex())
+        self.assertEqual(adapter.rowCount(), 1)
+        f = StringIO()
+        adapter.export(f)
+        self.assertEqual(f.getvalue().splitlines(),
+            ['Letter', 'a', 'b', 'c'])
+        adapter = ValueListAdapter(ObservableListProxy())
+        f = StringIO()
+        adapter.export(f)
+        self.assertEqual(f.getvalue().splitlines(), ['""'])
+
+    def test_columnar(self):
+        adapter = ColumnarAdapter(('x', 'y'), {'x': [1.5, 2.5], 'y': [1, 2]})
+        f = StringIO()
+        adapter.export(f)
+        self.assertEqual(f.getvalue().splitlines(),
+            ['X,Y', '1.5,1', '2.5,2'])
+
+
+class ObjectListAdapterDragTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        self.model = ObservableListProxy()
+        for i in range(0, 3):
+            o = TestObject()
+            o.x = u'x{0}'.format(i)
+            self.model.append(o)
+        self.adapter = ObjectListAdapter(('x', 'y'), self.model, TestObject)
+
+    def test_in_process(self):
+        mime = self.adapter.mimeData([self.adapter.index(0, 0),
+            self.adapter.index(2, 0)])
+        self.assertTrue(mime.hasFormat('application/qonda.pyobject'))
+        objects = mime_objects(mime)
+        self.assertTrue(objects[0] is self.model[0])
+        self.assertTrue(objects[1] is self.model[2])
+
+    def test_ref(self):
+        mime = self.adapter.mimeData([self.adapter.index(1, 0)])
+        # As seen by a target getting a plain QMimeData
+        other = QtCore.QMimeData()
+        other.setData(QondaMimeData.REF_FORMAT,
+            mime.data(QondaMimeData.REF_FORMAT))
+        self.assertTrue(mime_objects(other)[0] is self.model[1])
+
+    def test_external(self):
+        # Observed objects can't be pickled, drag references instead
+        adapter = ObjectListAdapter((('x', {'mime': lambda o: o.x}), 'y'),
+            self.model, TestObject)
+        mime = adapter.mimeData([adapter.index(0, 0), adapter.index(1, 0)])
+        self.assertEqual(mime.text(), u'x0\nx1')
+        other = QtCore.QMimeData()
+        other.setData('application/qonda.pyobject',
+            mime.data('application/qonda.pyobject'))
+        self.assertEqual(mime_objects(other), [u'x0', u'x1'])
+
+    def test_binary_pickle(self):
+        adapter = ObjectListAdapter((('x', {'mime':
+            lambda o: b'\xff\x00' + o.x.encode('ascii')}), 'y'),
+            self.model, TestObject)
+        mime = adapter.mimeData([adapter.index(2, 0)])
+        data = mime.data('application/qonda.pyobject')
+        self.assertTrue(isinstance(data, QtCore.QByteArray))
+        other = QtCore.QMimeData()
+        other.setData('application/qonda.pyobject', data)
+        self.assertEqual(mime_objects(other), [b'\xff\x00x2'])
+
+    def test_removed_rows(self):
+        # Indexes of removed rows become invalid
+        mime = QondaMimeData(self.adapter, [self.adapter.index(0, 0),
+            QtCore.QModelIndex()], [self.model[0], None])
+        self.assertEqual(mime.text(), u'x0')
+
+
+class ColumnarAdapterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.model = {
+            'x': [float(i) for i in range(0, 1000)],
+            'y': [i * 2 for i in range(0, 1000)],
+            }
+        self.adapter = ColumnarAdapter(
+            ('x', ('y', {
+                'displayFormatter': lambda v: u'#{0}'.format(v),
+                'alignment': Qt.AlignRight,
+                'flags': {
+                    Qt.ItemIsEnabled: lambda o: o.y > 10
+                    }
+                })),
+            self.model,
+            TestObject)
+
+    def test_rows_columns(self):
+        self.assertEqual(self.adapter.rowCount(), 1000)
+        self.assertEqual(self.adapter.columnCount(), 2)
+        self.assertFalse(self.adapter.index(1000, 0).isValid())
+        self.assertFalse(self.adapter.index(0, 2).isValid())
+
+    def test_data(self):
+        index = self.adapter.index(500, 0)
+        self.assertEqual(self.adapter.data(index), u'500.0')
+        self.assertEqual(self.adapter.data(index, PythonObjectRole), 500.0)
+        index = self.adapter.index(999, 1)
+        self.assertEqual(self.adapter.data(index), u'#1998')
+        self.assertEqual(self.adapter.data(index, Qt.EditRole), u'1998')
+        self.assertEqual(self.adapter.data(index, Qt.TextAlignmentRole),
+            Qt.AlignRight)
+        self.assertEqual(self.adapter.getPyObject(index).x, 999.0)
+
+    def test_flags(self):
+        self.assertEqual(self.adapter.flags(self.adapter.index(1, 1)),
+            Qt.NoItemFlags)
+        self.assertEqual(self.adapter.flags(self.adapter.index(6, 1)),
+            Qt.ItemIsEnabled)
+
+    def test_setData(self):
+        index = self.adapter.index(3, 0)
+        self.adapter.data(index)
+        self.assertTrue(self.adapter.setData(index, 42.5, PythonObjectRole))
+        self.assertEqual(self.adapter.data(index), u'42.5')
+        self.assertFalse(self.adapter.setData(index, u'text',
+            PythonObjectRole))
+
+    def test_block_formatter(self):
+        blocks = []
+
+        def block_formatter(values):
+            blocks.append(len(values))
+            return [u'<{0}>'.format(v) for v in values]
+
+        adapter = ColumnarAdapter(
+            (('x', {'blockFormatter': block_formatter}), 'y'),
+            self.model)
+        for row in range(0, 300):
+            adapter.data(adapter.index(row, 0))
+        self.assertEqual(adapter.data(adapter.index(299, 0)), u'<299.0>')
+        self.assertEqual(blocks,
+            [ColumnarAdapter.BLOCK_SIZE, ColumnarAdapter.BLOCK_SIZE])
+
+    @unittest.skipIf(numpy is None, 'NumPy is not available')
+    def test_numpy_columns(self):
+        adapter = ColumnarAdapter(('name', 'count'),
+            {'name': [u'a', u'bb'], 'count': [1, 2]})
+        index = adapter.index(0, 0)
+        self.assertTrue(adapter.setData(index, u'a longer name',
+            PythonObjectRole))
+        self.assertEqual(adapter.data(index), u'a longer name')
+        index = adapter.index(1, 1)
+        self.assertEqual(adapter.data(adapter.index(0, 1)), u'1')
+        self.assertTrue(adapter.setData(index, 2.5, PythonObjectRole))
+        self.assertEqual(adapter.data(index, PythonObjectRole), 2.5)
+        self.assertEqual(adapter.data(adapter.index(0, 1)), u'1.0')
+        self.assertFalse(adapter.setData(index, u'3', PythonObjectRole))
+        self.assertEqual(adapter.data(index, PythonObjectRole), 2.5)
+
+
+class SnapshotAdapterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.model = ObservableListProxy()
+        for i in range(0, 5):
+            o = TestObject()
+            o.x = u'x{0}'.format(i)
+            o.y = i
+            self.model.append(o)
+        self.adapter = SnapshotAdapter(
+            ('x', ('y', {
+                'displayFormatter': lambda v: u'#{0}'.format(v),
+                'flags': {
+                    Qt.ItemIsEnabled: lambda o: o.y > 2,
+                    Qt.ItemIsEditable: True
+                    }
+                })),
+            self.model,
+            TestObject)
+
+    def test_rows_columns(self):
+        self.assertEqual(self.adapter.rowCount(), 5)
+        self.assertEqual(self.adapter.columnCount(), 2)
+        self.assertFalse(self.adapter.index(5, 0).isValid())
+
+    def test_data(self):
+        index = self.adapter.index(3, 1)
+        self.assertEqual(self.adapter.data(index), u'#3')
+        self.assertEqual(self.adapter.data(index, PythonObjectRole), 3)
+        self.assertEqual(self.adapter.data(index, Qt.TextAlignmentRole),
+            Qt.AlignCenter)
+        self.assertEqual(self.adapter.data(index, Qt.EditRole), None)
+        self.assertTrue(self.adapter.getPyObject(index) is self.model[3])
+
+    def test_flags(self):
+        self.assertEqual(self.adapter.flags(self.adapter.index(1, 1)),
+            Qt.NoItemFlags)
+        self.assertEqual(self.adapter.flags(self.adapter.index(4, 1)),
+            Qt.ItemIsEnabled)
+
+    def test_frozen(self):
+        self.model[0].x = u'changed'
+        self.model.append(TestObject())
+        self.assertEqual(self.adapter.rowCount(), 5)
+        self.assertEqual(self.adapter.data(self.adapter.index(0, 0)), u'x0')
+
+    def test_from_adapter(self):
+        adapter = ObjectListAdapter(('x', 'y'), self.model, TestObject)
+        snapshot = SnapshotAdapter.fromAdapter(adapter)
+        self.assertEqual(snapshot.data(snapshot.index(2, 0)), u'x2')
+        self.assertEqual(snapshot.data(snapshot.index(2, 1),
+            Qt.TextAlignmentRole), Qt.AlignCenter)
+        values = ValueListAdapter(ObservableListProxy([3, 1, 2]),
+            column_meta=[{'displayFormatter': lambda v: u'#{0}'.format(v)}])
+        snapshot = SnapshotAdapter.fromAdapter(values)
+        self.assertEqual(snapshot.data(snapshot.index(1, 0)), u'#1')
+        self.assertEqual(snapshot.data(snapshot.index(1, 0),
+            PythonObjectRole), 1)
+
+    def test_other_roles(self):
+        adapter = SnapshotAdapter(('x', ('y', {'width': 8})), self.model,
+            TestObject, roles=(Qt.DisplayRole, Qt.SizeHintRole))
+        self.assertEqual(adapter.data(adapter.index(2, 0)), u'x2')
+        self.assertEqual(adapter.data(adapter.index(2, 0), Qt.SizeHintRole),
+            None)
+
+    def test_compute_snapshot(self):
+        model = [self.model[4], self.model[0]]
+        self.adapter.setSnapshot(model, self.adapter.computeSnapshot(model))
+        self.assertEqual(self.adapter.rowCount(), 2)
+        self.assertEqual(self.adapter.data(self.adapter.index(1, 1)), u'#0')
+
+
 class ObjectTreeAdapterTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -711,6 +1306,79 @@ class ObjectTreeAdapterTestCase(unittest.TestCase):
 
         test_level(self.model, QtCore.QModelIndex())
 
+    def test_parent(self):
+
+        def check_parents(submodel, parent):
+            for row in range(0, len(submodel)):
+                index = self.adapter.index(row, 0, parent)
+                self.assertEqual(self.adapter.parent(index), parent)
+                self.assertEqual(self.adapter.item_index(submodel[row]).row(),
+                    row)
+
+        submodel = self.model[0].children
+        parent = self.adapter.index(0, 0)
+        check_parents(submodel, parent)
+        o = TestObject()
+        o.parent = self.model[0]
+        submodel.insert(0, o)
+        check_parents(submodel, parent)
+        o = TestObject()
+        o.parent = self.model[0]
+        submodel.append(o)
+        check_parents(submodel, parent)
+        del submodel[3]
+        check_parents(submodel, parent)
+
+    def test_position_cache(self):
+        submodel = self.model[0].children
+        parent = self.adapter.index(0, 0)
+        self.adapter.parent(self.adapter.index(0, 0, parent))
+        self.adapter.item_index(submodel[0])
+        builds = []
+        build_positions = self.adapter._build_positions
+        self.adapter._build_positions = lambda children: \
+            builds.append(children) or build_positions(children)
+
+        o = TestObject()
+        o.parent = self.model[0]
+        submodel.insert(1, o)
+        del submodel[4]
+        o = TestObject()
+        o.parent = self.model[0]
+        submodel[2:4] = [o]
+        submodel.sort(key=lambda item: item.x, reverse=True)
+        for row in range(0, len(submodel)):
+            self.assertEqual(self.adapter.item_index(submodel[row]).row(),
+                row)
+            self.assertEqual(self.adapter.parent(
+                self.adapter.index(row, 0, parent)), parent)
+        self.assertEqual(builds, [])
+        self.adapter._build_positions = build_positions
+
+        # The cache doesn't keep the lists alive
+        children = ObservableListProxy([TestObject()])
+        self.adapter._item_row(children, children[0])
+        ref = weakref.ref(children)
+        del children
+        self.assertTrue(ref() is None)
+
+    def test_sort(self):
+        changes = []
+        self.adapter.dataChanged.connect(lambda topLeft, bottomRight:
+            changes.append((topLeft.row(), topLeft.parent().row())))
+        submodel = self.model[1].children
+        submodel.sort(key=lambda o: o.x, reverse=True)
+        parent = self.adapter.index(1, 0)
+        for row in range(0, len(submodel)):
+            self.assertEqual(self.adapter.data(self.adapter.index(row, 0,
+                parent)), submodel[row].x)
+        submodel[0].y = u'changed'
+        self.assertEqual(changes, [(0, 1)])
+        self.assertEqual(self.adapter.item_index(submodel[2]).row(), 2)
+        # Grandchildren still notify their parent row
+        submodel[0].children[0].x = u'changed'
+        self.assertEqual(changes[-1], (0, 0))
+
     def test_insertRows(self):
 
         def test_level(submodel, parent):
@@ -927,5 +1595,321 @@ class ObjectTreeAdapterTestCase(unittest.TestCase):
                     pass
 
 
+
+class ObjectTreeAdapterFetchTestCase(unittest.TestCase):
+
+    def setUp(self):
+
+        def build_level(level, parent):
+            model = ObservableListProxy()
+            for i in range(0, 3):
+                o = TestObject()
+                o.parent = parent
+                o.x = u'x{0}{1}'.format(level, i)
+                model.append(o)
+                o.children = (build_level(level + 1, o) if level < 2
+                    else ObservableListProxy())
+            return model
+
+        self.model = build_level(0, None)
+
+        self.adapter = ObjectTreeAdapter(
+            ('x', 'y', 'z'),
+            self.model,
+            TestObject, rootless=True,
+            options=set(['edit', 'fetch']))
+
+    def test_fetch(self):
+        root = QtCore.QModelIndex()
+        self.assertEqual(self.adapter.rowCount(root), 3)
+        self.assertFalse(self.adapter.canFetchMore(root))
+        parent = self.adapter.index(1, 0, root)
+        self.assertEqual(self.adapter.rowCount(parent), 0)
+        self.assertTrue(self.adapter.hasChildren(parent))
+        self.assertTrue(self.adapter.canFetchMore(parent))
+        self.assertRaises(KeyError, self.model[1].children.get_callback_data,
+            self.adapter.observe)
+
+        self.adapter.fetchMore(parent)
+        self.assertEqual(self.adapter.rowCount(parent), 3)
+        self.assertFalse(self.adapter.canFetchMore(parent))
+        self.model[1].children.get_callback_data(self.adapter.observe)
+        self.assertRaises(KeyError,
+            self.model[1].children[0].children.get_callback_data,
+            self.adapter.observe)
+        index = self.adapter.index(2, 0, parent)
+        self.assertEqual(self.adapter.data(index), u'x12')
+        self.assertEqual(self.adapter.parent(index), parent)
+
+    def test_leaf(self):
+        parent = self.adapter.index(0, 0, QtCore.QModelIndex())
+        self.adapter.fetchMore(parent)
+        parent = self.adapter.index(0, 0, parent)
+        self.adapter.fetchMore(parent)
+        leaf = self.adapter.index(0, 0, parent)
+        self.assertFalse(self.adapter.hasChildren(leaf))
+
+    def test_export(self):
+        # Nodes not fetched are exported, placeholder rows aren't
+        adapter = ObjectTreeAdapter(('x',), self.model, TestObject,
+            rootless=True, options=set(['edit', 'append', 'fetch']))
+        f = StringIO()
+        adapter.export(f)
+        lines = f.getvalue().splitlines()
+        self.assertEqual(len(lines), 1 + 3 + 9 + 27)
+        self.assertEqual(lines[:6], ['X', 'x00', 'x10', 'x20', 'x21', 'x22'])
+
+    def test_has_children(self):
+        adapter = ObjectTreeAdapter(('x', 'y', 'z'), self.model, TestObject,
+            rootless=True, options=set(['edit', 'append']))
+        parent = adapter.index(0, 0, adapter.index(0, 0))
+        leaf = adapter.index(0, 0, parent)
+        self.assertTrue(adapter.hasChildren(parent))
+        # The placeholder row can be reached to add a first child
+        self.assertTrue(adapter.hasChildren(leaf))
+        self.assertFalse(adapter.hasChildren(adapter.index(0, 0, leaf)))
+
+    def test_has_children_fetch(self):
+        adapter = ObjectTreeAdapter(('x', 'y', 'z'), self.model, TestObject,
+            rootless=True, options=set(['edit', 'append', 'fetch']))
+        top = adapter.index(0, 0)
+        adapter.fetchMore(top)
+        parent = adapter.index(0, 0, top)
+        adapter.fetchMore(parent)
+        leaf = adapter.index(0, 0, parent)
+        self.assertTrue(adapter.hasChildren(parent))
+        adapter.fetchMore(leaf)
+        # The placeholder row is not a child
+        self.assertEqual(adapter.rowCount(leaf), 1)
+        self.assertFalse(adapter.hasChildren(leaf))
+        self.assertFalse(adapter.hasChildren(adapter.index(0, 0, leaf)))
+
+    def test_has_children_hint(self):
+        adapter = ObjectTreeAdapter(('x', 'y', 'z'), self.model, TestObject,
+            row_meta={'hasChildren': lambda item: item.x != u'x01'},
+            rootless=True, options=set(['edit', 'fetch']))
+        self.assertTrue(adapter.hasChildren(adapter.index(0, 0)))
+        self.assertFalse(adapter.hasChildren(adapter.index(1, 0)))
+
+
+class Sale(ObservableObject):
+
+    _notifiables_ = ('region', 'product', 'amount')
+
+    def __init__(self, region, product, amount):
+        super(Sale, self).__init__()
+        self.region = region
+        self.product = product
+        self.amount = amount
+
+
+class GroupingAdapterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.model = ObservableListProxy([Sale(region, product, amount)
+            for region, product, amount in (
+                (u'north', u'apples', 10),
+                (u'south', u'apples', 5),
+                (u'north', u'pears', 7),
+                (u'north', u'apples', 1))])
+        self.adapter = GroupingAdapter(('product', 'region', 'amount'),
+            self.model, group_by=('region', 'product'),
+            aggregates={'amount': 'sum', 'region': 'count'})
+        self.adapter.dataChanged.connect(self.dataChangedSlot)
+        self.changes = []
+
+    def dataChangedSlot(self, topLeft, bottomRight):
+        self.changes.append((self.adapter.data(topLeft),
+            topLeft.column()))
+
+    def tree(self, parent=QtCore.QModelIndex()):
+        """Returns the tree as nested (display, count or children) lists"""
+        adapter = self.adapter
+        rows = []
+        for row in range(adapter.rowCount(parent)):
+            index = adapter.index(row, 0, parent)
+            self.assertEqual(adapter.parent(index), parent)
+            if adapter.isGroup(index):
+                rows.append((adapter.data(index),
+                    adapter.data(adapter.index(row, 2, parent)),
+                    self.tree(index)))
+            else:
+                rows.append(adapter.data(adapter.index(row, 2, parent)))
+        return rows
+
+    def test_groups(self):
+        self.assertEqual(self.tree(), [
+            (u'north', u'18', [(u'apples', u'11', [u'10', u'1']),
+                (u'pears', u'7', [u'7'])]),
+            (u'south', u'5', [(u'apples', u'5', [u'5'])])])
+        north = self.adapter.index(0, 0)
+        self.assertEqual(self.adapter.data(self.adapter.index(0, 1)), u'3')
+        self.assertEqual(self.adapter.data(north, PythonObjectRole), u'north')
+        self.assertEqual(list(self.adapter.getPyObject(north).items()),
+            [self.model[0], self.model[3], self.model[2]])
+
+    def test_move(self):
+        moved = []
+        removed = []
+        self.adapter.rowsMoved.connect(lambda parent, first, last,
+            destination, row: moved.append((first, last, row)))
+        self.adapter.rowsRemoved.connect(lambda parent, first, last:
+            removed.append((first, last)))
+        self.model[3].product = u'pears'
+        self.assertEqual(moved, [(1, 1, 1)])
+        self.model[1].region = u'north'
+        self.assertEqual(self.tree(), [
+            (u'north', u'23', [(u'apples', u'15', [u'10', u'5']),
+                (u'pears', u'8', [u'7', u'1'])])])
+        self.assertEqual(removed[-1:], [(1, 1)])
+
+    def test_remove(self):
+        parents = []
+
+        def rowsAboutToBeRemoved(parent, first, last):
+            index = self.adapter.index(first, 0, parent)
+            parents.append(self.adapter.parent(index) == parent)
+        self.adapter.rowsAboutToBeRemoved.connect(rowsAboutToBeRemoved)
+        del self.model[3]
+        self.assertEqual(parents, [True])
+        self.model[-1] = Sale(u'south', u'pears', 2)
+        self.assertEqual(self.tree(), [
+            (u'north', u'10', [(u'apples', u'10', [u'10'])]),
+            (u'south', u'7', [(u'apples', u'5', [u'5']),
+                (u'pears', u'2', [u'2'])])])
+
+    def test_repeated_item(self):
+        sale = self.model[0]
+        self.model.append(sale)
+        sale.amount = 12
+        self.assertEqual(self.tree()[0][:2], (u'north', u'32'))
+        self.assertEqual(self.tree()[0][2][0], (u'apples', u'25',
+            [u'12', u'1', u'12']))
+        del self.model[0]
+        sale.amount = 3
+        self.assertEqual(self.tree()[0][2][0], (u'apples', u'4',
+            [u'3', u'1']))
+        sale.region = u'south'
+        self.assertEqual(self.tree()[1], (u'south', u'8',
+            [(u'apples', u'8', [u'5', u'3'])]))
+        del self.model[-1]
+        self.assertEqual(self.tree()[1], (u'south', u'5',
+            [(u'apples', u'5', [u'5'])]))
+        sale.amount = 1
+        self.assertEqual(self.tree()[1][1], u'5')
+
+    def test_aggregate_update(self):
+        self.model[2].amount = 9
+        self.assertEqual(self.tree()[0][:2], (u'north', u'20'))
+        self.assertIn((u'9', 2), self.changes)
+        self.assertIn((u'20', 2), self.changes)
+
+    def test_list_events(self):
+        self.model.append(Sale(u'east', u'figs', 2))
+        self.model.extend([Sale(u'east', u'figs', 3),
+            Sale(u'south', u'pears', 4)])
+        del self.model[0:3]
+        self.model[0] = Sale(u'west', u'figs', 6)
+        # Groups keep their place
+        self.assertEqual(self.tree(), [
+            (u'south', u'4', [(u'pears', u'4', [u'4'])]),
+            (u'east', u'5', [(u'figs', u'5', [u'2', u'3'])]),
+            (u'west', u'6', [(u'figs', u'6', [u'6'])])])
+        self.adapter.setPyModel(ObservableListProxy())
+        self.assertEqual(self.tree(), [])
+
+
+class PivotAdapterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.model = ObservableListProxy([Sale(region, product, amount)
+            for region, product, amount in (
+                (u'north', u'apples', 10),
+                (u'south', u'apples', 5),
+                (u'north', u'pears', 7),
+                (u'north', u'apples', 1))])
+        self.adapter = self.pivot('sum')
+
+    def pivot(self, aggregate, options=None):
+        return PivotAdapter(self.model, row_by='region', column_by='product',
+            value='amount', aggregate=aggregate, options=options)
+
+    def table(self, adapter=None):
+        """Returns the pivot as a dict row key -> list of cell texts"""
+        adapter = adapter or self.adapter
+        return dict((adapter.headerData(row, Qt.Vertical, Qt.DisplayRole),
+            [adapter.data(adapter.index(row, column))
+                for column in range(adapter.columnCount())])
+            for row in range(adapter.rowCount()))
+
+    def test_aggregates(self):
+        self.assertEqual(self.adapter.columnKeys(), [u'apples', u'pears'])
+        self.assertEqual(self.table(), {u'north': [u'11', u'7'],
+            u'south': [u'5', u'']})
+        self.assertEqual(self.table(self.pivot('count')),
+            {u'north': [u'2', u'1'], u'south': [u'1', u'']})
+        self.assertEqual(self.table(self.pivot('max')),
+            {u'north': [u'10', u'7'], u'south': [u'5', u'']})
+        self.assertEqual(self.pivot('avg').cellValue(u'north', u'apples'),
+            5.5)
+
+    def test_update(self):
+        adapter = self.pivot('max')
+        changes = []
+        adapter.dataChanged.connect(lambda tl, br: changes.append(
+            (tl.row(), tl.column(), br.row(), br.column())))
+        self.model[0].amount = 2
+        self.assertEqual(adapter.cellValue(u'north', u'apples'), 2)
+        self.assertEqual(changes, [(0, 0, 0, 0)])
+        # Moves to a new column, the row and column of pears kept
+        columns = []
+        adapter.columnsInserted.connect(lambda parent, first, last:
+            columns.append(('inserted', first, last)))
+        adapter.columnsRemoved.connect(lambda parent, first, last:
+            columns.append(('removed', first, last)))
+        self.model[2].product = u'figs'
+        self.assertEqual(columns, [('inserted', 2, 2), ('removed', 1, 1)])
+        self.assertEqual(self.table(adapter), {u'north': [u'2', u'7'],
+            u'south': [u'5', u'']})
+
+    def test_list_events(self):
+        self.model.append(Sale(u'east', u'figs', 2))
+        del self.model[0:3]
+        self.model[0] = Sale(u'west', u'figs', 6)
+        self.assertEqual(self.adapter.rowKeys(), [u'east', u'west'])
+        self.assertEqual(self.adapter.columnKeys(), [u'figs'])
+        self.assertEqual(self.table(), {u'east': [u'2'], u'west': [u'6']})
+        self.model[-1] = Sale(u'west', u'figs', 4)
+        self.assertEqual(self.table(), {u'west': [u'10']})
+
+    def test_repeated_item(self):
+        sale = Sale(u'east', u'figs', 5)
+        self.model[:] = [sale, sale]
+        adapter = self.pivot('max')
+        sale.amount = 7
+        self.assertEqual(self.table(), {u'east': [u'14']})
+        self.assertEqual(adapter.cellValue(u'east', u'figs'), 7)
+        del self.model[0]
+        self.assertEqual(self.table(), {u'east': [u'7']})
+        sale.product = u'kiwis'
+        self.assertEqual(self.table(), {u'east': [u'7']})
+        self.assertEqual(self.adapter.columnKeys(), [u'kiwis'])
+        del self.model[0]
+        self.assertEqual(self.adapter.rowCount(), 0)
+        self.assertEqual(self.adapter.cellValue(u'east', u'kiwis'), None)
+        self.assertEqual(adapter.cellValue(u'east', u'kiwis'), None)
+
+    def test_sorted(self):
+        adapter = self.pivot('sum', set(['sorted']))
+        self.model.append(Sale(u'east', u'figs', 2))
+        self.model.append(Sale(None, u'figs', 3))
+        self.assertEqual(adapter.rowKeys(), [None, u'east', u'north',
+            u'south'])
+        self.assertEqual(adapter.columnKeys(), [u'apples', u'figs',
+            u'pears'])
+        self.assertEqual(adapter.headerData(0, Qt.Vertical, Qt.DisplayRole),
+            u'')
+
+
 if __name__ == '__main__':
     unittest.main()
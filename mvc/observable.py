@@ -277,6 +277,11 @@ class ObservableListProxy(ReadOnlyProxy, Observable, MutableSequence):
                 Event data: len(items)
         "extend": After doing l.extend(items)
                 Event data: len(items)
+        "before_reorder": Before doing l.reorder(order) or l.sort()
+                Event data: order
+        "reorder": After doing l.reorder(order) or l.sort()
+                Event data: order, the list of the previous positions of
+                the items
     """
     def __init__(self, target=None, parent=None, target_class=list):
         if target is None:
@@ -336,6 +341,28 @@ class ObservableListProxy(ReadOnlyProxy, Observable, MutableSequence):
         i = self.index(x)
         del self[i]
 
+    def reorder(self, order):
+        """
+            Rearranges the items, so the item at position i is the one
+            previously at order[i]
+        """
+        if len(order) != len(self):
+            raise ValueError('Reorder list length must match the list length')
+        self._notify('before_reorder', order)
+        items = self._target[:]
+        self._target[:] = [items[i] for i in order]
+        self._notify('reorder', order)
+
+    def sort(self, key=None, reverse=False):
+        items = self[:]
+        if key is None:
+            order = sorted(range(len(items)), key=items.__getitem__,
+                reverse=reverse)
+        else:
+            order = sorted(range(len(items)),
+                key=lambda i: key(items[i]), reverse=reverse)
+        self.reorder(order)
+
     def __repr__(self):
         return self._target.__repr__()
 
@@ -344,3 +371,145 @@ class ObservableListProxy(ReadOnlyProxy, Observable, MutableSequence):
             return self._target == other[:]
         except TypeError:
             return False
+
+
+class ObservableRingList(ObservableListProxy):
+
+    """
+        An observable list with a maximum length, for logs and time series.
+        Appending or extending beyond capacity drops the oldest items.
+
+        Items are kept in a circular buffer, so dropping the oldest items
+        doesn't move the remaining ones.
+
+        capacity: maximum item count
+        target: initial items. Default: None. If there are more items than
+                capacity, only the last ones are kept.
+
+        Attributes:
+        dropped: count of items dropped since creation. Observers can use it
+                to number items from the start of the stream instead of from
+                the start of the list, avoiding renumbering on drops.
+
+        Events: ObservableListProxy events, plus:
+        "before_drop": Before dropping the n oldest items
+                Event data: n
+        "drop": After dropping the n oldest items
+                Event data: n
+    """
+    def __init__(self, capacity, target=None, parent=None):
+        if capacity < 1:
+            raise ValueError('ObservableRingList capacity must be positive')
+        target = [] if target is None else list(target)[-capacity:]
+        ObservableListProxy.__init__(self, target, parent)
+        self.capacity = capacity
+        self.dropped = 0
+        # In ring mode, _target has capacity slots and items start at _head
+        self._ring = False
+        self._head = 0
+        self._len = 0
+
+    def __len__(self):
+        return self._len if self._ring else len(self._target)
+
+    def _slot(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('ObservableRingList index out of range')
+        return (self._head + i) % self.capacity
+
+    def _linearize(self):
+        """Turns the circular buffer back into a plain list of items"""
+        if self._ring:
+            self._target[:] = [self._target[self._slot(i)]
+                for i in range(self._len)]
+            self._ring = False
+            self._head = 0
+
+    def _drop(self, n):
+        self._notify('before_drop', n)
+        dropping = n
+        if not self._ring:
+            # Slice assignments can grow the plain list beyond capacity
+            excess = max(0, len(self._target) - self.capacity)
+            del self._target[:excess]
+            dropping -= excess
+            self._len = len(self._target)
+            self._target.extend([None] * (self.capacity - self._len))
+            self._ring = True
+        for i in range(dropping):
+            self._target[(self._head + i) % self.capacity] = None
+        self._head = (self._head + dropping) % self.capacity
+        self._len -= dropping
+        self.dropped += n
+        self._notify('drop', n)
+
+    def _put(self, x):
+        if self._ring:
+            self._target[(self._head + self._len) % self.capacity] = x
+            self._len += 1
+        else:
+            self._target.append(x)
+
+    def __getitem__(self, i):
+        if not self._ring:
+            return self._target[i]
+        if type(i) == slice:
+            return [self._target[self._slot(j)]
+                for j in range(*i.indices(self._len))]
+        return self._target[self._slot(i)]
+
+    def __setitem__(self, i, x):
+        if self._ring and type(i) != slice:
+            slot = self._slot(i)
+            self._notify('before_setitem', (i, 1))
+            self._target[slot] = x
+            self._notify('setitem', (i, 1))
+            return
+        self._linearize()
+        ObservableListProxy.__setitem__(self, i, x)
+        if len(self) > self.capacity:
+            self._drop(len(self) - self.capacity)
+
+    def __delitem__(self, i):
+        self._linearize()
+        ObservableListProxy.__delitem__(self, i)
+
+    def reorder(self, order):
+        self._linearize()
+        ObservableListProxy.reorder(self, order)
+
+    def insert(self, i, x):
+        if len(self) == self.capacity:
+            self._drop(1)
+            i = max(0, i - 1)
+        self._linearize()
+        ObservableListProxy.insert(self, i, x)
+
+    def append(self, x):
+        if len(self) == self.capacity:
+            self._drop(1)
+        self._notify('before_append')
+        self._put(x)
+        self._notify('append')
+
+    def extend(self, x):
+        x = list(x)[-self.capacity:]
+        overflow = len(self) + len(x) - self.capacity
+        if overflow > 0:
+            self._drop(overflow)
+        self._notify('before_extend', len(x))
+        for item in x:
+            self._put(item)
+        self._notify('extend', len(x))
+
+    def __repr__(self):
+        return list(self).__repr__()
+
+    def __eq__(self, other):
+        try:
+            return list(self) == other[:]
+        except TypeError:
+            return False
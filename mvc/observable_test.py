@@ -281,5 +281,94 @@ class ObservableObjectTestCase(unittest.TestCase):
 #class ObservableProxyTestCase(unittest.TestCase):
 
 
+class ObservableListProxyReorderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.list = observable.ObservableListProxy([u'c', u'a', u'b'])
+        self.observer = Observer()
+        self.list.add_callback(self.observer.observe)
+
+    def events(self):
+        return [(e[1], e[3]) for e in self.observer.events]
+
+    def test_reorder(self):
+        self.list.reorder([2, 0, 1])
+        self.assertEqual(self.list, [u'b', u'c', u'a'])
+        self.assertEqual(self.events(), [('before_reorder', [2, 0, 1]),
+            ('reorder', [2, 0, 1])])
+        self.assertRaises(ValueError, self.list.reorder, [0, 1])
+
+    def test_sort(self):
+        self.list.sort()
+        self.assertEqual(self.list, [u'a', u'b', u'c'])
+        self.assertEqual(self.events()[-1], ('reorder', [1, 2, 0]))
+        self.list.sort(key=lambda x: x, reverse=True)
+        self.assertEqual(self.list, [u'c', u'b', u'a'])
+
+    def test_ring(self):
+        ring = observable.ObservableRingList(3, range(0, 3))
+        ring.append(3)
+        ring.sort(reverse=True)
+        self.assertEqual(ring, [3, 2, 1])
+
+
+class ObservableRingListTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = observable.ObservableRingList(5, range(0, 3))
+        self.observer = Observer()
+        self.ring.add_callback(self.observer.observe)
+
+    def events(self):
+        return [(e[1], e[3]) for e in self.observer.events]
+
+    def test_append(self):
+        for i in range(3, 8):
+            self.ring.append(i)
+        self.assertEqual(self.ring, [3, 4, 5, 6, 7])
+        self.assertEqual(len(self.ring), 5)
+        self.assertEqual(self.ring.dropped, 3)
+        self.assertEqual(self.ring[0], 3)
+        self.assertEqual(self.ring[-1], 7)
+        self.assertEqual(self.ring[1:3], [4, 5])
+        self.assertRaises(IndexError, self.ring.__getitem__, 5)
+        self.assertEqual(self.events()[-4:], [('before_drop', 1),
+            ('drop', 1), ('before_append', None), ('append', None)])
+
+    def test_extend(self):
+        self.ring.extend(range(3, 6))
+        self.assertEqual(self.ring, [1, 2, 3, 4, 5])
+        self.assertEqual(self.events(), [('before_drop', 1), ('drop', 1),
+            ('before_extend', 3), ('extend', 3)])
+        self.ring.extend(range(6, 20))
+        self.assertEqual(self.ring, [15, 16, 17, 18, 19])
+        self.assertEqual(self.ring.dropped, 6)
+
+    def test_changes_on_ring(self):
+        self.ring.extend(range(3, 7))
+        self.ring[0] = 42
+        self.assertEqual(self.ring, [42, 3, 4, 5, 6])
+        del self.ring[1]
+        self.assertEqual(self.ring, [42, 4, 5, 6])
+        self.ring.insert(1, 43)
+        self.assertEqual(self.ring, [42, 43, 4, 5, 6])
+        self.ring.insert(1, 44)
+        self.assertEqual(self.ring, [44, 43, 4, 5, 6])
+        self.ring.append(7)
+        self.assertEqual(self.ring, [43, 4, 5, 6, 7])
+
+    def test_growing_slice(self):
+        self.ring.extend(range(3, 5))
+        self.ring[0:1] = [u'x', u'y']
+        self.assertEqual(self.ring, [u'y', 1, 2, 3, 4])
+        self.assertEqual(self.ring.dropped, 1)
+        self.ring[3:4] = [u'z'] * 7
+        self.assertEqual(self.ring, [u'z'] * 4 + [4])
+        self.assertEqual(self.ring.dropped, 7)
+        self.ring.append(5)
+        self.assertEqual(self.ring, [u'z'] * 3 + [4, 5])
+
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -66,3 +66,19 @@ class QueryResult(ObservableListProxy):
             items = self._target[i]
 
         return items
+
+    def chunks(self, size=None):
+        """
+            Generator of lists of up to size items (CHUNKSIZE by default),
+            for reading the whole result in order, e.g. for exporting.
+            Items not retrieved yet are read from the query without
+            keeping them in the list.
+        """
+        size = size or self.CHUNKSIZE
+        for first_index in range(0, self.__len, size):
+            last_index = min(first_index + size, self.__len)
+            items = self._target[first_index:last_index]
+            if (len(items) < last_index - first_index
+                    or any(item is None for item in items)):
+                items = self.__query[first_index:last_index]
+            yield items
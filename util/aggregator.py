@@ -16,134 +16,571 @@
 # You should have received a copy of the GNU General Public License
 # along with Qonda; If not, see <http://www.gnu.org/licenses/>.
 
-import copy
+from __future__ import division
+
+from functools import partial
+import heapq
+import math
 from operator import attrgetter
 
+from .. import PYQT_VERSION
+
+if PYQT_VERSION == 5:
+    from PyQt5.QtCore import QTimer
+else:
+    from PyQt4.QtCore import QTimer
+
+
+def exact_sum(values):
+    """
+        Returns the sum of the values, None values excluded. Floats are
+        added with math.fsum, correctly rounded, and other numbers with
+        sum, exact for ints and for Decimals within the precision of the
+        current decimal context.
+    """
+    values = [v for v in values if v is not None]
+    if float in set(map(type, values)):
+        return math.fsum(values)
+    return sum(values)
+
+
+class SumAccumulator(object):
+    """
+        Incremental sum of values. None values are counted as items, but
+        not summed.
+
+        Float values are added with compensated (Neumaier) summation, so
+        the total doesn't drift after many additions and subtractions,
+        and values added with add_many() with exact_sum().
+    """
+    def __init__(self):
+        # Items added, None values included
+        self.count = 0
+        self.total = 0
+        # Rounding error of the float total
+        self.error = 0
+        # Floats added or removed one at a time
+        self.inexact = False
+
+    def _add_total(self, value):
+        total = self.total
+        t = total + value
+        if type(t) is not float:
+            self.total = t
+            return False
+        if abs(total) >= abs(value):
+            self.error += (total - t) + value
+        else:
+            self.error += (value - t) + total
+        self.total = t
+        return True
+
+    def add(self, value):
+        self.count += 1
+        if value is not None and self._add_total(value):
+            self.inexact = True
+
+    def add_many(self, values):
+        values = list(values)
+        self.count += len(values)
+        self._add_total(exact_sum(values))
+
+    def remove(self, value):
+        self.count -= 1
+        if value is not None and self._add_total(-value):
+            self.inexact = True
+
+    def value(self):
+        return self.total + self.error if self.error else self.total
+
+
+class CountAccumulator(SumAccumulator):
+    """
+        Incremental item count
+    """
+    def value(self):
+        return self.count
+
+
+class AverageAccumulator(SumAccumulator):
+    """
+        Incremental average of the values, None values excluded
+    """
+    def __init__(self):
+        SumAccumulator.__init__(self)
+        self.values = 0
+
+    def add(self, value):
+        SumAccumulator.add(self, value)
+        if value is not None:
+            self.values += 1
+
+    def add_many(self, values):
+        values = list(values)
+        SumAccumulator.add_many(self, values)
+        self.values += len(values) - values.count(None)
+
+    def remove(self, value):
+        SumAccumulator.remove(self, value)
+        if value is not None:
+            self.values -= 1
+
+    def value(self):
+        if not self.values:
+            return None
+        return SumAccumulator.value(self) / self.values
+
+
+class VarianceAccumulator(SumAccumulator):
+    """
+        Incremental sample variance of the values, None values excluded.
+        Uses Welford's updates, which unlike the sum of squares don't
+        lose precision as the values grow.
+    """
+    def __init__(self):
+        SumAccumulator.__init__(self)
+        self.values = 0
+        self.mean = 0
+        # Sum of squared differences from the mean
+        self.m2 = 0
+
+    def add(self, value):
+        SumAccumulator.add(self, value)
+        if value is None:
+            return
+        self.values += 1
+        delta = value - self.mean
+        self.mean += delta / self.values
+        self.m2 += delta * (value - self.mean)
+
+    def add_many(self, values):
+        for value in values:
+            self.add(value)
+
+    def remove(self, value):
+        SumAccumulator.remove(self, value)
+        if value is None:
+            return
+        self.values -= 1
+        if not self.values:
+            self.mean = self.m2 = 0
+            return
+        old_mean = self.mean
+        self.mean = (old_mean * (self.values + 1) - value) / self.values
+        self.m2 -= (value - old_mean) * (value - self.mean)
+
+    def value(self):
+        if self.values < 2:
+            return None
+        # Rounding can leave tiny negatives when all values are equal
+        return max(self.m2, 0) / (self.values - 1)
+
+
+class DistinctCountAccumulator(object):
+    """
+        Incremental count of distinct values, None values excluded
+    """
+    def __init__(self):
+        self.count = 0
+        # value -> times added and not removed
+        self._counts = {}
+
+    def add(self, value):
+        self.count += 1
+        if value is not None:
+            self._counts[value] = self._counts.get(value, 0) + 1
+
+    def remove(self, value):
+        self.count -= 1
+        if value is None:
+            return
+        n = self._counts[value] - 1
+        if n:
+            self._counts[value] = n
+        else:
+            del self._counts[value]
+
+    def add_many(self, values):
+        for value in values:
+            self.add(value)
+
+    def value(self):
+        return len(self._counts)
+
+
+class _Reversed(object):
+    """
+        Heap entry ordering its value in reverse
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+
+class MinAccumulator(object):
+    """
+        Incremental minimum of the values, None values excluded.
+
+        The values are kept in a heap with lazy deletion: a removed value
+        stays in the heap until it reaches the top, so removing the
+        current minimum doesn't rescan the values.
+    """
+    def __init__(self):
+        self.count = 0
+        # value -> times added and not removed. Values in the heap with
+        # 0 here are the removed ones.
+        self._counts = {}
+        self._heap = []
+        self._stale = 0
+
+    @staticmethod
+    def _entry(value):
+        return value
+
+    @staticmethod
+    def _entry_value(entry):
+        return entry
+
+    def add(self, value):
+        self.count += 1
+        if value is None:
+            return
+        n = self._counts.get(value)
+        if n is None:
+            self._counts[value] = 1
+            heapq.heappush(self._heap, self._entry(value))
+        else:
+            if not n:
+                self._stale -= 1
+            self._counts[value] = n + 1
+
+    def add_many(self, values):
+        counts = self._counts
+        new_values = []
+        for value in values:
+            self.count += 1
+            if value is None:
+                continue
+            n = counts.get(value)
+            if n is None:
+                counts[value] = 1
+                new_values.append(value)
+            else:
+                if not n:
+                    self._stale -= 1
+                counts[value] = n + 1
+        if self._heap:
+            for value in new_values:
+                heapq.heappush(self._heap, self._entry(value))
+        else:
+            # Heapified at once
+            self._heap = [self._entry(value) for value in new_values]
+            heapq.heapify(self._heap)
 
-class Aggregator(object):
+    def remove(self, value):
+        self.count -= 1
+        if value is None:
+            return
+        n = self._counts[value] - 1
+        self._counts[value] = n
+        if not n:
+            self._stale += 1
+            if self._stale > 32 and self._stale > len(self._heap) // 2:
+                self._compact()
+
+    def _compact(self):
+        self._counts = dict((v, n) for v, n in self._counts.items() if n)
+        self._heap = [self._entry(v) for v in self._counts]
+        heapq.heapify(self._heap)
+        self._stale = 0
+
+    def value(self):
+        heap = self._heap
+        while heap:
+            top = self._entry_value(heap[0])
+            if self._counts[top]:
+                return top
+            heapq.heappop(heap)
+            del self._counts[top]
+            self._stale -= 1
+        return None
+
+
+class MaxAccumulator(MinAccumulator):
+    """
+        Incremental maximum of the values, None values excluded
+    """
+    @staticmethod
+    def _entry(value):
+        return _Reversed(value)
+
+    @staticmethod
+    def _entry_value(entry):
+        return entry.value
+
+
+# Aggregate name -> accumulator class
+ACCUMULATORS = {
+    'sum': SumAccumulator,
+    'count': CountAccumulator,
+    'avg': AverageAccumulator,
+    'min': MinAccumulator,
+    'max': MaxAccumulator,
+    'distinct': DistinctCountAccumulator,
+    'var': VarianceAccumulator,
+}
+
+
+def _aggregate_values(attributes):
+    """
+        Returns a dict key -> (attribute name or None, accumulator) for
+        the keys of Aggregator attributes
+    """
+    values = {}
+    for key in attributes.keys():
+        if key == '*':
+            aggregate, attr = 'count', None
+        elif isinstance(key, tuple):
+            aggregate, attr = key
+        else:
+            aggregate, attr = 'sum', key
+        values[key] = (attr, ACCUMULATORS[aggregate]())
+    return values
+
+
+def _item_value(item, attr):
+    return attrgetter(attr)(item) if attr is not None else None
+
+
+def _item_values(items, attr):
+    if attr is None:
+        return [None] * len(items)
+    return map(attrgetter(attr), items)
+
+
+def _resync_values(values, items):
+    """
+        Rebuilds from the items the accumulators of values (as returned
+        by _aggregate_values) accumulating float rounding errors
     """
-        Aggregators calculate sum of attributes and item count on lists of
-        objects.
+    for key, (attr, accumulator) in values.items():
+        if getattr(accumulator, 'inexact', False):
+            accumulator = type(accumulator)()
+            accumulator.add_many(_item_values(items, attr))
+            values[key] = (attr, accumulator)
+
+
+def _affects(updated_attr, attr):
+    return attr is not None and (attr == updated_attr
+        or attr.startswith(updated_attr + '.'))
+
+
+def _write_target(target, attributes, value, written):
+    """
+        Sets the aggregates into the target attributes, skipping the ones
+        unchanged since the last write. value is a function key -> value,
+        and written a dict target attribute -> last value written.
+    """
+    for key, target_attr in attributes.items():
+        v = value(key)
+        if target_attr in written and written[target_attr] == v:
+            continue
+        written[target_attr] = v
+        setattr(target, target_attr, v)
+
+
+class _BatchedWriter(object):
+    """
+        Base of aggregators, writing the targets once at the end of a
+        batch of changes (between begin_batch() and end_batch() calls),
+        or once per event loop iteration if 'deferred' is in the options.
+
+        Child classes should implement _write_targets().
+    """
+    def __init__(self, options):
+        self.options = set() if options is None else options
+        # Nesting level of begin_batch() calls
+        self._batch_depth = 0
+        self._flush_scheduled = False
+
+    def begin_batch(self):
+        """
+            Delays writing the targets until the matching end_batch()
+        """
+        self._batch_depth += 1
+
+    def end_batch(self):
+        self._batch_depth -= 1
+        if not self._batch_depth:
+            self.flush()
+
+    def flush(self):
+        """
+            Writes the pending changes to the targets
+        """
+        self._flush_scheduled = False
+        self._write_targets()
+
+    def _targets_changed(self):
+        if self._batch_depth:
+            # Written at the end of the batch
+            return
+        if 'deferred' in self.options:
+            if not self._flush_scheduled:
+                self._flush_scheduled = True
+                QTimer.singleShot(0, self.flush)
+            return
+        self.flush()
+
+
+class Aggregator(_BatchedWriter):
+    """
+        Aggregators calculate aggregates of attributes on lists of
+        objects, keep them up to date as the list and its items change,
+        and set them as attributes of a target object.
 
         source: list of object
         target: object
         attributes: dict:
-            keys = attribute names or '*' for count
-            values = list of target attributes
+            keys = attribute names for their sum, '*' for the item count,
+                or (aggregate, attribute name) tuples, aggregate being
+                'sum', 'count', 'avg', 'min', 'max', 'distinct' (count of
+                distinct values) or 'var' (sample variance)
+            values = target attribute names
+        options: set of options: 'deferred' writes the target once per
+            event loop iteration, instead of after every change.
+
+        The aggregates are updated by difference, adding and removing
+        the values of the items as they change (see ACCUMULATORS), so no
+        change rescans the source, not even removing the current maximum.
+        An item can be in the source several times, its values counting
+        once per occurrence.
+        Only the target attributes whose aggregate changed are written,
+        and bulk changes can be enclosed by begin_batch() and end_batch()
+        calls to write the target once.
+
+        Items added at once, as on construction, are summed with
+        exact_sum(). Float aggregates updated one item at a time are
+        recalculated from the source every RESYNC_INTERVAL changes, to
+        discard the rounding errors accumulated.
     """
-    def __init__(self, source, target, attributes):
-        super(Aggregator, self).__init__()
+    # Changes between recalculations of float aggregates
+    RESYNC_INTERVAL = 10000
+
+    def __init__(self, source, target, attributes, options=None):
+        _BatchedWriter.__init__(self, options)
         self.__source = source
         self.__target = target
         self.__attributes = attributes
-        self.__values = {}
-        self.__new_values = None
+        # target attribute -> last value written
+        self.__written = {}
+        # key -> (attribute name or None, accumulator)
+        self.__values = _aggregate_values(attributes)
+        # id(item) -> occurrences in the source
+        self.__occurrences = {}
+        self.__removing = []
+        # Changes since the last resync()
+        self.__changes = 0
         source.add_callback(self.observe)
-        count = len(source)
-        self.__values['*'] = count
 
-        for attr in attributes.keys():
-            if attr == '*':
-                continue
-            agg_value = 0
-            for item in source:
-                value = attrgetter(attr)(item)
-                if value is not None:
-                    agg_value += value
-            self.__values[attr] = agg_value
-
-        for item in source:
-            item.add_callback(self.observe_item)
+        self.__add_items(source)
         self.update_target()
 
+    def value(self, key):
+        """
+            Returns the current value of the aggregate
+        """
+        return self.__values[key][1].value()
+
     def update_target(self):
 
-        for attr, target_attr in self.__attributes.items():
-            setattr(self.__target, target_attr, self.__values[attr])
+        _write_target(self.__target, self.__attributes, self.value,
+            self.__written)
+
+    _write_targets = update_target
+
+    def resync(self):
+        """
+            Recalculates from the source the aggregates accumulating float
+            rounding errors
+        """
+        self.__changes = 0
+        _resync_values(self.__values, list(self.__source))
+        self._targets_changed()
+
+    def __changed(self):
+        self.__changes += 1
+        if self.__changes >= self.RESYNC_INTERVAL:
+            self.resync()
+        else:
+            self._targets_changed()
+
+    def __add_items(self, items):
+        items = list(items)
+        for attr, accumulator in self.__values.values():
+            accumulator.add_many(_item_values(items, attr))
+        for item in items:
+            count = self.__occurrences.get(id(item), 0)
+            if not count:
+                item.add_callback(self.observe_item)
+            self.__occurrences[id(item)] = count + 1
+
+    def __remove_items(self, items):
+        for item in items:
+            for attr, accumulator in self.__values.values():
+                accumulator.remove(_item_value(item, attr))
+            count = self.__occurrences.pop(id(item)) - 1
+            if count:
+                self.__occurrences[id(item)] = count
+            else:
+                item.remove_callback(self.observe_item)
 
     def observe(self, sender, event_type, list_row, attrs):
 
         if sender != self.__source:
             return
 
-        def __before_delitem(i):
-            self.__new_values = copy.copy(self.__values)
-            item_range = (range(i, i + 1) if type(i) == int
-                else range(*(i[0]).indices(len(sender))))
-            for attr in self.__attributes.keys():
-                if attr == '*':
-                    continue
-                total = self.__new_values[attr]
-                for i in item_range:
-                    value = getattr(sender[i], attr)
-                    if value is not None:
-                        total -= value
-                self.__new_values[attr] = total
-            self.__new_values['*'] -= len(item_range)
-            for i in item_range:
-                sender[i].remove_callback(self.observe_item)
-
-        def before_setitem(i):
-            __before_delitem(i)
-
-        def setitem(args):
-            i, length = args
-            item_range = (range(i, i + length) if type(i) == int
-                else range(i.start, i.start + length))
-
-            for i in item_range:
-                sender[i].add_callback(self.observe_item, i)
-
-            for attr in self.__attributes.keys():
-                if attr == '*':
-                    continue
-                total = self.__new_values[attr]
-                for i in item_range:
-                    value = getattr(sender[i], attr)
-                    if value is not None:
-                        total += value
-                self.__new_values[attr] = total
-            self.__new_values['*'] += length
-
-            self.__values = self.__new_values
-            self.update_target()
+        def before_setitem(attrs):
+            i, length = attrs
+            before_delitem(i)
+
+        def setitem(attrs):
+            i, length = attrs
+            if type(i) == int:
+                start = i if i >= 0 else i + len(sender)
+            else:
+                start = i.start
+            self.__add_items(sender[start:start + length])
+            self.__changed()
 
         def before_delitem(i):
-            __before_delitem(i)
+            self.__removing = sender[i] if type(i) == slice else [sender[i]]
+            self.__remove_items(self.__removing)
 
         def delitem(i):
-            self.__values = self.__new_values
-            self.update_target()
+            self.__removing = []
+            self.__changed()
 
         def insert(i):
-            sender[i].add_callback(self.observe_item, i)
-            for attr in self.__attributes.keys():
-                if attr == '*':
-                    continue
-                value = getattr(sender[i], attr)
-                if value is not None:
-                    self.__values[attr] += value
-            self.__values['*'] += 1
-            self.update_target()
+            self.__add_items([sender[i]])
+            self.__changed()
 
         def append(dummy):
             insert(len(sender) - 1)
 
         def extend(length):
-            item_range = range(len(sender) - length, len(sender))
+            self.__add_items(sender[len(sender) - length:])
+            self.__changed()
 
-            for i in item_range:
-                sender[i].add_callback(self.observe_item, i)
+        def before_drop(n):
+            before_delitem(slice(0, n))
 
-            for attr in self.__attributes.keys():
-                if attr == '*':
-                    continue
-                for i in item_range:
-                    value = getattr(sender[i], attr)
-                    if value is not None:
-                        self.__values[attr] += value
-            self.__values['*'] += length
-            self.update_target()
+        def drop(n):
+            delitem(n)
 
         # Llamo a la función asociada al event_type
         try:
@@ -152,16 +589,240 @@ class Aggregator(object):
             pass
 
     def observe_item(self, sender, event_type, _, attrs):
+        if event_type not in ('before_update', 'update'):
+            return
         attr = attrs[0]
-        if attr in self.__attributes.keys():
+        # Callbacks are called once, whatever the occurrences of the item
+        count = self.__occurrences.get(id(sender), 0)
+        changed = False
+        for aggregated_attr, accumulator in self.__values.values():
+            if not _affects(attr, aggregated_attr):
+                continue
+            value = _item_value(sender, aggregated_attr)
+            for i in range(count):
+                if event_type == 'before_update':
+                    accumulator.remove(value)
+                else:
+                    accumulator.add(value)
+                    changed = True
+        if changed:
+            self.__changed()
+
+
+class GroupedAggregator(_BatchedWriter):
+    """
+        Grouped aggregators calculate aggregates of attributes for each
+        group of items of a list, the group being the value of the key
+        attribute, and set them in a target object per group.
+
+        source: list of object
+        key: attribute name whose value is the group key
+        target_factory: callable receiving a group key and returning the
+            target object of a new group
+        attributes: dict, as in Aggregator
+        options: set of options, as in Aggregator
+
+        All the groups are updated by difference from a single callback
+        per item, as in Aggregator. When the key of an item changes, its
+        values are moved from the old group to the new one. Groups are
+        created on the first item with their key, and kept when they
+        become empty, with the aggregates of an empty list. An item can be
+        in the list several times, its values counting once per
+        occurrence. Targets are written as in Aggregator, only for the
+        changed groups, and float aggregates recalculated as in Aggregator.
+    """
+    # Changes between recalculations of float aggregates
+    RESYNC_INTERVAL = 10000
+
+    def __init__(self, source, key, target_factory, attributes,
+            options=None):
+        _BatchedWriter.__init__(self, options)
+        self.__source = source
+        self.__key = key
+        self.__target_factory = target_factory
+        self.__attributes = attributes
+        # group key -> (target, values as in Aggregator, written values)
+        self.__groups = {}
+        # Keys of the groups with unwritten changes
+        self.__changed = set()
+        # id(item) -> [group key the item values are in, occurrences]
+        self.__item_groups = {}
+        self.__removing = set()
+        # Changes since the last resync()
+        self.__changes = 0
+        source.add_callback(self.observe)
+        self.__changed = self.__add_items(source)
+        self.flush()
+
+    def targets(self):
+        """
+            Returns a dict group key -> target
+        """
+        return dict((group_key, group[0])
+            for group_key, group in self.__groups.items())
+
+    def value(self, group_key, key):
+        """
+            Returns the current value of the aggregate for the group
+        """
+        return self.__groups[group_key][1][key][1].value()
+
+    def __group(self, group_key):
+        group = self.__groups.get(group_key)
+        if group is None:
+            group = self.__groups[group_key] = (
+                self.__target_factory(group_key),
+                _aggregate_values(self.__attributes), {})
+        return group
+
+    def resync(self):
+        """
+            Recalculates from the source the aggregates accumulating float
+            rounding errors
+        """
+        self.__changes = 0
+        buckets = {}
+        for item in self.__source:
+            buckets.setdefault(self.__item_groups[id(item)][0],
+                []).append(item)
+        for group_key, group in self.__groups.items():
+            _resync_values(group[1], buckets.get(group_key, []))
+        self.__changed.update(self.__groups)
+        self._targets_changed()
+
+    def __update_targets(self, group_keys):
+        self.__changed.update(group_keys)
+        self.__changes += 1
+        if self.__changes >= self.RESYNC_INTERVAL:
+            self.resync()
+        else:
+            self._targets_changed()
+
+    def _write_targets(self):
+        changed = self.__changed
+        self.__changed = set()
+        for group_key in changed:
+            target, values, written = self.__groups[group_key]
+            _write_target(target, self.__attributes,
+                partial(self.value, group_key), written)
+
+    def __add_values(self, item, group_key, attrs=None, count=1):
+        for attr, accumulator in self.__group(group_key)[1].values():
+            if attrs is None or attr in attrs:
+                value = _item_value(item, attr)
+                for i in range(count):
+                    accumulator.add(value)
+
+    def __remove_values(self, item, group_key, attrs=None, count=1):
+        for attr, accumulator in self.__groups[group_key][1].values():
+            if attrs is None or attr in attrs:
+                value = _item_value(item, attr)
+                for i in range(count):
+                    accumulator.remove(value)
+
+    def __add_items(self, items):
+        """
+            Adds the items, returning the keys of the groups changed
+        """
+        buckets = {}
+        for item in items:
+            entry = self.__item_groups.get(id(item))
+            if entry is None:
+                entry = self.__item_groups[id(item)] = [
+                    _item_value(item, self.__key), 0]
+                item.add_callback(self.observe_item)
+            entry[1] += 1
+            buckets.setdefault(entry[0], []).append(item)
+        for group_key, bucket in buckets.items():
+            for attr, accumulator in self.__group(group_key)[1].values():
+                accumulator.add_many(_item_values(bucket, attr))
+        return set(buckets)
+
+    def __remove_items(self, items):
+        group_keys = set()
+        for item in items:
+            entry = self.__item_groups[id(item)]
+            self.__remove_values(item, entry[0])
+            group_keys.add(entry[0])
+            entry[1] -= 1
+            if not entry[1]:
+                del self.__item_groups[id(item)]
+                item.remove_callback(self.observe_item)
+        return group_keys
+
+    def observe(self, sender, event_type, list_row, attrs):
+
+        if sender != self.__source:
+            return
+
+        def before_setitem(attrs):
+            i, length = attrs
+            before_delitem(i)
+
+        def setitem(attrs):
+            i, length = attrs
+            if type(i) == int:
+                start = i if i >= 0 else i + len(sender)
+            else:
+                start = i.start
+            group_keys = self.__removing
+            self.__removing = set()
+            group_keys |= self.__add_items(sender[start:start + length])
+            self.__update_targets(group_keys)
+
+        def before_delitem(i):
+            self.__removing = self.__remove_items(
+                sender[i] if type(i) == slice else [sender[i]])
+
+        def delitem(i):
+            group_keys = self.__removing
+            self.__removing = set()
+            self.__update_targets(group_keys)
+
+        def insert(i):
+            self.__update_targets(self.__add_items([sender[i]]))
+
+        def append(dummy):
+            insert(len(sender) - 1)
+
+        def extend(length):
+            self.__update_targets(
+                self.__add_items(sender[len(sender) - length:]))
+
+        def before_drop(n):
+            before_delitem(slice(0, n))
+
+        def drop(n):
+            delitem(n)
+
+        try:
+            locals()[event_type](attrs)
+        except KeyError:
+            pass
+
+    def observe_item(self, sender, event_type, _, attrs):
+        if event_type not in ('before_update', 'update'):
+            return
+        attr = attrs[0]
+        entry = self.__item_groups[id(sender)]
+        group_key, count = entry
+        if _affects(attr, self.__key):
+            # Moves all the values to the new group
             if event_type == 'before_update':
-                # self._notify('before_update', 'total')
-                value = getattr(sender, attr)
-                if value is not None:
-                    self.__values[attr] -= value
-            elif event_type == 'update':
-                value = getattr(sender, attr)
-                if value is not None:
-                    self.__values[attr] += value
-                # self._notify('update', 'total')
-                self.update_target()
\ No newline at end of file
+                self.__remove_values(sender, group_key, count=count)
+            else:
+                new_key = _item_value(sender, self.__key)
+                self.__add_values(sender, new_key, count=count)
+                entry[0] = new_key
+                self.__update_targets(set((group_key, new_key)))
+            return
+        attrs = set(aggregated_attr for aggregated_attr, accumulator
+            in self.__groups[group_key][1].values()
+            if _affects(attr, aggregated_attr))
+        if not attrs:
+            return
+        if event_type == 'before_update':
+            self.__remove_values(sender, group_key, attrs, count)
+        else:
+            self.__add_values(sender, group_key, attrs, count)
+            self.__update_targets((group_key,))
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Qonda framework
+# Qonda is (C)2012,2013 Julio César Gázquez
+#
+# Qonda is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Qonda is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Qonda; If not, see <http://www.gnu.org/licenses/>.
+
+from decimal import Decimal
+import math
+import random
+import unittest
+
+from qonda.mvc.observable import (ObservableObject, ObservableListProxy,
+    ObservableRingList)
+from qonda.util import aggregator as aggregator_module
+from qonda.util.aggregator import (Aggregator, GroupedAggregator,
+    SumAccumulator,
+    CountAccumulator, AverageAccumulator, MinAccumulator, MaxAccumulator,
+    VarianceAccumulator, DistinctCountAccumulator, exact_sum)
+
+
+class Line(ObservableObject):
+
+    _notifiables_ = ('customer', 'price', 'quantity')
+
+    def __init__(self, customer, price, quantity=1):
+        super(Line, self).__init__()
+        self.customer = customer
+        self.price = price
+        self.quantity = quantity
+
+
+class Totals(object):
+
+    def __init__(self, key=None):
+        self.writes = []
+        self.key = key
+
+    def __setattr__(self, name, value):
+        if name != 'writes':
+            self.writes.append(name)
+        object.__setattr__(self, name, value)
+
+
+class AccumulatorTestCase(unittest.TestCase):
+
+    def test_sum_count_avg(self):
+        for cls, expected in ((SumAccumulator, 6), (CountAccumulator, 4),
+                (AverageAccumulator, 2)):
+            accumulator = cls()
+            for value in (1, None, 2, 3):
+                accumulator.add(value)
+            self.assertEqual(accumulator.value(), expected)
+        accumulator = AverageAccumulator()
+        self.assertEqual(accumulator.value(), None)
+        accumulator.add(1)
+        accumulator.add(2)
+        self.assertEqual(accumulator.value(), 1.5)
+
+    def test_min_max(self):
+        values = [random.randint(0, 50) for i in range(500)]
+        minimum, maximum = MinAccumulator(), MaxAccumulator()
+        for value in values:
+            minimum.add(value)
+            maximum.add(value)
+        random.shuffle(values)
+        while values:
+            self.assertEqual(minimum.value(), min(values))
+            self.assertEqual(maximum.value(), max(values))
+            value = values.pop()
+            minimum.remove(value)
+            maximum.remove(value)
+        self.assertEqual(minimum.value(), None)
+        self.assertEqual(maximum.count, 0)
+        maximum.add(None)
+        self.assertEqual(maximum.value(), None)
+
+    def test_distinct_variance(self):
+        distinct, variance = DistinctCountAccumulator(), VarianceAccumulator()
+        for value in (2, 4, 4, None, 4, 5, 5, 7, 9):
+            distinct.add(value)
+            variance.add(value)
+        self.assertEqual(distinct.value(), 5)
+        self.assertAlmostEqual(variance.value(), 32 / 7.0)
+        for value in (9, 2, 4):
+            distinct.remove(value)
+            variance.remove(value)
+        self.assertEqual(distinct.value(), 3)
+        self.assertAlmostEqual(variance.value(), 1.5)
+        for value in (4, 4, 7):
+            variance.remove(value)
+        self.assertAlmostEqual(variance.value(), 0)
+        variance.remove(5)
+        self.assertEqual(variance.value(), None)
+
+    def test_float_sum(self):
+        accumulator = SumAccumulator()
+        for i in range(10):
+            accumulator.add(0.1)
+        self.assertEqual(accumulator.value(), 1.0)
+        values = [random.uniform(-1e6, 1e6) for i in range(1000)]
+        for value in values:
+            accumulator.add(value)
+        for value in values:
+            accumulator.remove(value)
+        self.assertEqual(accumulator.value(), 1.0)
+        self.assertTrue(accumulator.inexact)
+
+    def test_add_many(self):
+        self.assertEqual(exact_sum([0.1] * 10 + [None]), 1.0)
+        self.assertEqual(exact_sum([Decimal('0.10')] * 3), Decimal('0.30'))
+        self.assertEqual(exact_sum([]), 0)
+        values = [random.randint(0, 50) for i in range(100)] + [None]
+        for cls in (SumAccumulator, CountAccumulator, AverageAccumulator,
+                MinAccumulator, MaxAccumulator, VarianceAccumulator,
+                DistinctCountAccumulator):
+            one_by_one, at_once = cls(), cls()
+            for value in values:
+                one_by_one.add(value)
+            at_once.add_many(values)
+            self.assertAlmostEqual(at_once.value(), one_by_one.value())
+            self.assertEqual(at_once.count, 101)
+            self.assertFalse(getattr(at_once, 'inexact', False))
+
+
+class AggregatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = ObservableListProxy([Line(u'ann', 10), Line(u'bob', 30),
+            Line(u'ann', 20)])
+        self.totals = Totals()
+        self.aggregator = Aggregator(self.lines, self.totals, {
+            'price': 'total',
+            '*': 'count',
+            ('max', 'price'): 'highest',
+            ('avg', 'price'): 'average',
+            ('distinct', 'customer'): 'customers'})
+
+    def totals_tuple(self):
+        t = self.totals
+        return (t.total, t.count, t.highest, t.average, t.customers)
+
+    def test_initial(self):
+        self.assertEqual(self.totals_tuple(), (60, 3, 30, 20, 2))
+        self.assertEqual(self.aggregator.value(('max', 'price')), 30)
+
+    def test_item_update(self):
+        self.lines[1].price = 5
+        self.assertEqual(self.totals_tuple(), (35, 3, 20, 35 / 3.0, 2))
+        self.lines[1].customer = u'ann'
+        self.assertEqual(self.totals.customers, 1)
+
+    def test_list_events(self):
+        self.lines.append(Line(u'cid', 40))
+        self.assertEqual(self.totals_tuple(), (100, 4, 40, 25, 3))
+        del self.lines[3]
+        self.assertEqual(self.totals_tuple(), (60, 3, 30, 20, 2))
+        self.lines[1] = Line(u'dan', 1)
+        self.assertEqual(self.totals_tuple(), (31, 3, 20, 31 / 3.0, 2))
+        self.lines[0:2] = [Line(u'eve', 3)]
+        self.assertEqual(self.totals_tuple(), (23, 2, 20, 11.5, 2))
+        del self.lines[0:1]
+        self.lines.insert(0, Line(u'ann', 7))
+        self.lines.extend([Line(u'bob', 1), Line(u'bob', 2)])
+        self.assertEqual(self.totals_tuple(), (30, 4, 20, 7.5, 2))
+        self.lines[-1] = Line(u'cid', 6)
+        self.assertEqual(self.totals_tuple(), (34, 4, 20, 8.5, 3))
+
+    def test_repeated_item(self):
+        a, b = Line(u'ann', 5), Line(u'bob', 9)
+        lines = ObservableListProxy([a, a, b])
+        totals = Totals()
+        Aggregator(lines, totals, {'price': 'total',
+            ('max', 'price'): 'highest', ('min', 'price'): 'lowest'})
+        a.price = 1
+        self.assertEqual((totals.total, totals.highest, totals.lowest),
+            (11, 9, 1))
+        del lines[0]
+        a.price = 20
+        self.assertEqual((totals.total, totals.highest, totals.lowest),
+            (29, 20, 9))
+        del lines[0]
+        a.price = 30
+        self.assertEqual((totals.total, totals.highest, totals.lowest),
+            (9, 9, 9))
+
+    def test_batch(self):
+        self.totals.writes = []
+        self.aggregator.begin_batch()
+        for line in self.lines:
+            line.price += 1
+        self.lines.append(Line(u'ann', 1))
+        self.assertEqual(self.totals.writes, [])
+        self.aggregator.end_batch()
+        # Customers unchanged
+        self.assertEqual(sorted(self.totals.writes), ['average', 'count',
+            'highest', 'total'])
+        self.assertEqual(self.totals_tuple(), (64, 4, 31, 16, 2))
+
+    def test_deferred(self):
+        scheduled = []
+
+        class Timer(object):
+            @staticmethod
+            def singleShot(ms, f):
+                scheduled.append(f)
+
+        timer = aggregator_module.QTimer
+        aggregator_module.QTimer = Timer
+        try:
+            totals = Totals()
+            Aggregator(self.lines, totals, {'price': 'total'},
+                set(['deferred']))
+            self.lines[0].price = 1
+            self.lines[1].price = 2
+            self.assertEqual((totals.total, len(scheduled)), (60, 1))
+            scheduled[0]()
+            self.assertEqual((totals.total, totals.writes),
+                (23, ['key', 'total', 'total']))
+        finally:
+            aggregator_module.QTimer = timer
+
+    def test_resync(self):
+        lines = ObservableListProxy([Line(u'ann', 0.1) for i in range(10)])
+        totals = Totals()
+        aggregator = Aggregator(lines, totals, {'price': 'total',
+            ('avg', 'price'): 'average', ('max', 'price'): 'highest'})
+        self.assertEqual(totals.total, 1.0)
+        aggregator.RESYNC_INTERVAL = 5
+        for i in range(4):
+            lines[i].price = 0.7
+        total = math.fsum(line.price for line in lines)
+        self.assertAlmostEqual(totals.total, total)
+        lines[4].price = 0.7
+        # Recalculated from the source
+        total = math.fsum(line.price for line in lines)
+        self.assertEqual((totals.total, totals.average, totals.highest),
+            (total, total / 10, 0.7))
+
+    def test_decimal(self):
+        lines = ObservableListProxy([Line(u'ann', Decimal('0.10'))
+            for i in range(3)])
+        totals = Totals()
+        Aggregator(lines, totals, {'price': 'total'})
+        lines[0].price = Decimal('1.05')
+        self.assertEqual(totals.total, Decimal('1.25'))
+        self.assertIsInstance(totals.total, Decimal)
+
+    def test_ring(self):
+        lines = ObservableRingList(2)
+        totals = Totals()
+        Aggregator(lines, totals, {('min', 'price'): 'lowest'})
+        for price in (1, 5, 3):
+            lines.append(Line(u'ann', price))
+        self.assertEqual(totals.lowest, 3)
+
+
+class GroupedAggregatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = ObservableListProxy([Line(u'ann', 10), Line(u'bob', 30),
+            Line(u'ann', 20, 2)])
+        self.aggregator = GroupedAggregator(self.lines, 'customer', Totals,
+            {'price': 'total', '*': 'count', ('max', 'quantity'): 'most'})
+
+    def groups(self):
+        return dict((key, (t.total, t.count, t.most))
+            for key, t in self.aggregator.targets().items())
+
+    def test_groups(self):
+        self.assertEqual(self.groups(), {u'ann': (30, 2, 2),
+            u'bob': (30, 1, 1)})
+        self.assertEqual(self.aggregator.targets()[u'bob'].key, u'bob')
+        self.assertEqual(self.aggregator.value(u'ann', 'price'), 30)
+
+    def test_item_update(self):
+        ann = self.aggregator.targets()[u'ann']
+        self.lines[0].price = 5
+        self.lines[2].quantity = 3
+        self.assertEqual(self.groups(), {u'ann': (25, 2, 3),
+            u'bob': (30, 1, 1)})
+        self.lines[1].customer = u'cid'
+        self.lines[2].customer = u'cid'
+        # Empty groups are kept
+        self.assertEqual(self.groups(), {u'ann': (5, 1, 1),
+            u'bob': (0, 0, None), u'cid': (50, 2, 3)})
+        self.assertIs(self.aggregator.targets()[u'ann'], ann)
+
+    def test_batch(self):
+        targets = self.aggregator.targets()
+        for target in targets.values():
+            target.writes = []
+        self.aggregator.begin_batch()
+        self.lines[0].price = 1
+        self.lines[2].price = 2
+        self.aggregator.end_batch()
+        self.assertEqual(targets[u'ann'].writes, ['total'])
+        self.assertEqual(targets[u'bob'].writes, [])
+
+    def test_list_events(self):
+        self.lines.append(Line(u'cid', 1))
+        del self.lines[0:2]
+        self.lines[0] = Line(u'bob', 7)
+        self.assertEqual(self.groups(), {u'ann': (0, 0, None),
+            u'bob': (7, 1, 1), u'cid': (1, 1, 1)})
+        self.lines[-1] = Line(u'ann', 4)
+        self.assertEqual(self.groups(), {u'ann': (4, 1, 1),
+            u'bob': (7, 1, 1), u'cid': (0, 0, None)})
+
+    def test_repeated_item(self):
+        line = self.lines[0]
+        self.lines.append(line)
+        self.assertEqual(self.groups()[u'ann'], (40, 3, 2))
+        line.price = 1
+        line.customer = u'bob'
+        self.assertEqual(self.groups(), {u'ann': (20, 1, 2),
+            u'bob': (32, 3, 1)})
+        del self.lines[0]
+        self.assertEqual(self.groups()[u'bob'], (31, 2, 1))
+        line.price = 2
+        self.assertEqual(self.groups()[u'bob'], (32, 2, 1))
+        del self.lines[-1]
+        self.assertEqual(self.groups()[u'bob'], (30, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,715 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Qonda framework
+# Qonda is (C)2010,2013 Julio César Gázquez
+#
+# Qonda is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Qonda is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Qonda; If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Qt free table projection: metadata resolution, property paths and
+    value formatting shared by the Qonda adapters, usable without PyQt
+    (e.g. for batch exports).
+"""
+
+from collections import OrderedDict, deque
+from itertools import islice
+import operator
+try:
+    from UserDict import UserDict    # Python 2
+except ImportError:
+    from collections import UserDict  # Python 3, 2to3 doesn't fix it
+from warnings import warn
+
+# csv, json, multiprocessing and NumPy are only imported when used, as
+# they are slow to load and most applications never need them
+
+_numpy_module = False  # Not imported yet
+
+
+def _numpy():
+    """Returns the numpy module, imported on first use, or None"""
+    global _numpy_module
+    if _numpy_module is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy_module = numpy
+    return _numpy_module
+
+
+class MetaPropertyWrapper(object):
+    """
+    A metadata property wrapper that pass the proper object to callables
+    """
+    def __init__(self, property_name, meta_property):
+        self._property_name = property_name
+        self._meta_property = meta_property
+
+    def __call__(self, *a, **kw):
+        o = a[0]
+        return self._meta_property(getattr(o, self._property_name))
+
+
+class MetaFormatterPropertyWrapper(object):
+    """
+    A metadata property wrapper that pass the proper object to callables
+    """
+    def __init__(self, meta_property):
+        self._meta_property = meta_property
+
+    def __call__(self, *a, **kw):
+        o = a[0]
+        return self._meta_property(o)
+
+
+class PropertyMetadataWrapper(UserDict):
+    """
+    A wrapper for attribute metadata that wraps individual metadata properties
+    in MetaPropertyWrapper.
+    Used to pass the right object to the callables present when the metadata
+    is a reference to metadata in the attribute class (marked with '.')
+    """
+    def __init__(self, property_name, meta):
+        super(PropertyMetadataWrapper, self).__init__()
+        self.data.update(meta)
+        self._property_name = property_name
+        # Wrappers are built once per key, as metadata is read on painting
+        self._wrappers = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._wrappers[key]
+        except KeyError:
+            pass
+        meta_property = self.data[key]
+        if callable(meta_property):
+            if key in ('displayFormatter', 'editFormatter'):
+                wrapper = MetaFormatterPropertyWrapper(meta_property)
+            else:
+                wrapper = MetaPropertyWrapper(self._property_name,
+                    meta_property)
+        else:
+            wrapper = meta_property
+        self._wrappers[key] = wrapper
+        return wrapper
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self._wrappers.pop(key, None)
+
+    def __delitem__(self, key):
+        del self.data[key]
+        self._wrappers.pop(key, None)
+
+    def update(self, *args, **kwargs):
+        self.data.update(*args, **kwargs)
+        self._wrappers.clear()
+
+    def copy(self):
+        return PropertyMetadataWrapper(self._property_name, self.data)
+
+
+# Class metadata by (class, property tuple), as resolving it for every
+# adapter or delegate instance is expensive. Metadata in the cache is
+# shared, so it must not be modified. Call clear_metadata_cache() if
+# _qonda_column_meta_ is changed at run time.
+_class_meta_cache = {}
+
+
+def clear_metadata_cache():
+    _class_meta_cache.clear()
+
+
+def _build_class_meta(class_, properties):
+    key = (class_, tuple(properties))
+    try:
+        return _class_meta_cache[key]
+    except KeyError:
+        pass
+    meta = _resolve_class_meta(class_, properties)
+    _class_meta_cache[key] = meta
+    return meta
+
+
+def _resolve_class_meta(class_, properties):
+
+    def resolve_meta(class_, p):
+        try:
+            v = class_._qonda_column_meta_[p]
+            # Property can be a reference and meta a link to expected class
+            if isinstance(v, type):
+                v = PropertyMetadataWrapper(p, v._qonda_column_meta_['.'])
+        except KeyError:
+            head, tail = p.split('.', 1)
+            try:
+                v = class_._qonda_column_meta_[head]
+                if isinstance(v, type):
+                    v = resolve_meta(v, tail)
+                elif 'type' in v:
+                    v = resolve_meta(v['type'], tail)
+                else:
+                    print ("Warning: Composite attribute found metadata "
+                        "doesn't point to a class. "
+                        "The attribute won't use class metadata")
+                    v = {}
+            except KeyError:
+                v = {}
+        return v
+
+    meta = []
+    for p in properties:
+        try:
+            v = resolve_meta(class_, p)
+        except (ValueError, AttributeError):
+            v = {}
+        meta.append(v)
+    return tuple(meta)
+
+
+def _combine_column_metas(class_, adapter_meta, properties):
+
+    if class_ is None:
+        print ("Warning: Adapter has no model class defined. Will use only "
+            "provided metadata")
+        return () if adapter_meta is None else adapter_meta
+
+    class_meta = _build_class_meta(class_, properties)
+    if adapter_meta is None:
+        return class_meta
+    if len(adapter_meta) != len(properties):
+        print ("Warning: Adapter provided metadata count and property count"
+            "doesn't match.")
+        if len(adapter_meta) < len(properties):
+            adapter_meta = adapter_meta + [{}] * (len(properties)
+                - len(adapter_meta))
+    meta = []
+    for am, cm in zip(adapter_meta, class_meta):
+        if am:
+            m = cm.copy()
+            m.update(am)
+        else:
+            # Nothing to combine, share the class metadata
+            m = cm
+        meta.append(m)
+    return meta
+
+
+def _combine_row_metas(class_, adapter_meta):
+
+    if class_ is None:
+        return {} if adapter_meta is None else adapter_meta
+
+    try:
+        class_meta = class_._qonda_column_meta_['*']
+    except (AttributeError, KeyError):
+        class_meta = {}
+
+    if adapter_meta is None:
+        return class_meta
+
+    meta = class_meta.copy()
+    meta.update(adapter_meta)
+    return meta
+
+
+def split_properties(properties, column_meta):
+    """
+        Returns the property names and the column metadata from the
+        adapter properties argument, as a (properties, column_meta) tuple
+    """
+    if column_meta is not None:
+        # Up to 0.4.x behavior: Meta declarations separate
+        # from property list
+        return tuple(properties), column_meta
+    # 0.5 behavior:
+    return ([x if isinstance(x, str) else x[0] for x in properties],
+        [{} if isinstance(x, str) else x[1] for x in properties])
+
+
+def property_object(obj, propertyname):
+    """
+        Follows a dotted property path. Returns the object holding the
+        last property and the last property name. Raises AttributeError
+        if the path is broken.
+    """
+    propertyparts = propertyname.split('.')
+    prop = propertyparts.pop(0)
+    while propertyparts:
+        obj = getattr(obj, prop)
+        prop = propertyparts.pop(0)
+    return obj, prop
+
+
+def property_value(obj, propertyname):
+    """
+        Returns the value of a dotted property path. An empty property
+        name is the object itself.
+    """
+    obj, prop = property_object(obj, propertyname)
+    return getattr(obj, prop) if prop != '' else obj
+
+
+def column_title(column_meta, properties, column):
+    try:
+        return column_meta[column]['title']
+    except (IndexError, KeyError):  # No column meta or no meta key
+        return properties[column].split('.').pop().title().replace('_', ' ')
+
+
+def format_value(column_meta, column, key, value):
+    "Functional, value derived metadata (formatters)"
+    try:
+        f = column_meta[column][key]
+    except (IndexError, KeyError):
+        # No column meta, no metadata key,
+        return unicode(value) if value is not None else u''
+    return f(value)
+
+
+def _apply_meta(m, o):
+    if callable(m):
+        return m(o) if o else None
+    else:
+        return m
+
+
+def column_object_meta(column_meta, column, key, value_object):
+    """
+        Functional, object entity derived, or constant column metadata.
+        Raises KeyError if the column meta has no such key, so row meta
+        can be tried.
+    """
+    try:
+        m = column_meta[column][key]
+    except IndexError:  # No column meta
+        return None
+    return _apply_meta(m, value_object)
+
+
+def row_object_meta(row_meta, key, row_object):
+    "Functional or constant row metadata"
+    try:
+        m = row_meta[key]
+    except KeyError:  # No key in row meta
+        return None
+    return _apply_meta(m, row_object)
+
+
+def constant_meta(column_meta, row_meta, column, key):
+    "Constant metadata"
+    try:
+        return column_meta[column][key]
+    except KeyError:  # No key in the column meta
+        try:
+            return row_meta[key]
+        except KeyError:  # No key in the row meta
+            return None
+    except IndexError:  # No column meta
+        return None
+
+
+def iter_objects(model, chunk_size=1000):
+    """
+        Iterates the model items. Models with a chunks() method, like
+        sqlalchemy.QueryResult, are read chunk by chunk, so they aren't
+        fully retrieved in memory.
+    """
+    try:
+        chunks = model.chunks
+    except AttributeError:
+        return iter(model)
+    return (o for chunk in chunks(chunk_size) for o in chunk)
+
+
+def _csv_value(v):
+    if v is None:
+        return ''
+    if not isinstance(v, basestring):
+        v = unicode(v)
+    if str is bytes and isinstance(v, unicode):
+        # Python 2 csv module doesn't handle unicode
+        v = v.encode('utf-8')
+    return v
+
+
+def write_rows(fileobj, rows, titles, format='csv', roles=('display',)):
+    """
+        Writes rows (as generated by TableProjection.rows()) into fileobj,
+        one at a time.
+        format: 'csv', with a title row, or 'jsonl' (JSON Lines), with an
+                object per row with the titles as keys.
+        roles: the role names the rows have for every column. If there
+               are many, CSV titles include the role, and JSON values are
+               objects with the roles as keys.
+    """
+    roles = tuple(roles)
+    if format == 'csv':
+        import csv
+        writer = csv.writer(fileobj)
+        if len(roles) == 1:
+            writer.writerow([_csv_value(t) for t in titles])
+        else:
+            writer.writerow([_csv_value(u'{0} ({1})'.format(t, r))
+                for t in titles for r in roles])
+        for row in rows:
+            writer.writerow([_csv_value(v) for v in row])
+    elif format == 'jsonl':
+        import json
+        n = len(roles)
+        for row in rows:
+            if n == 1:
+                record = OrderedDict(zip(titles, row))
+            else:
+                record = OrderedDict((t,
+                    OrderedDict(zip(roles, row[i * n:(i + 1) * n])))
+                    for i, t in enumerate(titles))
+            fileobj.write(json.dumps(record, default=unicode) + '\n')
+    else:
+        raise ValueError('Unknown export format ' + repr(format))
+
+
+# Projection used by a formatting worker process, set by _init_worker()
+# when the process starts. Metadata callables usually are lambdas, which
+# can't be pickled, so it's inherited when the process is forked.
+_worker_projection = None
+
+
+def _init_worker(projection):
+    global _worker_projection
+    _worker_projection = projection
+
+
+def _format_chunk(chunk, roles):
+    return [_worker_projection.format_row(row, roles) for row in chunk]
+
+
+class NoneOrdering:
+
+    FIRST = 1
+    LAST = 2
+
+
+def sorted_order(items, keys, none_ordering=NoneOrdering.FIRST):
+    """
+        Returns the positions of the items in sorted order.
+        keys: sequence of (key function, descending) tuples, the most
+              significant first. Each key function is called once per
+              item.
+        none_ordering: whether None keys are less (NoneOrdering.FIRST)
+              or greater (NoneOrdering.LAST) than the others.
+    """
+    return keys_order([([key(item) for item in items], descending)
+        for key, descending in keys], none_ordering)
+
+
+def _numeric_keys(row_keys):
+    """
+        Returns the keys as a NumPy array if all of them are numbers,
+        or None
+    """
+    numpy = _numpy()
+    if numpy is None:
+        return None
+    try:
+        values = numpy.asarray(row_keys)
+    except (TypeError, ValueError):
+        return None
+    if values.ndim != 1 or values.dtype.kind not in 'if':
+        return None
+    return values
+
+
+def keys_order(keys, none_ordering=NoneOrdering.FIRST):
+    """
+        Returns the positions of the rows in sorted order, given their
+        already extracted sort keys. It doesn't touch the row objects, so
+        it can be run outside the GUI thread.
+        keys: sequence of (row keys, descending) tuples, the most
+              significant first, row keys holding one key per row.
+        none_ordering: as in sorted_order().
+        Numeric keys without None are sorted with NumPy, if available.
+    """
+    if not keys:
+        return []
+    none_key = (0 if none_ordering == NoneOrdering.FIRST else 2, None)
+    order = list(range(len(keys[0][0])))
+    # Stable sorts from the least significant key
+    for row_keys, descending in reversed(keys):
+        values = _numeric_keys(row_keys)
+        if values is not None:
+            values = values[order]
+            if descending:
+                values = -values
+            numpy = _numpy()
+            order = numpy.asarray(order)[
+                numpy.argsort(values, kind='mergesort')].tolist()
+            continue
+        decorated = [none_key if k is None else (1, k) for k in row_keys]
+        order.sort(key=decorated.__getitem__, reverse=descending)
+    return order
+
+
+FILTER_OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda key, value: key in value,
+    'not in': lambda key, value: key not in value,
+    'contains': lambda key, value: value in key
+    }
+
+# Operators also meaningful for None keys
+_NONE_OPERATORS = ('==', '!=', 'in', 'not in')
+
+_COMPARISON_OPERATORS = ('==', '!=', '<', '<=', '>', '>=')
+
+
+class KeyCondition(object):
+    """
+        A filter condition over row keys: key <operator> value, operator
+        being one of FILTER_OPERATORS, or a function of the key returning
+        whether it matches. None keys only match ==, !=, in and not in
+        conditions.
+
+        mask() evaluates the condition for a whole column, comparing
+        numeric keys with NumPy, if available.
+    """
+
+    def __init__(self, operator, value=None):
+        if callable(operator):
+            predicate = operator
+            self._function = lambda key, value: predicate(key)
+        else:
+            try:
+                self._function = FILTER_OPERATORS[operator]
+            except KeyError:
+                raise ValueError('Unknown filter operator: {0}'.format(
+                    operator))
+        self.operator = operator
+        self.value = value
+
+    def matches(self, key):
+        if key is None and not callable(self.operator) and \
+                self.operator not in _NONE_OPERATORS:
+            return False
+        return bool(self._function(key, self.value))
+
+    def _numeric_mask(self, keys):
+        values = _numeric_keys(keys)
+        if values is None:
+            return None
+        try:
+            if self.operator in _COMPARISON_OPERATORS:
+                mask = self._function(values, self.value)
+            elif self.operator in ('in', 'not in'):
+                # isin() replaces in1d() since NumPy 1.13
+                numpy = _numpy()
+                isin = getattr(numpy, 'isin', None) or numpy.in1d
+                mask = isin(values, list(self.value),
+                    invert=self.operator == 'not in')
+            else:
+                return None
+        except TypeError:
+            return None
+        if getattr(mask, 'shape', None) != values.shape:
+            # Not compared element wise
+            return None
+        return mask
+
+    def mask(self, keys):
+        """
+            Returns, for every key, whether it matches: a NumPy array of
+            booleans for numeric keys, a list otherwise
+        """
+        if not callable(self.operator):
+            mask = self._numeric_mask(keys)
+            if mask is not None:
+                return mask
+        matches = self.matches
+        return [matches(key) for key in keys]
+
+
+class TableProjection(object):
+    """
+        Projects objects into table rows, using a property list and
+        metadata like the Qonda adapters, but without Qt.
+
+        Roles are named after the metadata keys: 'display', 'edit',
+        'decoration', 'tooltip', 'statustip', 'whatsthis', 'font',
+        'alignment', 'background', 'foreground', plus 'value' for the
+        raw property value.
+
+        Example::
+
+            projection = TableProjection(('name', 'birth_date'), Person)
+            writer.writerow(projection.titles())
+            for row in projection.rows(session.query(Person)):
+                writer.writerow(row)
+    """
+    ROLES = ('display', 'edit', 'decoration', 'tooltip', 'statustip',
+        'whatsthis', 'font', 'alignment', 'background', 'foreground',
+        'value')
+    # Roles computed from the value alone, formatted by the workers
+    FORMAT_ROLES = ('display', 'edit')
+
+    def __init__(self, properties, class_=None, column_meta=None,
+            row_meta=None):
+        self._properties, column_meta = split_properties(properties,
+            column_meta)
+        self._column_meta = _combine_column_metas(class_, column_meta,
+            self._properties)
+        self._row_meta = _combine_row_metas(class_, row_meta)
+
+    @classmethod
+    def fromAdapter(cls, adapter):
+        """
+            Returns a projection with the properties and (already
+            combined) metadata of an adapter
+        """
+        projection = cls.__new__(cls)
+        projection._properties = tuple(adapter.properties())
+        projection._column_meta = adapter._column_meta
+        projection._row_meta = adapter._row_meta
+        return projection
+
+    def properties(self):
+        return self._properties
+
+    def titles(self):
+        return [column_title(self._column_meta, self._properties, column)
+            for column in range(len(self._properties))]
+
+    def value_object(self, obj, column):
+        """
+            Returns the object holding the value of the column
+        """
+        try:
+            return property_object(obj, self._properties[column])[0]
+        except AttributeError:
+            warn("Property " + self._properties[column]
+                + " not found in the object " + str(obj))
+            return None
+
+    def value(self, obj, column):
+        try:
+            return property_value(obj, self._properties[column])
+        except AttributeError:
+            if obj is not None:
+                warn("Property " + self._properties[column]
+                    + " not found in the object " + str(obj))
+            return None
+
+    def cell(self, obj, column, role='display'):
+        """
+            Returns the role value of the column for the object
+        """
+        if role == 'value':
+            return self.value(obj, column)
+        elif role in ('display', 'edit'):
+            return format_value(self._column_meta, column,
+                role + 'Formatter', self.value(obj, column))
+        elif role in ('whatsthis', 'alignment'):
+            return constant_meta(self._column_meta, self._row_meta, column,
+                role)
+        elif role in self.ROLES:
+            try:
+                return column_object_meta(self._column_meta, column, role,
+                    self.value_object(obj, column))
+            except KeyError:  # No key in the column meta
+                return row_object_meta(self._row_meta, role, obj)
+        raise ValueError('Unknown role ' + repr(role))
+
+    def row(self, obj, roles=('display',)):
+        """
+            Returns a list with the roles of every column for the object,
+            column by column.
+        """
+        return [self.cell(obj, column, role)
+            for column in range(len(self._properties)) for role in roles]
+
+    def rows(self, objects, roles=('display',)):
+        """
+            Generator of rows (see row()) for an iterable of objects.
+            Objects are read as they are needed, so the iterable may be a
+            query or other lazy source.
+        """
+        for obj in objects:
+            yield self.row(obj, roles)
+
+    def raw_row(self, obj, roles=('display',)):
+        """
+            Like row(), but with the unformatted values for the
+            FORMAT_ROLES, to be formatted later by format_row()
+        """
+        return [self.value(obj, column) if role in self.FORMAT_ROLES
+            else self.cell(obj, column, role)
+            for column in range(len(self._properties)) for role in roles]
+
+    def format_row(self, row, roles=('display',)):
+        n = len(roles)
+        return [format_value(self._column_meta, i // n,
+            roles[i % n] + 'Formatter', v)
+            if roles[i % n] in self.FORMAT_ROLES else v
+            for i, v in enumerate(row)]
+
+    def parallel_rows(self, objects, roles=('display',), workers=None,
+            chunk_size=1000):
+        """
+            Like rows(), but formatting is done in a pool of worker
+            processes (workers, default: one per CPU), chunk_size rows
+            at a time. Only the values are sent to the workers, which
+            get the projection when they start. Unless the metadata can be
+            pickled, the platform must fork new processes (as Linux does)
+            for them to inherit it. Rows are generated in order, with at
+            most two chunks per worker waiting.
+        """
+        import multiprocessing
+        roles = tuple(roles)
+        workers = workers or multiprocessing.cpu_count()
+        raw_rows = (self.raw_row(obj, roles)
+            for obj in iter_objects(objects, chunk_size))
+        # Each pool has its own projection, so exports can run at once
+        pool = multiprocessing.Pool(workers, initializer=_init_worker,
+            initargs=(self,))
+        pending = deque()
+        try:
+            while True:
+                chunk = list(islice(raw_rows, chunk_size))
+                if chunk:
+                    pending.append(pool.apply_async(_format_chunk,
+                        (chunk, roles)))
+                elif not pending:
+                    break
+                if not chunk or len(pending) >= 2 * workers:
+                    for row in pending.popleft().get():
+                        yield row
+        finally:
+            pool.terminate()
+
+    def export(self, fileobj, objects, format='csv', roles=('display',),
+            workers=0):
+        """
+            Writes the rows of the objects into fileobj, see write_rows().
+            If workers isn't 0, rows are formatted in that many processes
+            (None: one per CPU), see parallel_rows().
+        """
+        if workers == 0:
+            rows = self.rows(iter_objects(objects), roles)
+        else:
+            rows = self.parallel_rows(objects, roles, workers)
+        write_rows(fileobj, rows, self.titles(), format, roles)
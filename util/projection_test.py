@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Qonda framework
+# Qonda is (C)2010,2013 Julio César Gázquez
+#
+# Qonda is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Qonda is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Qonda; If not, see <http://www.gnu.org/licenses/>.
+
+
+import json
+import os
+import subprocess
+import sys
+import unittest
+from StringIO import StringIO
+from qonda.util.projection import (TableProjection, property_value,
+    iter_objects, keys_order, NoneOrdering, KeyCondition)
+
+
+class Address(object):
+
+    _qonda_column_meta_ = {
+        'city': {
+            'title': u'Town',
+            'displayFormatter': lambda v: v.upper()
+            }
+        }
+
+    def __init__(self, city):
+        self.city = city
+
+
+class Person(object):
+
+    _qonda_column_meta_ = {
+        'name': {
+            'tooltip': lambda o: u'Person ' + o.name
+            },
+        'address': Address,
+        '*': {
+            'background': 'white'
+            }
+        }
+
+    def __init__(self, name, age, city):
+        self.name = name
+        self.age = age
+        self.address = Address(city)
+
+
+class TableProjectionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.people = [Person(u'Ann', 30, u'Rome'),
+            Person(u'Bob', 40, u'Oslo')]
+        self.projection = TableProjection(('name',
+            ('age', {'displayFormatter': lambda v: u'{0} years'.format(v),
+                'alignment': 'right'}),
+            'address.city'), Person)
+
+    def loaded_modules(self):
+        """
+            Returns the top level modules loaded by importing the projection
+            module, in a new process, as other tests may load anything
+        """
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        output = subprocess.check_output([sys.executable, '-c',
+            'import sys, qonda.util.projection; '
+            'print(" ".join(set(m.split(".")[0] for m in sys.modules)))'],
+            env=env)
+        return output.decode('ascii').split()
+
+    def test_no_qt(self):
+        self.assertFalse(any(m.startswith('PyQt')
+            for m in self.loaded_modules()))
+
+    def test_lazy_imports(self):
+        loaded = self.loaded_modules()
+        for module in ('csv', 'json', 'multiprocessing', 'numpy'):
+            self.assertFalse(module in loaded, module)
+
+    def test_property_value(self):
+        self.assertEqual(property_value(self.people[0], 'address.city'),
+            u'Rome')
+        self.assertTrue(property_value(self.people[0], '')
+            is self.people[0])
+        self.assertRaises(AttributeError, property_value, self.people[0],
+            'address.street')
+
+    def test_titles(self):
+        self.assertEqual(self.projection.titles(),
+            [u'Name', u'Age', u'Town'])
+
+    def test_rows(self):
+        rows = self.projection.rows(iter(self.people))
+        self.assertEqual(next(rows), [u'Ann', u'30 years', u'ROME'])
+        self.assertEqual(next(rows), [u'Bob', u'40 years', u'OSLO'])
+        self.assertRaises(StopIteration, next, rows)
+
+    def test_roles(self):
+        self.assertEqual(self.projection.row(self.people[1],
+            ('value', 'tooltip', 'alignment', 'background')),
+            [u'Bob', u'Person Bob', None, 'white',
+            40, None, 'right', 'white',
+            u'Oslo', None, None, 'white'])
+        self.assertRaises(ValueError, self.projection.cell, self.people[0],
+            0, 'color')
+
+    def test_export(self):
+        f = StringIO()
+        self.projection.export(f, self.people)
+        self.assertEqual(f.getvalue().splitlines(),
+            ['Name,Age,Town', 'Ann,30 years,ROME', 'Bob,40 years,OSLO'])
+        f = StringIO()
+        self.projection.export(f, self.people, 'jsonl', ('value',))
+        self.assertEqual(json.loads(f.getvalue().splitlines()[1]),
+            {u'Name': u'Bob', u'Age': 40, u'Town': u'Oslo'})
+        self.assertRaises(ValueError, self.projection.export, f,
+            self.people, 'xml')
+
+    def test_parallel_export(self):
+        people = [Person(u'P{0}'.format(i), i, u'c{0}'.format(i))
+            for i in range(0, 50)]
+        rows = list(self.projection.parallel_rows(people,
+            ('display', 'value', 'tooltip'), workers=2, chunk_size=7))
+        self.assertEqual(rows, list(self.projection.rows(people,
+            ('display', 'value', 'tooltip'))))
+        f = StringIO()
+        self.projection.export(f, self.people, workers=2)
+        self.assertEqual(f.getvalue().splitlines()[2], 'Bob,40 years,OSLO')
+
+    def test_concurrent_parallel_exports(self):
+        people = [Person(u'P{0}'.format(i), i, u'c{0}'.format(i))
+            for i in range(0, 20)]
+        other = TableProjection((('name',
+            {'displayFormatter': lambda v: v.lower()}),), Person)
+        rows = self.projection.parallel_rows(people, workers=1, chunk_size=3)
+        other_rows = other.parallel_rows(people, workers=1, chunk_size=3)
+        pairs = list(zip(rows, other_rows))
+        self.assertEqual([row for row, other_row in pairs],
+            list(self.projection.rows(people)))
+        self.assertEqual([other_row for row, other_row in pairs],
+            list(other.rows(people)))
+
+    def test_iter_chunks(self):
+
+        class ChunkedList(list):
+            def chunks(self, size):
+                for i in range(0, len(self), size):
+                    requested.append(size)
+                    yield self[i:i + size]
+
+        requested = []
+        model = ChunkedList(range(0, 5))
+        self.assertEqual(list(iter_objects(model, 2)), [0, 1, 2, 3, 4])
+        self.assertEqual(requested, [2, 2, 2])
+
+
+class KeysOrderTestCase(unittest.TestCase):
+
+    def test_numeric(self):
+        self.assertEqual(keys_order([([3, 1, 2.5, 1], False)]), [1, 3, 2, 0])
+        self.assertEqual(keys_order([([3, 1, 2.5, 1], True)]), [0, 2, 1, 3])
+
+    def test_none(self):
+        keys = [([2, None, 1], False)]
+        self.assertEqual(keys_order(keys), [1, 2, 0])
+        self.assertEqual(keys_order(keys, NoneOrdering.LAST), [2, 0, 1])
+
+    def test_several_keys(self):
+        self.assertEqual(keys_order([([u'b', u'a', u'b', u'a'], False),
+            ([1, 2, 3, 4], True)]), [3, 1, 2, 0])
+        self.assertEqual(keys_order([]), [])
+
+
+class KeyConditionTestCase(unittest.TestCase):
+
+    def test_matches(self):
+        self.assertTrue(KeyCondition('>', 2).matches(3))
+        self.assertFalse(KeyCondition('>', 2).matches(None))
+        self.assertTrue(KeyCondition('==', None).matches(None))
+        self.assertTrue(KeyCondition('not in', (1, 2)).matches(None))
+        self.assertTrue(KeyCondition('contains', u'ell').matches(u'hello'))
+        self.assertTrue(KeyCondition(lambda key: key is None).matches(None))
+        self.assertRaises(ValueError, KeyCondition, 'like', u'a%')
+
+    def test_mask(self):
+        self.assertEqual(list(KeyCondition('<=', 2).mask([1, 2, 3])),
+            [True, True, False])
+        self.assertEqual(list(KeyCondition('in', set([1, 3])).mask(
+            [1, 2, 3])), [True, False, True])
+        self.assertEqual(list(KeyCondition('!=', 2).mask([1, None, 2])),
+            [True, True, False])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Qonda framework
+# Qonda is (C)2010,2013 Julio César Gázquez
+#
+# Qonda is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Qonda is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Qonda; If not, see <http://www.gnu.org/licenses/>.
+
+"""
+    Full text quick search over the display strings of a flat model, to
+    filter big lists as the user types without formatting every cell on
+    each keystroke.
+"""
+
+import re
+
+from .. import PYQT_VERSION
+if PYQT_VERSION == 5:
+    from PyQt5.QtCore import Qt
+else:
+    from PyQt4.QtCore import Qt
+
+_word_re = re.compile(r'\w+', re.UNICODE)
+
+
+def words(text):
+    """
+        Splits a text into lowercase words
+    """
+    return _word_re.findall(text.lower())
+
+
+def trigrams(word):
+    return set(word[i:i + 3] for i in range(len(word) - 2))
+
+
+class QuickSearchIndex(object):
+    """
+        Inverted index of the words shown in some columns of a table or
+        list model, with a trigram index for substring search.
+
+        Each row is formatted once through the model data() and gets a key.
+        The index keeps, for each word and for each trigram, the set of keys
+        of the rows containing it, so a query is answered intersecting those
+        sets. A query matches the rows where every query word appears as
+        part of a shown word, in any of the indexed columns.
+
+        A SortFilterProxyModel given the index with setQuickSearchIndex()
+        keeps it updated from the source model signals, reindexing only the
+        changed, inserted and removed rows.
+    """
+
+    def __init__(self, model, columns=None):
+        self._model = model
+        self._columns = columns
+        self._terms = []
+        self.reset()
+
+    def model(self):
+        return self._model
+
+    def columns(self):
+        if self._columns is None:
+            return range(self._model.columnCount())
+        return self._columns
+
+    def reset(self):
+        """
+            Indexes the whole model again
+        """
+        self._next_key = 0
+        self._matching = set() if self._terms else None
+        self._row_keys = []
+        self._texts = {}
+        self._words = {}
+        self._trigrams = {}
+        self.rowsInserted(0, self._model.rowCount() - 1)
+
+    def _row_text(self, row):
+        model = self._model
+        texts = []
+        for column in self.columns():
+            value = model.data(model.index(row, column), Qt.DisplayRole)
+            if value is not None:
+                texts.append(unicode(value).lower())
+        return u'\n'.join(texts)
+
+    def _add(self, key, text):
+        self._texts[key] = text
+        for word in set(words(text)):
+            self._words.setdefault(word, set()).add(key)
+            for trigram in trigrams(word):
+                self._trigrams.setdefault(trigram, set()).add(key)
+        if self._matching is not None and self._matches_text(text):
+            self._matching.add(key)
+
+    def _remove(self, key):
+        text = self._texts.pop(key)
+        for word in set(words(text)):
+            self._discard(self._words, word, key)
+            for trigram in trigrams(word):
+                self._discard(self._trigrams, trigram, key)
+        if self._matching is not None:
+            self._matching.discard(key)
+
+    @staticmethod
+    def _discard(postings, token, key):
+        keys = postings[token]
+        keys.discard(key)
+        if not keys:
+            del postings[token]
+
+    def rowsChanged(self, first, last):
+        for row in range(first, min(last + 1, len(self._row_keys))):
+            key = self._row_keys[row]
+            text = self._row_text(row)
+            if text != self._texts[key]:
+                self._remove(key)
+                self._add(key, text)
+
+    def rowsInserted(self, first, last):
+        keys = range(self._next_key, self._next_key + last - first + 1)
+        self._next_key += len(keys)
+        self._row_keys[first:first] = keys
+        for row, key in enumerate(keys, first):
+            self._add(key, self._row_text(row))
+
+    def rowsRemoved(self, first, last):
+        for key in self._row_keys[first:last + 1]:
+            self._remove(key)
+        del self._row_keys[first:last + 1]
+
+    def rowsReordered(self, order):
+        """
+            Follows a reorder of the model rows, where row order[i] became
+            row i, without indexing them again
+        """
+        row_keys = self._row_keys
+        self._row_keys = [row_keys[i] for i in order] + row_keys[len(order):]
+
+    def _term_keys(self, term):
+        if len(term) < 3:
+            # Few distinct words, scanning them is cheap
+            keys = set()
+            for word, word_keys in self._words.items():
+                if term in word:
+                    keys |= word_keys
+            return keys
+        postings = []
+        for trigram in trigrams(term):
+            trigram_keys = self._trigrams.get(trigram)
+            if trigram_keys is None:
+                return set()
+            postings.append(trigram_keys)
+        postings.sort(key=len)
+        keys = postings[0].intersection(*postings[1:])
+        # Trigrams may come from different words, or be out of order
+        texts = self._texts
+        return set(key for key in keys if term in texts[key])
+
+    def _search_keys(self, terms):
+        result = None
+        # Longer terms usually have fewer matches
+        for term in sorted(set(terms), key=len, reverse=True):
+            keys = self._term_keys(term)
+            result = keys if result is None else result & keys
+            if not result:
+                break
+        return result
+
+    def _matches_text(self, text):
+        return all(term in text for term in self._terms)
+
+    def search(self, text):
+        """
+            Returns the rows matching the query text
+        """
+        keys = self._search_keys(words(text))
+        if keys is None:
+            return list(range(len(self._row_keys)))
+        return [row for row, key in enumerate(self._row_keys) if key in keys]
+
+    def setQuery(self, text):
+        """
+            Sets the query used by rowMatches(). Rows changed afterwards
+            are matched as they get indexed.
+        """
+        self._terms = words(text)
+        self._matching = self._search_keys(self._terms)
+
+    def query(self):
+        return u' '.join(self._terms)
+
+    def rowMatches(self, row):
+        if self._matching is None:
+            return True
+        try:
+            return self._row_keys[row] in self._matching
+        except IndexError:
+            return self._matches_text(self._row_text(row))
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Qonda framework
+# Qonda is (C)2010,2013 Julio César Gázquez
+#
+# Qonda is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Qonda is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Qonda; If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import unittest
+from PyQt4.QtCore import QModelIndex
+from qonda.mvc.observable import ObservableObject, ObservableListProxy
+from qonda.mvc.adapters import ObjectListAdapter
+from qonda.util.quicksearch import QuickSearchIndex, words
+from qonda.util.sortfilter import SortFilterProxyModel
+
+
+class Contact(ObservableObject):
+
+    _notifiables_ = ('name', 'city', 'phone')
+
+    def __init__(self, name, city, phone):
+        super(Contact, self).__init__()
+        self.name = name
+        self.city = city
+        self.phone = phone
+
+
+class QuickSearchIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.model = ObservableListProxy([
+            Contact(u'John Smith', u'Rosario', u'555-1234'),
+            Contact(u'Jane Smithers', u'Santa Fe', u'555-9876'),
+            Contact(u'Bob Jones', u'Rosario', u'555-4321')])
+        self.adapter = ObjectListAdapter(('name', 'city', 'phone'),
+            self.model, Contact)
+        self.index = QuickSearchIndex(self.adapter, (0, 1))
+
+    def test_words(self):
+        self.assertEqual(words(u'Élan, vital-2'), [u'élan', u'vital', u'2'])
+
+    def test_search(self):
+        self.assertEqual(self.index.search(u'smith'), [0, 1])
+        self.assertEqual(self.index.search(u'SMITH ros'), [0])
+        self.assertEqual(self.index.search(u'jo'), [0, 2])
+        self.assertEqual(self.index.search(u'mithe'), [1])
+        self.assertEqual(self.index.search(u'hsmi'), [])
+        self.assertEqual(self.index.search(u''), [0, 1, 2])
+        # Phone column is not indexed
+        self.assertEqual(self.index.search(u'1234'), [])
+
+    def test_updates(self):
+        self.index.setQuery(u'rosario')
+        self.assertEqual([self.index.rowMatches(row) for row in range(3)],
+            [True, False, True])
+        self.index.rowsInserted(1, 1)
+        self.index.rowsRemoved(1, 1)
+        self.model[1].city = u'Rosario'
+        self.index.rowsChanged(1, 1)
+        self.assertEqual(self.index.search(u'rosario'), [0, 1, 2])
+        self.assertTrue(self.index.rowMatches(1))
+        self.model.insert(0, Contact(u'Ann Rosa', u'Paraná', u''))
+        self.index.rowsInserted(0, 0)
+        del self.model[1]
+        self.index.rowsRemoved(1, 1)
+        self.assertEqual(self.index.search(u'rosa'), [0, 1, 2])
+        self.assertEqual(self.index.search(u'paraná'), [0])
+        self.assertEqual(self.index.search(u'john'), [])
+
+    def test_proxy(self):
+        proxy = SortFilterProxyModel()
+        proxy.setSourceModel(self.adapter)
+        proxy.setQuickSearchIndex(self.index)
+        proxy.setQuickSearch(u'smi')
+        accepts = lambda: [proxy.filterAcceptsRow(row, QModelIndex())
+            for row in range(self.adapter.rowCount())]
+        self.assertEqual(accepts(), [True, True, False])
+        self.model[2].name = u'Bob Smith'
+        self.model.append(Contact(u'Ed Smit', u'Rosario', u''))
+        del self.model[0]
+        self.assertEqual(accepts(), [True, True, True])
+        self.assertEqual(self.index.search(u'john'), [])
+        proxy.setQuickSearch(u'')
+        self.assertEqual(accepts(), [True, True, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
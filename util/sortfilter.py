@@ -1,17 +1,77 @@
 # -*- coding: utf-8 -*-
+import bisect
+from functools import partial
+from operator import itemgetter
+import threading
+
 from .. import PYQT_VERSION
 
 if PYQT_VERSION == 5:
-    from PyQt5.QtCore import QSortFilterProxyModel
+    from PyQt5.QtCore import (Qt, QSortFilterProxyModel, QAbstractTableModel,
+        QAbstractListModel, QTimer, pyqtSignal)
 else:
+    from PyQt4.QtCore import (Qt, QAbstractTableModel, QAbstractListModel,
+        QTimer, pyqtSignal)
     from PyQt4.QtGui import QSortFilterProxyModel
 from ..mvc.adapters import PythonObjectRole
+from .projection import NoneOrdering, keys_order, KeyCondition, _numpy
+
+# Sort key not read yet
+_UNKNOWN = object()
+
+# Filter acceptance bitmap states
+_UNTESTED = 0
+_REJECTED = 1
+_ACCEPTED = 2
+
+
+def _ordering_key(key, none_ordering):
+    """Returns key made comparable with None, as keys_order() does"""
+    if key is None:
+        return (0 if none_ordering == NoneOrdering.FIRST else 2, None)
+    return (1, key)
+
+
+def _key_ranks(keys, order, none_ordering):
+    """
+        Returns the rank of every row, given their keys and their ascending
+        order, and the key of every rank (see _ordering_key()). Rows with
+        equal keys share the rank, so a stable sort by rank keeps them in
+        place in both directions.
+    """
+    ranks = [0] * len(order)
+    rank_keys = []
+    rank = -1
+    previous = _UNKNOWN
+    for row in order:
+        key = keys[row]
+        if previous is _UNKNOWN or key != previous:
+            rank += 1
+            previous = key
+            rank_keys.append(_ordering_key(key, none_ordering))
+        ranks[row] = rank
+    return ranks, rank_keys
 
 
-class NoneOrdering:
+class _BackgroundJob(object):
+    """
+        A sort or filter by the keys of a column. Keys are read in the GUI
+        thread, and processed in a worker thread.
+    """
 
-    FIRST = 1
-    LAST = 2
+    def __init__(self, kind, column, criteria, read_keys, row_count):
+        self.kind = kind
+        # Sorts rearranging the source list
+        self.in_place = False
+        self.column = column
+        # Sort order or filter predicate
+        self.criteria = criteria
+        self.read_keys = read_keys
+        self.row_count = row_count
+        self.keys = []
+        # Rows changed after their keys were read
+        self.dirty = set()
+        self.cancelled = False
 
 
 class SortFilterProxyModel(QSortFilterProxyModel):
@@ -19,14 +79,62 @@ class SortFilterProxyModel(QSortFilterProxyModel):
         A minimal extension to QSortFilterProxyModel implementing
         Qonda's adapters API, notably getPyObject(), required by
         currentPyObject() methods in DataWidgetMapper and *View widgets
+
+        For flat source models (table and list adapters), sort keys are
+        cached per source row and column, and filter results are kept in
+        a per row acceptance bitmap. Both are updated from the source model
+        signals only for the rows involved, so when a row changes, Qt's
+        dynamic sort repositions it with a binary search over cached keys,
+        and the filter is evaluated again only for that row.
+
+        Subclasses can filter on the row objects by overriding
+        filterAcceptsPyObject(). A QuickSearchIndex over the source model,
+        set with setQuickSearchIndex(), filters rows by the words they show
+        with setQuickSearch(). setFilters() filters rows by conditions on
+        their column values, evaluated for whole columns at once.
+
+        sortInBackground() and filterInBackground() keep the GUI responsive
+        with very large lists: column keys are read in chunks between
+        events, and the sort order or the filter results are computed in a
+        worker thread (using NumPy for numeric sort keys, if available).
+        The proxy sorts by the row ranks found by the worker, comparing
+        just numbers; rows changed meanwhile are ranked again by their
+        current keys. If the source adapter has 'sortmodel' in its options,
+        the sort is applied rearranging the source adapter list instead,
+        with a single layoutChanged, so the proxy itself is left unsorted.
+        With backgroundSorting set, sort() (called by views when a header
+        is clicked) works this way. Starting a job cancels the previous one
+        of the same kind, and source rows being inserted or removed restart
+        it.
     """
+    BACKGROUND_CHUNK_SIZE = 10000
+
+    # Emitted with 'sort' or 'filter' after applying a background job
+    backgroundJobFinished = pyqtSignal(str)
+    # Worker thread results, queued to the GUI thread
+    _backgroundJobDone = pyqtSignal(object, object)
 
     def __init__(self, parent=None, none_ordering=NoneOrdering.FIRST):
         super(SortFilterProxyModel, self).__init__(parent)
         self._none_ordering = none_ordering
+        self._flat = False
+        self._sort_keys = {}
+        self._acceptance = None
+        self._quick_search = None
+        self._jobs = {}
+        self._background_sorting = False
+        self._key_filters = []
+        self._background_filter = None
+        self._key_mask = None
+        # (column, rank of every source row) of the last background sort
+        self._sort_ranks = None
+        self._applying_order = None
+        self._backgroundJobDone.connect(self._apply_job)
+        self._filters_objects = (type(self).filterAcceptsPyObject !=
+            SortFilterProxyModel.filterAcceptsPyObject)
 
     def getPyModel(self):
-        return self.sourceModel.getPyModel()
+        return self.sourceModel().getPyModel()
 
     def getPyObject(self, index):
         return self.sourceModel().getPyObject(self.mapToSource(index))
@@ -40,12 +148,502 @@ class SortFilterProxyModel(QSortFilterProxyModel):
     def properties(self):
         return self.sourceModel().properties()
 
+    def setQuickSearchIndex(self, index):
+        """
+            Filters rows with a QuickSearchIndex built over the source
+            model, which the proxy keeps updated. None removes it.
+        """
+        self._quick_search = index
+        self.invalidateFilter()
+
+    def quickSearchIndex(self):
+        return self._quick_search
+
+    def setQuickSearch(self, text):
+        """
+            Shows only the rows with all the words in text, as parts of the
+            words shown in the quick search index columns
+        """
+        self._quick_search.setQuery(text)
+        self.invalidateFilter()
+
+    def setSourceModel(self, model):
+        self.cancelBackgroundJobs()
+        self._key_filters = []
+        self._background_filter = None
+        old_model = self.sourceModel()
+        if old_model is not None:
+            self._disconnect_source(old_model)
+        self._flat = isinstance(model, (QAbstractTableModel,
+            QAbstractListModel))
+        self._clear_caches()
+        # Connected before QSortFilterProxyModel does, so caches are
+        # updated before the proxy compares or filters the changed rows
+        if model is not None:
+            self._connect_source(model)
+        QSortFilterProxyModel.setSourceModel(self, model)
+
+    def _connect_source(self, model):
+        model.dataChanged.connect(self._source_data_changed)
+        model.rowsInserted.connect(self._source_rows_inserted)
+        model.rowsRemoved.connect(self._source_rows_removed)
+        model.rowsMoved.connect(self._source_reset)
+        model.layoutChanged.connect(self._source_reset)
+        model.modelReset.connect(self._source_reset)
+
+    def _disconnect_source(self, model):
+        model.dataChanged.disconnect(self._source_data_changed)
+        model.rowsInserted.disconnect(self._source_rows_inserted)
+        model.rowsRemoved.disconnect(self._source_rows_removed)
+        model.rowsMoved.disconnect(self._source_reset)
+        model.layoutChanged.disconnect(self._source_reset)
+        model.modelReset.disconnect(self._source_reset)
+
+    def _clear_caches(self):
+        self._sort_keys = {}
+        self._sort_ranks = None
+        self._acceptance = None
+        self._key_mask = None
+
+    def _reorder_caches(self, order):
+        """
+            Moves the cached row data after a source reorder, where source
+            row order[i] became row i
+        """
+        def reordered(mask):
+            return bytearray(mask[i] for i in order) + mask[len(order):]
+
+        for column, keys in self._sort_keys.items():
+            self._sort_keys[column] = ([keys[i] for i in order] +
+                keys[len(order):])
+        if self._acceptance is not None:
+            self._acceptance = reordered(self._acceptance)
+        if self._key_mask is not None:
+            self._key_mask = reordered(self._key_mask)
+        if self._quick_search is not None:
+            self._quick_search.rowsReordered(order)
+
+    def _source_data_changed(self, top_left, bottom_right, *args):
+        self._sort_ranks = None
+        first = top_left.row()
+        last = bottom_right.row() + 1
+        for column in range(top_left.column(), bottom_right.column() + 1):
+            keys = self._sort_keys.get(column)
+            if keys is not None:
+                keys[first:last] = [_UNKNOWN] * len(keys[first:last])
+        for mask in (self._acceptance, self._key_mask):
+            if mask is not None:
+                mask[first:last] = bytearray(len(mask[first:last]))
+        for job in self._jobs.values():
+            job.dirty.update(range(first, last))
+        quick_search = self._quick_search
+        if quick_search is not None and top_left.isValid() and \
+                not top_left.parent().isValid():
+            columns = quick_search.columns()
+            if any(column in columns for column in
+                    range(top_left.column(), bottom_right.column() + 1)):
+                quick_search.rowsChanged(first, last - 1)
+
+    def _source_rows_inserted(self, parent, first, last):
+        if parent.isValid():
+            return
+        self._sort_ranks = None
+        count = last - first + 1
+        for keys in self._sort_keys.values():
+            keys[first:first] = [_UNKNOWN] * count
+        for mask in (self._acceptance, self._key_mask):
+            if mask is not None:
+                mask[first:first] = bytearray(count)
+        if self._quick_search is not None:
+            self._quick_search.rowsInserted(first, last)
+        self._restart_jobs()
+
+    def _source_rows_removed(self, parent, first, last):
+        if parent.isValid():
+            return
+        self._sort_ranks = None
+        for keys in self._sort_keys.values():
+            del keys[first:last + 1]
+        for mask in (self._acceptance, self._key_mask):
+            if mask is not None:
+                del mask[first:last + 1]
+        if self._quick_search is not None:
+            self._quick_search.rowsRemoved(first, last)
+        self._restart_jobs()
+
+    def _source_reset(self, *args):
+        if self._applying_order is not None:
+            # Our own background sort, cached data is just moved
+            self._reorder_caches(self._applying_order)
+            self._applying_order = None
+            self._restart_jobs()
+            return
+        self._clear_caches()
+        if self._quick_search is not None:
+            self._quick_search.reset()
+        self._restart_jobs()
+
+    def invalidate(self):
+        self._clear_caches()
+        QSortFilterProxyModel.invalidate(self)
+
+    def invalidateFilter(self):
+        self._acceptance = None
+        QSortFilterProxyModel.invalidateFilter(self)
+
+    def setFilterRegExp(self, *args):
+        self._acceptance = None
+        QSortFilterProxyModel.setFilterRegExp(self, *args)
+
+    if hasattr(QSortFilterProxyModel, 'setFilterRegularExpression'):
+        def setFilterRegularExpression(self, *args):
+            self._acceptance = None
+            QSortFilterProxyModel.setFilterRegularExpression(self, *args)
+
+    def setFilterFixedString(self, pattern):
+        self._acceptance = None
+        QSortFilterProxyModel.setFilterFixedString(self, pattern)
+
+    def setFilterWildcard(self, pattern):
+        self._acceptance = None
+        QSortFilterProxyModel.setFilterWildcard(self, pattern)
+
+    def setFilterKeyColumn(self, column):
+        self._acceptance = None
+        QSortFilterProxyModel.setFilterKeyColumn(self, column)
+
+    def setFilterCaseSensitivity(self, sensitivity):
+        self._acceptance = None
+        QSortFilterProxyModel.setFilterCaseSensitivity(self, sensitivity)
+
+    def setFilterRole(self, role):
+        self._acceptance = None
+        QSortFilterProxyModel.setFilterRole(self, role)
+
+    def setBackgroundSorting(self, value):
+        self._background_sorting = value
+
+    def backgroundSorting(self):
+        return self._background_sorting
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if self._background_sorting and column >= 0:
+            self.sortInBackground(column, order)
+        else:
+            QSortFilterProxyModel.sort(self, column, order)
+
+    def sortInBackground(self, column, order=Qt.AscendingOrder):
+        """
+            Sorts by a column, computing the order in a worker thread.
+            Tree models are sorted by the proxy right away.
+        """
+        if not self._flat:
+            QSortFilterProxyModel.sort(self, column, order)
+            return
+        self._start_job('sort', column, order)
+
+    def _sorts_source(self):
+        """Returns whether background sorts rearrange the source list"""
+        source = self.sourceModel()
+        return (hasattr(source, 'applyOrder') and
+            'sortmodel' in getattr(source, 'options', ()))
+
+    def filterInBackground(self, column, predicate):
+        """
+            Shows only the rows whose key (the Python value) in column
+            satisfies predicate, a function run in a worker thread for
+            every row. Rows changed later are tested in the GUI thread.
+            A None predicate removes the filter.
+        """
+        if predicate is None or not self._flat:
+            self._cancel_job('filter')
+            self._background_filter = (None if predicate is None
+                else (column, KeyCondition(predicate)))
+            self._key_mask = None
+            self.invalidateFilter()
+            return
+        self._start_job('filter', column, KeyCondition(predicate))
+
+    def setFilters(self, filters):
+        """
+            Shows only the rows satisfying all the filters, given as
+            (property, operator, value) tuples, where property is a source
+            property name or column number, and operator is one of ==, !=,
+            <, <=, >, >=, in, not in and contains, or a function of the
+            value returning whether the row is shown:
+
+                proxy.setFilters([('amount', '>', 100),
+                    ('status', 'in', {'open', 'late'})])
+
+            Column values are read once, and the filters are evaluated
+            for whole columns at once (with NumPy for numbers, if
+            available). Changed rows are evaluated again one by one.
+        """
+        source = self.sourceModel()
+        self._key_filters = [(prop if isinstance(prop, int)
+            else source.getPropertyColumn(prop),
+            KeyCondition(operator, value))
+            for prop, operator, value in filters]
+        self._key_mask = None
+        self.invalidateFilter()
+
+    def filters(self):
+        return [(column, condition.operator, condition.value)
+            for column, condition in self._key_filters]
+
+    def cancelBackgroundJobs(self):
+        for kind in list(self._jobs):
+            self._cancel_job(kind)
+
+    def backgroundJobsRunning(self):
+        return bool(self._jobs)
+
+    def _cancel_job(self, kind):
+        job = self._jobs.pop(kind, None)
+        if job is not None:
+            job.cancelled = True
+
+    def _key_reader(self, column):
+        """
+            Returns a function reading the sort keys of a range of
+            source rows
+        """
+        source = self.sourceModel()
+        # Qonda list adapters read keys from the items without formatting
+        sort_key = getattr(source, '_sort_key', None)
+        items = source.getPyModel() if sort_key is not None else None
+        if items is not None:
+            key = sort_key(column)
+            return lambda start, stop: [key(item)
+                for item in items[start:stop]]
+        return lambda start, stop: [
+            source.index(row, column).data(PythonObjectRole)
+            for row in range(start, stop)]
+
+    def _start_job(self, kind, column, criteria):
+        self._cancel_job(kind)
+        source = self.sourceModel()
+        in_place = kind == 'sort' and self._sorts_source()
+        if in_place:
+            # The whole list gets reordered, fetched or not
+            row_count = len(source.getPyModel())
+        else:
+            row_count = source.rowCount()
+        job = _BackgroundJob(kind, column, criteria,
+            self._key_reader(column), row_count)
+        job.in_place = in_place
+        self._jobs[kind] = job
+        QTimer.singleShot(0, partial(self._read_job_keys, job))
+
+    def _restart_jobs(self):
+        # Rows read so far may have moved
+        for job in list(self._jobs.values()):
+            self._start_job(job.kind, job.column, job.criteria)
+
+    def _read_job_keys(self, job):
+        if job.cancelled:
+            return
+        start = len(job.keys)
+        stop = min(start + self.BACKGROUND_CHUNK_SIZE, job.row_count)
+        keys = job.read_keys(start, stop)
+        # Rows without item, like the append placeholder
+        keys.extend([None] * (stop - start - len(keys)))
+        job.keys.extend(keys)
+        if stop < job.row_count:
+            QTimer.singleShot(0, partial(self._read_job_keys, job))
+            return
+        worker = threading.Thread(target=self._run_job, args=(job,))
+        worker.daemon = True
+        worker.start()
+
+    def _run_job(self, job):
+        """
+            Computes the job result. Runs in a worker thread, so it only
+            uses the keys.
+        """
+        if job.kind == 'sort' and job.in_place:
+            result = keys_order([(job.keys,
+                job.criteria == Qt.DescendingOrder)], self._none_ordering)
+        elif job.kind == 'sort':
+            # The proxy applies the sort direction
+            result = _key_ranks(job.keys,
+                keys_order([(job.keys, False)], self._none_ordering),
+                self._none_ordering)
+        else:
+            result = job.criteria.mask(job.keys)
+        if not job.cancelled:
+            self._backgroundJobDone.emit(job, result)
+
+    def _apply_job(self, job, result):
+        if job.cancelled or self._jobs.get(job.kind) is not job:
+            return
+        del self._jobs[job.kind]
+        if job.kind == 'sort' and job.in_place:
+            # The proxy keeps the source order, so it doesn't sort again
+            if self.sortColumn() != -1:
+                QSortFilterProxyModel.sort(self, -1, job.criteria)
+            self._applying_order = result
+            self.sourceModel().applyOrder(result)
+            self._applying_order = None
+        elif job.kind == 'sort':
+            ranks, rank_keys = result
+            if job.dirty:
+                self._rerank_rows(job, ranks, rank_keys)
+            self._sort_ranks = (job.column, ranks)
+            QSortFilterProxyModel.sort(self, job.column, job.criteria)
+        else:
+            self._background_filter = (job.column, job.criteria)
+            mask = self._build_key_mask({job.criteria: result})
+            for row in job.dirty:
+                if row < len(mask):
+                    mask[row] = _UNTESTED
+            self._key_mask = mask
+            self.invalidateFilter()
+        self.backgroundJobFinished.emit(job.kind)
+
+    def _rerank_rows(self, job, ranks, rank_keys):
+        """
+            Ranks the rows changed while the job ran by their current keys,
+            among the keys of the job ranks. Keys between two ranks get
+            fractional ranks.
+        """
+        gaps = {}
+        for row in job.dirty:
+            if row >= len(ranks):
+                continue
+            keys = job.read_keys(row, row + 1)
+            key = _ordering_key(keys[0] if keys else None,
+                self._none_ordering)
+            position = bisect.bisect_left(rank_keys, key)
+            if position < len(rank_keys) and rank_keys[position] == key:
+                ranks[row] = position
+            else:
+                gaps.setdefault(position, []).append((key, row))
+        for position, rows in gaps.items():
+            rows.sort(key=itemgetter(0))
+            step = 1.0 / (len(rows) + 1)
+            rank = position - 1
+            previous = _UNKNOWN
+            for key, row in rows:
+                if previous is _UNKNOWN or key != previous:
+                    rank += step
+                    previous = key
+                ranks[row] = rank
+
+    def _key_conditions(self):
+        if self._background_filter is None:
+            return self._key_filters
+        return self._key_filters + [self._background_filter]
+
+    def _column_keys(self, column):
+        """
+            Returns the keys of all the source rows in column, reading the
+            ones not cached at once
+        """
+        row_count = self.sourceModel().rowCount()
+        keys = self._sort_keys.get(column)
+        if keys is None or len(keys) != row_count:
+            keys = self._key_reader(column)(0, row_count)
+            # Rows without item, like the append placeholder
+            keys.extend([None] * (row_count - len(keys)))
+            self._sort_keys[column] = keys
+            return keys
+        read_key = self._key_reader(column)
+        for row, key in enumerate(keys):
+            if key is _UNKNOWN:
+                keys[row] = read_key(row, row + 1)[0]
+        return keys
+
+    def _build_key_mask(self, results=None):
+        """
+            Returns the acceptance bitmap of the key filters for all the
+            source rows, evaluating each condition for a whole column.
+            results: condition masks already known
+        """
+        results = results or {}
+        numpy = _numpy()
+        mask = None
+        for column, condition in self._key_conditions():
+            column_mask = results.get(condition)
+            if column_mask is None:
+                column_mask = condition.mask(self._column_keys(column))
+            if mask is None:
+                mask = column_mask
+            elif numpy is not None:
+                mask = numpy.logical_and(mask, column_mask)
+            else:
+                mask = [a and b for a, b in zip(mask, column_mask)]
+        row_count = self.sourceModel().rowCount()
+        if mask is None:
+            return bytearray([_ACCEPTED]) * row_count
+        if numpy is not None:
+            states = bytearray(numpy.where(mask, _ACCEPTED,
+                _REJECTED).astype(numpy.uint8).tobytes())
+        else:
+            states = bytearray(_ACCEPTED if accepted else _REJECTED
+                for accepted in mask)
+        # Rows inserted meanwhile
+        return states + bytearray(max(0, row_count - len(states)))
+
+    def _row_matches(self, source_row, conditions):
+        model = self.sourceModel()
+        return all(condition.matches(self._sort_key(
+            model.index(source_row, column)))
+            for column, condition in conditions)
+
+    def _key_accepts(self, source_row):
+        conditions = self._key_conditions()
+        if not self._flat:
+            return self._row_matches(source_row, conditions)
+        mask = self._key_mask
+        if mask is None:
+            mask = self._key_mask = self._build_key_mask()
+        try:
+            state = mask[source_row]
+        except IndexError:
+            # Row not notified yet
+            return self._row_matches(source_row, conditions)
+        if state == _UNTESTED:
+            accepted = self._row_matches(source_row, conditions)
+            mask[source_row] = _ACCEPTED if accepted else _REJECTED
+            return accepted
+        return state == _ACCEPTED
+
+    def _sort_key(self, index):
+        """
+            Returns the sort key of a source index, reading it from the
+            source model only the first time
+        """
+        if not self._flat:
+            return index.data(PythonObjectRole)
+        column = index.column()
+        keys = self._sort_keys.get(column)
+        if keys is None:
+            keys = self._sort_keys[column] = (
+                [_UNKNOWN] * self.sourceModel().rowCount())
+        row = index.row()
+        try:
+            key = keys[row]
+        except IndexError:
+            # Row not notified yet
+            return index.data(PythonObjectRole)
+        if key is _UNKNOWN:
+            key = keys[row] = index.data(PythonObjectRole)
+        return key
+
     def lessThan(self, left, right):
         """
             Sort using Python ordering
         """
-        left_data = left.data(PythonObjectRole)
-        right_data = right.data(PythonObjectRole)
+        ranks = self._sort_ranks
+        if ranks is not None and left.column() == ranks[0]:
+            try:
+                return ranks[1][left.row()] < ranks[1][right.row()]
+            except IndexError:
+                # Row not notified yet
+                pass
+        left_data = self._sort_key(left)
+        right_data = self._sort_key(right)
         if left_data is None:
             # None is less if NoneOrdering == FIRST
             return self._none_ordering == NoneOrdering.FIRST
@@ -53,3 +651,45 @@ class SortFilterProxyModel(QSortFilterProxyModel):
             # None is less if NoneOrdering == FIRST
             return self._none_ordering == NoneOrdering.LAST
         return left_data < right_data
+
+    def filterAcceptsPyObject(self, obj):
+        """
+            Override to filter rows by their Python object. Results are
+            cached until the row changes or the filter is invalidated.
+        """
+        return True
+
+    def _accepts_row(self, source_row, source_parent):
+        if self._quick_search is not None and \
+                not source_parent.isValid() and \
+                not self._quick_search.rowMatches(source_row):
+            return False
+        if (self._key_filters or self._background_filter is not None) and \
+                not source_parent.isValid() and \
+                not self._key_accepts(source_row):
+            return False
+        if not QSortFilterProxyModel.filterAcceptsRow(self, source_row,
+                source_parent):
+            return False
+        if not self._filters_objects:
+            return True
+        model = self.sourceModel()
+        return self.filterAcceptsPyObject(model.getPyObject(
+            model.index(source_row, 0, source_parent)))
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self._flat or source_parent.isValid():
+            return self._accepts_row(source_row, source_parent)
+        if self._acceptance is None:
+            self._acceptance = bytearray(self.sourceModel().rowCount())
+        try:
+            state = self._acceptance[source_row]
+        except IndexError:
+            # Row not notified yet
+            return self._accepts_row(source_row, source_parent)
+        if state == _UNTESTED:
+            accepted = self._accepts_row(source_row, source_parent)
+            self._acceptance[source_row] = (_ACCEPTED if accepted
+                else _REJECTED)
+            return accepted
+        return state == _ACCEPTED
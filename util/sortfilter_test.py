@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the Qonda framework
+# Qonda is (C)2010,2013 Julio César Gázquez
+#
+# Qonda is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# any later version.
+#
+# Qonda is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Qonda; If not, see <http://www.gnu.org/licenses/>.
+
+
+
+import threading
+import time
+import unittest
+from functools import cmp_to_key
+from PyQt4.QtCore import Qt, QModelIndex
+from qonda.mvc.observable import ObservableObject, ObservableListProxy
+from qonda.mvc.adapters import ObjectListAdapter
+from qonda.util import sortfilter as sortfilter_module
+from qonda.util.sortfilter import SortFilterProxyModel
+
+
+class Item(ObservableObject):
+
+    _notifiables_ = ('name', 'size')
+
+    def __init__(self, name, size):
+        super(Item, self).__init__()
+        self.name = name
+        self.size = size
+
+
+class CountingAdapter(ObjectListAdapter):
+
+    def __init__(self, *args, **kwargs):
+        ObjectListAdapter.__init__(self, *args, **kwargs)
+        self.reads = 0
+
+    def data(self, index, role):
+        self.reads += 1
+        return ObjectListAdapter.data(self, index, role)
+
+
+class BigItemsProxy(SortFilterProxyModel):
+
+    def __init__(self, parent=None):
+        SortFilterProxyModel.__init__(self, parent)
+        self.tested = []
+
+    def filterAcceptsPyObject(self, obj):
+        self.tested.append(obj.name)
+        return obj.size > 2
+
+
+class SortFilterProxyModelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.model = ObservableListProxy([Item(name, size) for name, size in
+            ((u'a', 3), (u'b', 1), (u'c', 2), (u'd', 5))])
+        self.adapter = CountingAdapter(('name', 'size'), self.model, Item)
+
+    def test_sort_key_cache(self):
+        proxy = SortFilterProxyModel()
+        proxy.setSourceModel(self.adapter)
+        index = self.adapter.index
+        self.assertFalse(proxy.lessThan(index(0, 1), index(1, 1)))
+        self.assertTrue(proxy.lessThan(index(1, 1), index(2, 1)))
+        reads = self.adapter.reads
+        self.assertEqual(reads, 3)
+        self.assertTrue(proxy.lessThan(index(2, 1), index(0, 1)))
+        self.assertEqual(self.adapter.reads, reads)
+        # Only the changed row is read again
+        self.model[2].size = 4
+        self.assertFalse(proxy.lessThan(index(2, 1), index(0, 1)))
+        self.assertEqual(self.adapter.reads, reads + 1)
+
+    def test_sort_key_cache_rows(self):
+        proxy = SortFilterProxyModel()
+        proxy.setSourceModel(self.adapter)
+        index = self.adapter.index
+        proxy.lessThan(index(0, 1), index(3, 1))
+        self.model.insert(0, Item(u'e', 4))
+        self.assertTrue(proxy.lessThan(index(0, 1), index(4, 1)))
+        self.assertFalse(proxy.lessThan(index(0, 1), index(1, 1)))
+        del self.model[0:2]
+        reads = self.adapter.reads
+        self.assertTrue(proxy.lessThan(index(0, 1), index(2, 1)))
+        self.assertEqual(self.adapter.reads, reads + 1)
+
+    def test_acceptance_bitmap(self):
+        proxy = BigItemsProxy()
+        proxy.setSourceModel(self.adapter)
+        accepted = [proxy.filterAcceptsRow(row, QModelIndex())
+            for row in range(4)]
+        self.assertEqual(accepted, [True, False, False, True])
+        self.assertEqual(proxy.tested, [u'a', u'b', u'c', u'd'])
+        proxy.tested = []
+        self.model[2].size = 3
+        self.model.insert(1, Item(u'e', 0))
+        accepted = [proxy.filterAcceptsRow(row, QModelIndex())
+            for row in range(5)]
+        self.assertEqual(accepted, [True, False, False, True, True])
+        self.assertEqual(proxy.tested, [u'e', u'c'])
+        proxy.tested = []
+        proxy.invalidateFilter()
+        proxy.filterAcceptsRow(0, QModelIndex())
+        self.assertEqual(proxy.tested, [u'a'])
+
+
+class FiltersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.model = ObservableListProxy([Item(name, size) for name, size in
+            ((u'apple', 3), (u'banana', 1), (u'cherry', None), (u'date', 5))])
+        self.adapter = CountingAdapter(('name', 'size'), self.model, Item)
+        self.proxy = SortFilterProxyModel()
+        self.proxy.setSourceModel(self.adapter)
+
+    def accepted(self):
+        return [self.proxy.filterAcceptsRow(row, QModelIndex())
+            for row in range(self.adapter.rowCount())]
+
+    def test_filters(self):
+        self.proxy.setFilters([('size', '>', 2)])
+        self.assertEqual(self.accepted(), [True, False, False, True])
+        # Keys are read from the items, not formatted
+        self.assertEqual(self.adapter.reads, 0)
+        self.proxy.setFilters([('size', '<=', 3), ('name', 'contains', u'an')])
+        self.assertEqual(self.accepted(), [False, True, False, False])
+        self.proxy.setFilters([(1, 'in', set([1, 5, None]))])
+        self.assertEqual(self.accepted(), [False, True, True, True])
+        self.assertEqual(self.proxy.filters(), [(1, 'in', set([1, 5, None]))])
+        self.proxy.setFilters([])
+        self.assertEqual(self.accepted(), [True] * 4)
+        self.assertRaises(ValueError, self.proxy.setFilters,
+            [('size', '~', 2)])
+
+    def test_updates(self):
+        self.proxy.setFilters([('size', '>=', 3)])
+        self.assertEqual(self.accepted(), [True, False, False, True])
+        self.model[1].size = 4
+        self.model.insert(0, Item(u'fig', 6))
+        del self.model[4]
+        self.assertEqual(self.accepted(), [True, True, True, False])
+        # Only the changed and inserted rows are read
+        self.assertEqual(self.adapter.reads, 2)
+
+    def test_predicate(self):
+        self.proxy.setFilters([('name', lambda name: len(name) == 6, None),
+            ('size', '!=', None)])
+        self.assertEqual(self.accepted(), [False, True, False, False])
+
+
+class BackgroundSortFilterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.model = ObservableListProxy([Item(name, size) for name, size in
+            ((u'a', 3), (u'b', 1), (u'c', None), (u'd', 5), (u'e', 2))])
+        self.adapter = ObjectListAdapter(('name', 'size'), self.model, Item,
+            options=set(['sortmodel']))
+        self.proxy = SortFilterProxyModel()
+        self.proxy.BACKGROUND_CHUNK_SIZE = 2
+        self.proxy.setSourceModel(self.adapter)
+        self.finished = []
+        self.proxy.backgroundJobFinished.connect(self.finished.append)
+
+    def wait(self):
+        for i in range(500):
+            if not self.proxy.backgroundJobsRunning():
+                return
+            time.sleep(0.01)
+        self.fail('Background job not finished')
+
+    def accepted(self):
+        return [self.proxy.filterAcceptsRow(row, QModelIndex())
+            for row in range(self.adapter.rowCount())]
+
+    def sorted_rows(self, column):
+        """Returns the source rows in the order given by lessThan()"""
+        index = self.adapter.index
+        less = self.proxy.lessThan
+        return sorted(range(0, self.adapter.rowCount()), key=cmp_to_key(
+            lambda l, r: -1 if less(index(l, column), index(r, column)) else
+            1 if less(index(r, column), index(l, column)) else 0))
+
+    def test_sort(self):
+        self.proxy.setBackgroundSorting(True)
+        self.proxy.sort(1, Qt.DescendingOrder)
+        self.wait()
+        self.assertEqual([o.name for o in self.model],
+            [u'd', u'a', u'e', u'b', u'c'])
+        self.assertEqual(self.finished, ['sort'])
+
+    def test_sort_view(self):
+        self.adapter.options.discard('sortmodel')
+        self.model.append(Item(u'f', 3))
+        self.proxy.sortInBackground(1)
+        self.wait()
+        self.assertEqual([o.name for o in self.model],
+            [u'a', u'b', u'c', u'd', u'e', u'f'])
+        self.assertEqual(self.proxy._sort_ranks, (1, [3, 1, 0, 4, 2, 3]))
+        self.assertEqual(self.sorted_rows(1), [2, 1, 4, 0, 5, 3])
+        self.model[0].size = 4
+        self.assertEqual(self.proxy._sort_ranks, None)
+
+    def test_sort_view_changes(self):
+        self.adapter.options.discard('sortmodel')
+        release = threading.Event()
+        keys_order = sortfilter_module.keys_order
+
+        def blocking_order(*args):
+            release.wait()
+            return keys_order(*args)
+        sortfilter_module.keys_order = blocking_order
+        try:
+            self.proxy.sortInBackground(1)
+            # Changed after their keys were read
+            self.model[4].size = 4
+            self.model[2].size = 3
+            self.model[1].name = u'f'
+            release.set()
+            self.wait()
+        finally:
+            sortfilter_module.keys_order = keys_order
+        self.assertEqual(self.proxy._sort_ranks, (1, [3, 1, 3, 4, 3.5]))
+        self.assertEqual(self.sorted_rows(1), [1, 0, 2, 4, 3])
+
+    def test_filter(self):
+        self.proxy.filterInBackground(1,
+            lambda size: size is not None and size > 2)
+        self.wait()
+        self.assertEqual(self.accepted(), [True, False, False, True, False])
+        self.model[4].size = 7
+        self.assertEqual(self.accepted(), [True, False, False, True, True])
+        self.proxy.sortInBackground(0, Qt.DescendingOrder)
+        self.wait()
+        self.assertEqual([o.name for o in self.model],
+            [u'e', u'd', u'c', u'b', u'a'])
+        # Filter results follow the rows
+        self.assertEqual(self.accepted(), [True, True, False, False, True])
+        self.proxy.filterInBackground(1, None)
+        self.assertEqual(self.accepted(), [True] * 5)
+
+    def test_cancel(self):
+        release = threading.Event()
+
+        def blocking(size):
+            release.wait()
+            return True
+        self.proxy.filterInBackground(1, blocking)
+        self.proxy.filterInBackground(1,
+            lambda size: size is None or size < 3)
+        release.set()
+        self.wait()
+        time.sleep(0.05)
+        self.assertEqual(self.finished, ['filter'])
+        self.assertEqual(self.accepted(), [False, True, True, False, True])
+
+
+if __name__ == '__main__':
+    unittest.main()
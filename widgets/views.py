@@ -19,12 +19,14 @@
 from .. import PYQT_VERSION
 if PYQT_VERSION == 5:
     from PyQt5.QtCore import Qt, pyqtSignal, pyqtProperty, QItemSelectionModel
-    from PyQt5.QtWidgets import QMessageBox, QTableView, QTreeView, QListView
+    from PyQt5.QtGui import QKeySequence
+    from PyQt5.QtWidgets import (QMessageBox, QTableView, QTreeView, QListView,
+        QApplication)
 else:
     #lint:disable
     from PyQt4.QtCore import Qt, pyqtSignal, pyqtProperty
     from PyQt4.QtGui import QMessageBox, QTableView, QTreeView, QListView, \
-                            QItemSelectionModel
+                            QItemSelectionModel, QKeySequence, QApplication
     #lint:enable
 
 QondaResizeRole = 64
@@ -41,6 +43,10 @@ class EditableView(object):
     # TODO: Add attribute confirmDeletion
     def _keyPressEvent(self, event):
         # TODO: Implement confirmDeletion
+        if event.matches(QKeySequence.Paste):
+            if self.paste():
+                event.accept()
+            return
         key = event.key()
         mod = event.modifiers()
         idx = self.currentIndex()
@@ -125,6 +131,45 @@ class EditableView(object):
                     self.model().removeRow(current_row, parent)
                     event.accept()
 
+    def paste(self):
+        """
+            Pastes the clipboard text, as tab separated columns and one
+            line per row (as spreadsheets copy it), starting at the current
+            index. Rows are appended if needed and allowAppends is set.
+            Cells not editable, and append placeholder rows, are skipped.
+            Models with setDataBlock() get the whole block at once.
+        """
+        idx = self.currentIndex()
+        text = QApplication.clipboard().text()
+        if not idx.isValid() or not text:
+            return False
+        model = self.model()
+        parent = idx.parent()
+        values = [line.split('\t') for line in
+            text.replace('\r\n', '\n').rstrip('\n').split('\n')]
+        row_count = model.rowCount(parent)
+        is_placeholder = getattr(model, 'isPlaceholder', None)
+        if is_placeholder is not None and row_count and \
+                is_placeholder(model.index(row_count - 1, 0, parent)):
+            # New rows go before the placeholder row
+            row_count -= 1
+        missing = idx.row() + len(values) - row_count
+        if missing > 0 and self.__allowAppends:
+            model.insertRows(row_count, missing, parent)
+        set_data_block = getattr(model, 'setDataBlock', None)
+        if set_data_block is not None:
+            return set_data_block(idx, values)
+        # Not a Qonda adapter
+        ok = True
+        for row, row_values in enumerate(values, idx.row()):
+            for column, value in enumerate(row_values, idx.column()):
+                index = model.index(row, column, parent)
+                if not model.flags(index) & Qt.ItemIsEditable:
+                    ok = False
+                    continue
+                ok = model.setData(index, value, Qt.EditRole) and ok
+        return ok
+
     def getAllowAppends(self):
         return self.__allowAppends
 